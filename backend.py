@@ -1,120 +1,3066 @@
+import csv
 import json
 import uuid
 import time
 import os
+import re
+import bisect
+import hashlib
+import sqlite3
+import heapq
+import itertools
+import mmap
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict, deque, namedtuple
+import concurrent.futures
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+import instrumentation
+
+# Optional, RecallModel works on whole decks at once with it and card by card without
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Marks the header line of a JSON Lines deck file
+DECK_FORMAT = "memokado-jsonl"
+DECK_FORMAT_VERSION = 2
+
+# Scheduler parameters fitted by fit_scheduler.py, kept next to a user's decks
+SCHEDULER_FILE = "scheduler.json"
+
+# Number of cards built and added at a time by bulk imports
+IMPORT_BATCH_SIZE = 1000
+
+# Names Anki uses in the "#separator:" line of its text exports
+TEXT_SEPARATORS = {"tab": "\t", "comma": ",", "semicolon": ";", "pipe": "|", "space": " "}
+
+@contextmanager
+def atomic_open(filename, binary=False):
+    '''
+    Opens a temporary file for writing that replaces {filename} when closed
+    Readers see either the old file or the complete new one, never a partial
+    write, and the old file is kept if writing fails
+    '''
+
+    tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with (open(tmp_filename, "wb") if binary else open(tmp_filename, "w", encoding="utf-8")) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
 
 class Flashcard:
+    __slots__ = ("id", "front", "back", "last_score", "due", "interval", "history")
+
     def __init__(self, front, back, card_id=None, created_at=None):
         self.id = card_id or str(uuid.uuid4()) 
         self.front = front
         self.back = back 
         self.last_score = 0
 
-class Deck:
-    def __init__(self, name):
-        self.name = name
-        self.score = 0
+        # Spaced repetition state, new cards are due straight away
+        self.due = created_at if created_at is not None else time.time()
+        self.interval = 0
+
+        # RatingHistory of the card's latest ratings, None until it is rated
+        self.history = None
+
+class RatingHistory:
+    '''
+    The latest ratings of a card and when they were made, oldest first
+
+    Ratings and times live in two typed arrays used as a ring buffer of
+    SIZE entries, so a card's history costs the same after 10 reviews as
+    after 10,000. Once full, each rating overwrites the oldest one.
+    '''
+
+    __slots__ = ("_ratings", "_times", "_start", "_count")
+
+    SIZE = 8
+    _NO_RATINGS = array("b", bytes(SIZE))
+    _NO_TIMES = array("d", bytes(SIZE * 8))
+
+    # A rating counts half as much as one made this long after it
+    HALF_LIFE = 7 * 24 * 60 * 60
+
+    def __init__(self, entries=()):
+        # Copying a full array is cheaper than building one
+        self._ratings = self._NO_RATINGS[:]
+        self._times = self._NO_TIMES[:]
+        self._start = 0
+        self._count = 0
+        for at, rating in entries:
+            self.add(rating, at)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        '''
+        Yields (time, rating) pairs, oldest first
+        '''
+
+        for i in range(self._count):
+            slot = (self._start + i) % self.SIZE
+            yield self._times[slot], self._ratings[slot]
+
+    def copy(self):
+        history = RatingHistory.__new__(RatingHistory)
+        history._ratings = self._ratings[:]
+        history._times = self._times[:]
+        history._start = self._start
+        history._count = self._count
+        return history
+
+    def latest(self):
+        '''
+        Returns the (time, rating) of the latest rating, or None
+        '''
+
+        if not self._count:
+            return None
+        slot = (self._start + self._count - 1) % self.SIZE
+        return self._times[slot], self._ratings[slot]
+
+    def add(self, rating, at):
+        if self._count < self.SIZE:
+            slot = (self._start + self._count) % self.SIZE
+            self._count += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.SIZE
+        self._ratings[slot] = rating
+        self._times[slot] = at
+
+    def priority(self):
+        '''
+        Returns the mean of the ratings, each weighted down by how long before
+        the latest one it was made, or None without ratings
+        Several fails are not outweighed by one good rating after them
+        '''
+
+        count, start, size = self._count, self._start, self.SIZE
+        if count <= 1:
+            return float(self._ratings[start]) if count else None
+        ratings, times = self._ratings, self._times
+        latest = times[(start + count - 1) % size]
+        total = weights = 0.0
+        for i in range(count):
+            slot = (start + i) % size
+            weight = 0.5 ** ((latest - times[slot]) / self.HALF_LIFE)
+            total += weight * ratings[slot]
+            weights += weight
+        return total / weights
+
+    def to_list(self):
+        return [[at, rating] for at, rating in self]
+
+    def to_bytes(self):
+        '''
+        Packs the history as its times then its ratings, oldest first
+        '''
+
+        entries = list(self)
+        return (array("d", [at for at, _ in entries]).tobytes() +
+                array("b", [rating for _, rating in entries]).tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        count = len(data) // 9
+        times = array("d", data[:count * 8])
+        ratings = array("b", data[count * 8:])
+        return cls(zip(times, ratings))
+
+def record_rating(card, rating, at):
+    '''
+    Adds a rating to the history of {card}, creating the history if needed
+    The history is copied rather than changed, so a thread saving the card
+    sees either the old history or the new one, never one in between
+    '''
+
+    history = RatingHistory() if card.history is None else card.history.copy()
+    history.add(rating, at)
+    # Setting it back also stores it for CardViews
+    card.history = history
+
+def card_priority(card):
+    '''
+    Returns the value decks sort {card} by, lowest first
+    It is the decayed mean of the card's rating history, or its last score
+    for cards that were never rated. Rounded to two decimals so cards fall
+    into at most a couple of hundred groups
+    '''
+
+    history = card.history
+    priority = history.priority() if history is not None else None
+    if priority is None:
+        return card.last_score
+    return round(priority, 2)
+
+class Scheduler:
+    '''
+    Keeps the cards of a deck in a min-heap keyed on their due time
+
+    Entries are invalidated lazily: rescheduling or removing a card
+    leaves its old entry in the heap and it is skipped when popped
+    '''
+
+    # Interval in seconds after the first rating of a card
+    # - Again = 10 minutes
+    # - Okay = 1 day
+    # - Good = 3 days
+    INITIAL_INTERVALS = {0: 10 * 60, 1: 24 * 60 * 60, 2: 3 * 24 * 60 * 60}
+
+    # How much the previous interval grows by for each rating
+    INTERVAL_GROWTH = {0: 0.0, 1: 1.2, 2: 2.5}
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, card: Flashcard):
+        seq = next(self._counter)
+        self._entries[card.id] = (seq, card)
+        heapq.heappush(self._heap, (card.due, seq, card.id))
+
+        # Rebuilds the heap once stale entries outnumber live ones
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def discard(self, card_id):
+        self._entries.pop(card_id, None)
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+
+    def _compact(self):
+        self._heap = [(card.due, seq, card_id)
+                      for card_id, (seq, card) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _prune(self):
+        # Drops stale entries from the top of the heap
+        while self._heap:
+            due, seq, card_id = self._heap[0]
+            entry = self._entries.get(card_id)
+            if entry is not None and entry[0] == seq:
+                return entry[1]
+            heapq.heappop(self._heap)
+        return None
+
+    def peek(self):
+        '''
+        Returns the card with the earliest due time without removing it
+        '''
+
+        return self._prune()
+
+    def next_due(self, now=None):
+        '''
+        Returns the next card that is due at {now}, or None
+        '''
+
+        now = time.time() if now is None else now
+        card = self._prune()
+        if card is None or card.due > now:
+            return None
+        return card
+
+    def due_cards(self, now=None, limit=None):
+        '''
+        Returns the cards due at {now} ordered by due time
+        Costs O(k log n) for k due cards, the rest of the deck is untouched
+        '''
+
+        now = time.time() if now is None else now
+        due = []
+        while limit is None or len(due) < limit:
+            card = self._prune()
+            if card is None or card.due > now:
+                break
+            heapq.heappop(self._heap)
+            due.append(card)
+
+        for card in due:
+            seq = self._entries[card.id][0]
+            heapq.heappush(self._heap, (card.due, seq, card.id))
+        return due
+
+    @classmethod
+    def update_interval(cls, card: Flashcard, rating, now=None, parameters=None):
+        '''
+        Works out the next interval and due time for a rated card
+        {parameters} are the (initial intervals, interval growth) of the card's
+        deck from parameters_for, or None for the defaults
+        '''
+
+        now = time.time() if now is None else now
+        initial, growth = parameters or (cls.INITIAL_INTERVALS, cls.INTERVAL_GROWTH)
+        if rating <= 0:
+            card.interval = initial[0]
+        else:
+            card.interval = max(initial[rating], card.interval * growth[rating])
+        card.due = now + card.interval
+
+    @classmethod
+    def load_parameters(cls, filename):
+        '''
+        Returns the (initial intervals, interval growth) fitted to a user's
+        reviews by fit_scheduler.py, or None if {filename} does not have them
+        '''
+
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                parameters = json.load(f)
+            initial = {int(rating): float(interval) for rating, interval in parameters["initial_intervals"].items()}
+            growth = {int(rating): float(factor) for rating, factor in parameters["interval_growth"].items()}
+        except (OSError, ValueError, KeyError, AttributeError, TypeError):
+            return None
+        if set(initial) != set(cls.INITIAL_INTERVALS) or set(growth) != set(cls.INTERVAL_GROWTH):
+            return None
+        return initial, growth
+
+    @classmethod
+    def parameters_for(cls, filename):
+        '''
+        Returns the parameters fitted for the decks in the directory of
+        {filename}, or None if there are none and the defaults are used
+        '''
+
+        return cls.load_parameters(os.path.join(os.path.dirname(os.path.abspath(filename)), SCHEDULER_FILE))
+
+    def reschedule(self, card: Flashcard, rating, now=None, parameters=None):
+        '''
+        Works out the next interval for a rated card and queues it again
+        '''
+
+        self.update_interval(card, rating, now, parameters)
+
+        if card.id in self._entries:
+            self.add(card)
+
+class RecallModel:
+    '''
+    Forgetting-curve estimate of how likely each card is to be recalled
+
+    The scheduler's interval is how long the card's review history says it
+    can be remembered: recall is TARGET when the card falls due and decays
+    exponentially, as TARGET ** (time since last review / interval).
+    Cards never rated have no memory to recall yet and score 0.
+
+    Everything works on whole columns of due times and intervals. With
+    NumPy the columns are used as arrays, typed array and memoryview
+    columns without copying them. Without it each card is scored in Python.
+    '''
+
+    TARGET = 0.9
+
+    @classmethod
+    def card_recall(cls, card, now):
+        if card.interval <= 0:
+            return 0.0
+        return cls.TARGET ** max(0.0, 1.0 + (now - card.due) / card.interval)
+
+    @classmethod
+    def recall(cls, due, interval, now):
+        '''
+        Returns the predicted recall of every card at {now}, as a NumPy array
+        when NumPy is installed and as an array of doubles otherwise
+        '''
+
+        if np is None:
+            return array("d", (cls.TARGET ** max(0.0, 1.0 + (now - d) / i) if i > 0 else 0.0
+                               for d, i in zip(due, interval)))
+
+        due, interval = cls._as_numpy(due), cls._as_numpy(interval)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exponent = np.maximum(1.0 + (now - due) / interval, 0.0)
+            return np.where(interval > 0, np.power(cls.TARGET, exponent), 0.0)
+
+    @staticmethod
+    def _as_numpy(column):
+        if isinstance(column, (array, memoryview)):
+            return np.frombuffer(column, dtype=np.float64)
+        return np.asarray(column, dtype=np.float64)
+
+    @classmethod
+    def order(cls, due, interval, now, limit=None, due_only=False):
+        '''
+        Returns the indexes of the cards, lowest predicted recall first
+        Ties keep their order in the columns. With {due_only}, only cards
+        due at {now} are included
+        '''
+
+        recall = cls.recall(due, interval, now)
+        if np is None:
+            rows = range(len(recall))
+            if due_only:
+                rows = (row for row in rows if due[row] <= now)
+            key = recall.__getitem__
+            return sorted(rows, key=key) if limit is None else heapq.nsmallest(limit, rows, key=key)
+
+        rows = np.arange(len(recall))
+        if due_only:
+            rows = rows[cls._as_numpy(due) <= now]
+        values = recall[rows]
+        if limit is not None and limit < len(rows):
+            if limit <= 0:
+                return []
+            # Only the smallest {limit} need sorting. The cards tied with the
+            # last one kept are taken in column order, a new deck is all ties
+            cutoff = np.partition(values, limit - 1)[limit - 1]
+            below = np.flatnonzero(values < cutoff)
+            tied = np.flatnonzero(values == cutoff)[:limit - len(below)]
+            keep = np.concatenate((below, tied))
+            rows, values = rows[keep], values[keep]
+        return rows[np.lexsort((rows, values))].tolist()
+
+class StudySession:
+    '''
+    Runs one study session over the cards of a deck that are due
+
+    Cards are pulled from the deck a few at a time in due order, so starting
+    a session reads nothing and each rating only touches the rated card.
+    With {by_recall} they come lowest predicted recall first instead, and
+    the deck is scored once, when the first card is asked for.
+    The session keeps its own tally, so nothing is recounted at the end.
+    It works with any deck that has due_cards and rate_card, and needs no Tk:
+
+        session = StudySession(deck)
+        for card in session:
+            session.rate(2)
+    '''
+
+    # Number of due cards fetched from the deck at a time
+    BATCH_SIZE = 16
+
+    def __init__(self, deck, now=None, limit=None, autosave=False, by_recall=False):
+        self.deck = deck
+        self.limit = limit
+        self.by_recall = by_recall
+
+        # Saves every rating to the deck file as soon as it is made
+        self.autosave = autosave
+
+        # Cards due at the start of the session are studied, cards rated
+        # "Again" during it come back in a later session
+        self.now = time.time() if now is None else now
+        self._fixed_now = now is not None
+
+        self._buffer = deque()
+        self._current = None
+        self._finished = False
+
+        # deck -> its due cards in recall order, worked out on first use
+        self._recall_orders = {}
+
+        self.reviewed = 0
+        self.ratings = {0: 0, 1: 0, 2: 0}
+
+        # Decks with at least one card rated in this session
+        self.studied_decks = []
+
+    def __iter__(self):
+        '''
+        Yields the card to study next, each one has to be rated before the next
+        '''
+
+        while True:
+            card = self.current_card
+            if card is None:
+                return
+            yield card
+            if self._current is card:
+                raise RuntimeError("Rate each card before asking for the next one")
+
+    @property
+    def current_card(self):
+        '''
+        Returns the card being studied, or None once the session is over
+        '''
+
+        if self._current is None and not self._finished:
+            self._current = self._next_card()
+            self._finished = self._current is None
+        return self._current
+
+    @property
+    def current_deck(self):
+        '''
+        Returns the deck the current card belongs to
+        '''
+
+        return self.deck
+
+    @property
+    def finished(self):
+        return self.current_card is None
+
+    def _next_card(self):
+        if self.limit is not None and self.reviewed >= self.limit:
+            return None
+        if not self._buffer:
+            batch = self.BATCH_SIZE
+            if self.limit is not None:
+                batch = min(batch, self.limit - self.reviewed)
+            self._buffer.extend(self._due_cards(self.deck, batch))
+        return self._buffer.popleft() if self._buffer else None
+
+    def _due_cards(self, deck, limit):
+        if not self.by_recall:
+            return deck.due_cards(self.now, limit)
+
+        # Scoring the deck for every batch would touch every card each time
+        order = self._recall_orders.get(deck)
+        if order is None:
+            order = self._recall_orders[deck] = deque(deck.by_recall(self.now, self.limit, due_only=True))
+        batch = []
+        while order and len(batch) < limit:
+            card = order.popleft()
+            # Skips cards rated since the order was worked out, e.g. in another session
+            if card.due <= self.now:
+                batch.append(card)
+        return batch
+
+    def _order_key(self, card):
+        return RecallModel.card_recall(card, self.now) if self.by_recall else card.due
+
+    def rate(self, rating):
+        '''
+        Rates the current card and returns the next one, or None at the end
+        '''
+
+        card = self.current_card
+        if card is None:
+            raise RuntimeError("The study session has no more cards")
+        deck = self.current_deck
+
+        # The deck's score is the score of its last session
+        if not any(studied is deck for studied in self.studied_decks):
+            self.studied_decks.append(deck)
+            deck.score = 0
+
+        deck.rate_card(card, rating, self.now if self._fixed_now else None)
+        self.reviewed += 1
+        self.ratings[rating] = self.ratings.get(rating, 0) + 1
+        self._current = None
+
+        if self.autosave and deck.filename:
+            deck.save_changes()
+        return self.current_card
+
+    @property
+    def score(self):
+        return sum(rating * count for rating, count in self.ratings.items())
+
+    def max_score(self):
+        '''
+        Returns the highest score possible for the cards reviewed so far
+        '''
+
+        return self.reviewed * 2
+
+class GlobalStudySession(StudySession):
+    '''
+    A study session over the due cards of several decks at once
+
+    Each deck already hands out its due cards in order, so the decks
+    are merged lazily with a heap holding the next card of every deck.
+    Starting only asks each deck for its first few due cards, so it costs
+    the same whatever the decks' sizes. Each rating goes to the deck that
+    owns the card, and only that deck's score is reset and updated.
+    '''
+
+    def __init__(self, decks, now=None, limit=None, autosave=False, by_recall=False):
+        super().__init__(None, now, limit, autosave, by_recall)
+        self.decks = [deck for deck in decks if len(deck)]
+
+        # Due cards fetched from each deck and not handed out yet
+        self._buffers = [deque() for _ in self.decks]
+
+        # (due time of the deck's next card, deck index) for every deck with a buffered card
+        self._heap = []
+
+        # Index of the deck the current card came from
+        self._owner = None
+
+        for i in range(len(self.decks)):
+            self._fill(i)
+
+    def _fill(self, i):
+        buffer = self._buffers[i]
+        if not buffer:
+            # Cards handed out before have been rated, so they are no longer due
+            buffer.extend(self._due_cards(self.decks[i], self.BATCH_SIZE))
+        if buffer:
+            heapq.heappush(self._heap, (self._order_key(buffer[0]), i))
+
+    def add_deck(self, deck):
+        '''
+        Adds {deck} to the merge once the session has started, for a deck
+        whose cards were read after it. Its due cards come in order with
+        the others from the next card on
+        '''
+
+        if not len(deck) or any(other is deck for other in self.decks):
+            return
+        self.decks.append(deck)
+        self._buffers.append(deque())
+        self._fill(len(self.decks) - 1)
+
+        # A session that had run out of cards goes on with the new deck
+        if self._current is None:
+            self._finished = False
+
+    @property
+    def current_deck(self):
+        return self.decks[self._owner] if self.current_card is not None else None
+
+    def _next_card(self):
+        # The deck of the card just rated goes back into the merge
+        if self._owner is not None:
+            self._fill(self._owner)
+            self._owner = None
+
+        if self.limit is not None and self.reviewed >= self.limit:
+            return None
+        if not self._heap:
+            return None
+        _, self._owner = heapq.heappop(self._heap)
+        return self._buffers[self._owner].popleft()
+
+class ReviewJournal:
+    '''
+    Append-only log of the changes made to a deck since its last snapshot
+    Each line is one small JSON record: a card add, remove or rating,
+    or the deck's name, score and card count at the time of the save
+    '''
+
+    # Journal size in bytes after which it is folded into a new snapshot
+    COMPACT_THRESHOLD = 1024 * 1024
+
+    def __init__(self, snapshot_filename):
+        self.filename = snapshot_filename + ".journal"
+
+    def append(self, records):
+        if not records:
+            return
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def size(self):
+        try:
+            return os.path.getsize(self.filename)
+        except OSError:
+            return 0
+
+    def replay(self, deck):
+        '''
+        Applies every record in the journal to {deck} in order
+        Returns False if it stopped at a partly written line from an
+        interrupted save. Records appended after that line would never be
+        replayed, so the deck must then be saved as a full snapshot
+        '''
+
+        for record in self._read():
+            if record is None:
+                return False
+            deck._apply_record(record)
+        return True
+
+    def records(self):
+        '''
+        Yields the records of the journal in order, reading one line at a time
+        '''
+
+        for record in self._read():
+            if record is None:
+                return
+            yield record
+
+    def _read(self):
+        # Yields None for a line that is not a whole record, and stops there
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    return
+                yield record
+
+    def last_meta(self):
+        '''
+        Returns the last "meta" record without reading the whole journal
+        Every save ends with one, so it is found near the end of the file
+        '''
+
+        try:
+            f = open(self.filename, "rb")
+        except OSError:
+            return None
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            chunk = 4096
+            while True:
+                start = max(0, end - chunk)
+                f.seek(start)
+                lines = f.read(end - start).split(b"\n")
+                # The first line is cut off unless the start of the file was reached
+                for line in reversed(lines if start == 0 else lines[1:]):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("op") == "meta":
+                        return record
+                if start == 0:
+                    return None
+                chunk *= 4
+
+    def clear(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+class SearchIndex:
+    '''
+    Inverted index from lowercase word tokens to the ids of the cards
+    whose front or back contains them
+
+    A query is a list of terms that must all match. A term is a word,
+    a prefix ending in "*", or a "quoted phrase". Phrases are found by
+    their words and then checked against the card text
+    '''
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+    QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+    def __init__(self):
+        # token -> dict of card id -> None, kept in the order cards were added
+        self._postings = {}
+
+        # Sorted tokens for prefix queries, rebuilt lazily when a token is added or dropped
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self._postings)
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_PATTERN.findall(text.lower())
+
+    def _card_tokens(self, card):
+        return set(self.tokenize(card.front)) | set(self.tokenize(card.back))
+
+    def add(self, card: Flashcard):
+        for token in self._card_tokens(card):
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = {}
+                self._vocabulary = None
+            ids[card.id] = None
+
+    def add_cards(self, cards):
+        for card in cards:
+            self.add(card)
+
+    def remove(self, card: Flashcard):
+        for token in self._card_tokens(card):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.pop(card.id, None)
+            if not ids:
+                del self._postings[token]
+                self._vocabulary = None
+
+    def _prefix_postings(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        postings = []
+        for i in range(bisect.bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            token = self._vocabulary[i]
+            if not token.startswith(prefix):
+                break
+            postings.append(self._postings[token])
+        return postings
+
+    @staticmethod
+    def _contains_phrase(tokens, phrase):
+        size = len(phrase)
+        return any(tokens[i:i + size] == phrase for i in range(len(tokens) - size + 1))
+
+    def search(self, query, get_card, limit=None):
+        '''
+        Returns the cards matching {query}, looking them up with {get_card}
+        '''
+
+        # Each term is a list of posting lists, a card matches it if it is
+        # in any of them. Only prefix terms have more than one
+        terms = []
+        phrases = []
+        for phrase, term in self.QUERY_PATTERN.findall(query):
+            if phrase:
+                tokens = self.tokenize(phrase)
+                if len(tokens) > 1:
+                    phrases.append(tokens)
+                terms.extend([self._postings.get(token, {})] for token in tokens)
+            elif term.endswith("*"):
+                terms.extend(self._prefix_postings(token) for token in self.tokenize(term[:-1]))
+            else:
+                terms.extend([self._postings.get(token, {})] for token in self.tokenize(term))
+
+        if not terms:
+            return []
+
+        # Walks the shortest term and checks the others by lookup
+        terms.sort(key=lambda postings: sum(map(len, postings)))
+        if len(terms[0]) == 1:
+            candidates = terms[0][0]
+        else:
+            candidates = dict.fromkeys(itertools.chain.from_iterable(terms[0]))
+        results = []
+        for card_id in candidates:
+            if not all(any(card_id in ids for ids in postings) for postings in terms[1:]):
+                continue
+            card = get_card(card_id)
+            if card is None:
+                continue
+            if phrases:
+                front, back = self.tokenize(card.front), self.tokenize(card.back)
+                if not all(self._contains_phrase(front, phrase) or self._contains_phrase(back, phrase)
+                           for phrase in phrases):
+                    continue
+            results.append(card)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    '''
+    The index is saved next to a deck snapshot and is only loaded back
+    while that snapshot is unchanged. Journal records replayed after it
+    is loaded keep it up to date like any other change
+    '''
+    @staticmethod
+    def index_filename(snapshot_filename):
+        return snapshot_filename + ".index"
+
+    def save(self, snapshot_filename):
+        self.save_postings(snapshot_filename, self.copy_postings())
+
+    def copy_postings(self):
+        '''
+        Returns a copy of the postings for save_postings, which can write it
+        while the index keeps changing
+        '''
+
+        return {token: list(ids) for token, ids in self._postings.items()}
+
+    @classmethod
+    def save_postings(cls, snapshot_filename, postings):
+        data = {
+            "snapshot_mtime": os.stat(snapshot_filename).st_mtime_ns,
+            "postings": postings
+        }
+        with atomic_open(cls.index_filename(snapshot_filename)) as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, snapshot_filename):
+        '''
+        Returns the index saved with a snapshot, or None if it is missing or stale
+        '''
+
+        try:
+            with open(cls.index_filename(snapshot_filename), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["snapshot_mtime"] != os.stat(snapshot_filename).st_mtime_ns:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        index = cls()
+        index._postings = {token: dict.fromkeys(ids) for token, ids in data["postings"].items()}
+        return index
+
+    @classmethod
+    def clear(cls, snapshot_filename):
+        filename = cls.index_filename(snapshot_filename)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+class DuplicateIndex:
+    '''
+    Finds cards that are the same or nearly the same as a given card
+
+    Exact duplicates share their normalized text: lowercase words with
+    punctuation and extra spaces dropped. Near duplicates are found with
+    MinHash signatures over 3-character shingles, split into LSH bands so a
+    check only compares a card with the few cards that share a band
+
+    The hash functions of the signature are the 16-bit words of one
+    blake2b digest per shingle, so a signature costs a few C calls
+    '''
+
+    NUM_HASHES = 32
+    BANDS = 8
+
+    # Estimated Jaccard similarity above which two cards are near duplicates
+    # With 8 bands of 4 rows, pairs this similar share a band 98% of the time
+    THRESHOLD = 0.8
+
+    def __init__(self):
+        # hash of the normalized text -> dict of card id -> None
+        self._exact = {}
+
+        # card id -> MinHash signature
+        self._signatures = {}
+
+        # (band number, band of the signature) -> dict of card id -> None
+        self._bands = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    @staticmethod
+    def normalize(card):
+        return (" ".join(SearchIndex.tokenize(card.front)),
+                " ".join(SearchIndex.tokenize(card.back)))
+
+    def signature(self, card):
+        text = " | ".join(self.normalize(card))
+        shingles = {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+        hashes = [array("H", hashlib.blake2b(shingle.encode("utf-8"), digest_size=2 * self.NUM_HASHES).digest())
+                  for shingle in shingles]
+        return tuple(map(min, *hashes)) if len(hashes) > 1 else tuple(hashes[0])
+
+    def _band_keys(self, signature):
+        rows = self.NUM_HASHES // self.BANDS
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.BANDS)]
+
+    @classmethod
+    def similarity(cls, first, second):
+        return sum(a == b for a, b in zip(first, second)) / cls.NUM_HASHES
+
+    def add(self, card: Flashcard):
+        signature = self.signature(card)
+        self._signatures[card.id] = signature
+        self._exact.setdefault(hash(self.normalize(card)), {})[card.id] = None
+        for key in self._band_keys(signature):
+            self._bands.setdefault(key, {})[card.id] = None
+
+    def add_cards(self, cards):
+        for card in cards:
+            self.add(card)
+
+    def remove(self, card: Flashcard):
+        signature = self._signatures.pop(card.id, None)
+        if signature is None:
+            return
+        for table, key in [(self._exact, hash(self.normalize(card)))] + \
+                [(self._bands, key) for key in self._band_keys(signature)]:
+            ids = table.get(key)
+            if ids is not None:
+                ids.pop(card.id, None)
+                if not ids:
+                    del table[key]
+
+    def find(self, card, get_card):
+        '''
+        Returns the cards that duplicate {card}, exact duplicates first
+        {card} itself is never returned, even if it is already indexed
+        '''
+
+        normalized = self.normalize(card)
+        exact = [other for other in map(get_card, self._exact.get(hash(normalized), ()))
+                 if other is not None and other.id != card.id and self.normalize(other) == normalized]
+
+        signature = self.signature(card)
+        seen = {card.id} | {other.id for other in exact}
+        near = []
+        for key in self._band_keys(signature):
+            for card_id in self._bands.get(key, ()):
+                if card_id in seen:
+                    continue
+                seen.add(card_id)
+                if self.similarity(signature, self._signatures[card_id]) >= self.THRESHOLD:
+                    other = get_card(card_id)
+                    if other is not None:
+                        near.append(other)
+        return exact + near
+
+    def report(self, get_card):
+        '''
+        Returns groups of duplicate cards, each a list of at least two cards
+        Every card in an exact or LSH bucket is compared with the bucket's
+        first card only, so the report is near-linear in the deck size
+        '''
+
+        parent = {}
+
+        def find_root(card_id):
+            root = card_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while card_id != root:
+                parent[card_id], card_id = root, parent.get(card_id, card_id)
+            return root
+
+        def union(first, second):
+            first, second = find_root(first), find_root(second)
+            if first != second:
+                parent[second] = first
+
+        for ids in self._exact.values():
+            ids = iter(ids)
+            first = next(ids)
+            for card_id in ids:
+                union(first, card_id)
+
+        for ids in self._bands.values():
+            if len(ids) < 2:
+                continue
+            ids = iter(ids)
+            first = next(ids)
+            for card_id in ids:
+                if self.similarity(self._signatures[first], self._signatures[card_id]) >= self.THRESHOLD:
+                    union(first, card_id)
+
+        groups = {}
+        grouped = set(parent) | {find_root(card_id) for card_id in parent}
+        for card_id in self._signatures:
+            if card_id in grouped:
+                groups.setdefault(find_root(card_id), []).append(card_id)
+
+        # Ids {get_card} does not know are left out
+        report = []
+        for ids in groups.values():
+            cards = [card for card in map(get_card, ids) if card is not None]
+            if len(cards) > 1:
+                report.append(cards)
+        return report
+
+def search_decks(decks, query, limit=None):
+    '''
+    Searches several decks at once
+    Returns (deck, card) pairs, deck by deck in the order given
+    '''
+
+    results = []
+    for deck in decks:
+        remaining = None if limit is None else limit - len(results)
+        if remaining == 0:
+            break
+        results.extend((deck, card) for card in deck.search(query, limit=remaining))
+    return results
+
+# What a reader of a Deck sees at one moment, see Deck.snapshot
+DeckSnapshot = namedtuple("DeckSnapshot", ["name", "score", "cards"])
+
+class Deck:
+    '''
+    A deck of cards kept sorted by card_priority, with its own schedule
+
+    Changes to the cards, rating, adding, removing and re-sorting, hold the
+    deck's lock, so threads can change a deck one at a time. The cards are
+    read through an immutable tuple that is copied again only after a
+    change, so saving, counting and iterating work on a snapshot and only
+    wait for writers while that copy is made.
+    '''
+
+    def __init__(self, name):
+        # Held by every change to the cards, the score and the schedule
+        self._lock = threading.RLock()
+
+        self.name = name
+        self.score = 0
+
+        # Cards grouped by card_priority. Each bucket is an OrderedDict of
+        # card id -> card so moving a card between buckets is O(1) and
+        # cards keep the order they entered their bucket in
+        self._buckets = {}
+
+        # card id -> key of the bucket the card is currently filed under
+        self._card_bucket = {}
+
+        # Sorted view of the buckets, rebuilt lazily after a change
+        self._sorted_view = None
+
+        # (sorted view, card id -> index in that view), built on first use
+        self._position_index = None
+
+        # Full-text index over the cards, built on the first search
+        self._search_index = None
+
+        # Duplicate finder over the cards, built on the first check
+        self._duplicate_index = None
+
+        # Hash map to store initial sorting order
+        self.card_map = {}
+
+        # Priority queue of cards keyed on their due time
+        self.scheduler = Scheduler()
+
+        # Intervals fitted for the directory the deck was loaded from, None for the defaults
+        self.scheduler_parameters = None
+
+        # File the deck was last saved to or loaded from
+        self.filename = None
+
+        # Changes since the last save, written to the review journal.
+        # None while loading so replayed changes are not recorded again
+        self._pending = []
+        self._needs_snapshot = True
+
+        # Held while saving so a background save and a journal append
+        # never write the deck's files at the same time
+        self._io_lock = threading.RLock()
+
+        # True while the deck has changes that are not saved yet
+        self._dirty = True
+
+    def __len__(self):
+        return len(self.card_map)
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self._dirty = True
+
+    @property
+    def dirty(self):
+        '''
+        Returns whether the deck was changed since it was last saved or loaded
+        '''
+
+        return self._dirty
+
+    @property
+    def cards(self):
+        '''
+        Returns all cards ordered by card_priority (lowest first)
+        The view is a tuple, so change the deck through its methods
+        '''
+
+        view = self._sorted_view
+        if view is None:
+            # Writers replace the view rather than change it, so readers
+            # holding an older one are never disturbed
+            with self._lock:
+                view = self._sorted_view
+                if view is None:
+                    view = self._sorted_view = tuple(
+                        card
+                        for key in sorted(self._buckets)
+                        for card in self._buckets[key].values()
+                    )
+        return view
+
+    @cards.setter
+    def cards(self, cards):
+        with self._lock:
+            self._buckets = {}
+            self._card_bucket = {}
+            self.card_map = {}
+            self._sorted_view = None
+            self.scheduler.clear()
+            # The indexes still hold the old cards, they are rebuilt on first use
+            self._search_index = None
+            self._duplicate_index = None
+            for card in cards:
+                self.add_card(card)
+
+            # The journal cannot describe a wholesale replacement
+            self._needs_snapshot = True
+            self._dirty = True
+
+    def snapshot(self):
+        '''
+        Returns the name, score and sorted cards of the deck at this moment
+        The cards are the Flashcards themselves, so a card rated later shows
+        its new rating, but no card is added, removed or moved in the snapshot
+        '''
+
+        with self._lock:
+            return DeckSnapshot(self.name, self.score, self.cards)
+
+    def _file_card(self, card, key, at_front=False):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = OrderedDict()
+        bucket[card.id] = card
+        if at_front:
+            bucket.move_to_end(card.id, last=False)
+        self._card_bucket[card.id] = key
+        self._sorted_view = None
+
+    def _unfile_card(self, card_id):
+        key = self._card_bucket.pop(card_id, None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.pop(card_id, None)
+        if not bucket:
+            del self._buckets[key]
+        self._sorted_view = None
+
+    def add_card(self, card: Flashcard):
+        with self._lock:
+            self._unfile_card(card.id)
+            self._file_card(card, card_priority(card))
+            self._index_card(card)
+            self.card_map[card.id] = card
+            self.scheduler.add(card)
+            self._record({"op": "add", "card": self._card_to_dict(card)})
+
+    def remove_card(self, card_id):
+        with self._lock:
+            card = self.card_map.pop(card_id, None)
+            if card:
+                self._unfile_card(card_id)
+                self.scheduler.discard(card_id)
+                self._unindex_card(card)
+                self._record({"op": "remove", "id": card_id})
+                return True
+            return False
+
+    def get_card(self, card_id):
+        return self.card_map.get(card_id)
+
+    def _built_indexes(self):
+        return [index for index in (self._search_index, self._duplicate_index) if index is not None]
+
+    def _index_card(self, card):
+        # Replacing a card drops its old text from the indexes first
+        indexes = self._built_indexes()
+        if not indexes:
+            return
+        old = self.get_card(card.id)
+        for index in indexes:
+            if old is not None:
+                index.remove(old)
+            index.add(card)
+
+    def _unindex_card(self, card):
+        for index in self._built_indexes():
+            index.remove(card)
+
+    '''
+    Writers change the search and duplicate indexes in place, so they are
+    built and looked up with the deck's lock held
+    '''
+    @property
+    def search_index(self):
+        with self._lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex()
+                self._search_index.add_cards(self.cards)
+            return self._search_index
+
+    def search(self, query, limit=None):
+        '''
+        Returns the cards whose front or back match {query}
+        See SearchIndex for the query syntax
+        '''
+
+        with self._lock:
+            return self.search_index.search(query, self.get_card, limit)
+
+    @property
+    def duplicate_index(self):
+        with self._lock:
+            if self._duplicate_index is None:
+                self._duplicate_index = DuplicateIndex()
+                self._duplicate_index.add_cards(self.cards)
+            return self._duplicate_index
+
+    def find_duplicates(self, card):
+        '''
+        Returns the cards in the deck that are the same or nearly the same as {card}
+        '''
+
+        with self._lock:
+            return self.duplicate_index.find(card, self.get_card)
+
+    def duplicate_report(self):
+        '''
+        Returns every group of duplicate cards in the deck
+        '''
+
+        with self._lock:
+            return self.duplicate_index.report(self.get_card)
+
+    def index_of(self, card_id):
+        '''
+        Returns the position of a card in the sorted cards, or None
+        The index is built once per sorted view, so repeated lookups are O(1)
+        '''
+
+        cards = self.cards
+        if self._position_index is None or self._position_index[0] is not cards:
+            self._position_index = (cards, {card.id: i for i, card in enumerate(cards)})
+        return self._position_index[1].get(card_id)
+
+    def sort_by_score(self):
+        '''
+        Cards are kept sorted as they are rated, so this only re-files cards
+        whose last_score or history was changed without going through rate_card
+        '''
+
+        with self._lock:
+            for card in self.card_map.values():
+                priority = card_priority(card)
+                if self._card_bucket.get(card.id) != priority:
+                    self._unfile_card(card.id)
+                    self._file_card(card, priority)
+
+    def quicksort(self, cards, score):
+        # Sorts cards by their score
+
+        if cards is None:
+            cards = self.cards
+
+        if len(cards) <= 1:
+            return cards
+        
+        pivot = score(cards[len(cards) // 2])
+        left = [c for c in cards if score(c) < pivot]
+        mid = [c for c in cards if score(c) == pivot]
+        right = [c for c in cards if score(c) > pivot]
+        return self.quicksort(left, score) + mid + self.quicksort(right, score)
+
+    def rate_card(self, card: Flashcard, rating, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            card.last_score = rating
+            record_rating(card, rating, now)
+            self.score += rating
+
+            # Moves the card to the end of the bucket of its new priority
+            if card.id in self._card_bucket:
+                self._unfile_card(card.id)
+                self._file_card(card, card_priority(card))
+
+            self.scheduler.reschedule(card, rating, now, self.scheduler_parameters)
+
+            if card.id in self.card_map:
+                self._record({"op": "rate", "id": card.id, "rating": rating, "at": now,
+                              "due": card.due, "interval": card.interval})
+
+    def due_cards(self, now=None, limit=None):
+        '''
+        Returns the cards that are due for review, earliest first
+        '''
+
+        # Reading the heap pops and pushes entries back, so it is a change too
+        with self._lock:
+            return self.scheduler.due_cards(now, limit)
+
+    def by_recall(self, now=None, limit=None, due_only=False):
+        '''
+        Returns the cards the RecallModel expects to be forgotten first
+        '''
+
+        now = time.time() if now is None else now
+        cards = self.cards
+        due = array("d", [card.due for card in cards])
+        interval = array("d", [card.interval for card in cards])
+        return [cards[row] for row in RecallModel.order(due, interval, now, limit, due_only)]
+
+    def insert_card_sorted(self, card):
+        # New cards go in front of the cards that share their priority
+        with self._lock:
+            self._unfile_card(card.id)
+            self._file_card(card, card_priority(card), at_front=True)
+            self._index_card(card)
+            self.card_map[card.id] = card
+            self.scheduler.add(card)
+            self._record({"op": "add", "card": self._card_to_dict(card), "front": True})
+
+    def add_cards(self, cards):
+        '''
+        Adds many cards at once to the end of their score groups
+        Bulk adds are not journaled, the next save writes a full snapshot
+        '''
+
+        with self._lock:
+            pending = self._pending
+            self._pending = None
+            try:
+                for card in cards:
+                    self.add_card(card)
+            finally:
+                self._pending = pending
+            self._needs_snapshot = True
+            self._dirty = True
+
+    def import_text(self, filename, delimiter=None, progress=None, batch_size=IMPORT_BATCH_SIZE,
+                    skip_duplicates=False):
+        '''
+        Imports cards from a CSV, TSV or Anki text export, {batch_size} at a time
+        {progress} is called with the number of cards imported after each batch
+        With {skip_duplicates}, cards that duplicate a card already in the deck
+        or earlier in the file are left out
+        Returns the number of cards imported
+        '''
+
+        count = 0
+        for batch in Deck.iter_card_batches_from_text(filename, delimiter, batch_size):
+            if skip_duplicates:
+                batch = Deck._without_duplicates(self, batch)
+            self.add_cards(batch)
+            count += len(batch)
+            if progress:
+                progress(count)
+        return count
+
+    def max_score(self):
+        '''
+        Returns the highest possible score for this deck
+        assuming all cards were rated 'Easy' (2 points each)
+        '''
+
+        return len(self.card_map) * 2
+
+    '''
+    Code for saving/loading deck files
+
+    Decks are saved as JSON Lines: a header line with the deck details
+    followed by one card per line, so neither saving nor loading has to
+    hold the whole file in memory. Older single-document JSON decks are
+    still loaded and are written in the new format on the next save.
+    '''
+    def save_to_file(self, filename):
+        with self._io_lock:
+            # The file is written from a snapshot, so other threads can keep
+            # changing the deck meanwhile. Their changes stay pending and go
+            # to the next journal append. A card rated during the write may
+            # have some of its new fields in the file. Its history is replaced
+            # whole, never changed in place, so replay sees whether it holds
+            # the rating and puts the other fields right without counting it twice
+            with self._lock:
+                header = self._header_to_dict()
+                cards = self.cards
+                self._pending = []
+                self._needs_snapshot = False
+                self._dirty = False
+            try:
+                with atomic_open(filename) as f:
+                    f.write(json.dumps(header) + "\n")
+                    for card in cards:
+                        f.write(json.dumps(self._card_to_dict(card)) + "\n")
+            except BaseException:
+                self._needs_snapshot = True
+                self._dirty = True
+                raise
+
+            # The new snapshot already contains everything in the journal
+            ReviewJournal(filename).clear()
+            self._save_search_index(filename)
+            self.filename = filename
+
+    def save_changes(self, filename=None):
+        '''
+        Saves the deck by appending its recent changes to the review journal
+        Writes a full snapshot instead when there is no usable snapshot yet,
+        and folds the journal into a new snapshot once it grows too large
+        '''
+
+        with self._io_lock:
+            filename = filename or self.filename
+            if self._needs_snapshot or filename != self.filename or not os.path.exists(filename):
+                self.save_to_file(filename)
+                return
+
+            # The deck details are appended last so they win when replayed
+            with self._lock:
+                pending, self._pending = self._pending, []
+                pending.append({"op": "meta", "name": self.name, "score": self.score, "card_count": len(self)})
+                self._dirty = False
+
+            journal = ReviewJournal(filename)
+            try:
+                journal.append(pending)
+            except BaseException:
+                with self._lock:
+                    self._pending[:0] = pending[:-1]
+                    self._dirty = True
+                raise
+
+            if journal.size() > ReviewJournal.COMPACT_THRESHOLD:
+                self.compact()
+
+    def _save_search_index(self, filename):
+        # Only the copy of the postings waits for the lock, not the write
+        with self._lock:
+            index = self._search_index
+            postings = index.copy_postings() if index is not None else None
+        if postings is not None:
+            SearchIndex.save_postings(filename, postings)
+        else:
+            SearchIndex.clear(filename)
+
+    def compact(self):
+        '''
+        Writes a fresh snapshot of the deck and empties its review journal
+        '''
+
+        if self.filename:
+            self.save_to_file(self.filename)
+
+    def _record(self, record):
+        if self._pending is not None:
+            self._pending.append(record)
+            self._dirty = True
+
+    def _apply_record(self, record):
+        '''
+        Applies a single review journal record to the deck
+        '''
+
+        op = record["op"]
+        if op == "add":
+            card = self._card_from_dict(record["card"])
+            if record.get("front"):
+                self.insert_card_sorted(card)
+            else:
+                self.add_card(card)
+        elif op == "remove":
+            self.remove_card(record["id"])
+        elif op == "rate":
+            card = self.get_card(record["id"])
+            if card is None:
+                return
+            card.last_score = record["rating"]
+            # Records from before rating times were saved were made an interval before the due time
+            at = record.get("at", record["due"] - record["interval"])
+            # The snapshot has the rating already if the card was rated while it was written
+            if card.history is None or card.history.latest() != (at, record["rating"]):
+                record_rating(card, record["rating"], at)
+            self.score += record["rating"]
+            self._unfile_card(card.id)
+            self._file_card(card, card_priority(card))
+            card.due = record["due"]
+            card.interval = record["interval"]
+            self.scheduler.add(card)
+        elif op == "meta":
+            self.name = record["name"]
+            self.score = record["score"]
+
+    @classmethod
+    def load_from_file(cls, filename):
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "r", encoding="utf-8") as f:
+            header, cards = cls._read_deck_stream(f)
+            deck = cls(header["name"])
+            deck.score = header.get("score", 0)
+            deck._pending = None
+            for card in cards:
+                deck.add_card(card)
+
+        # Changes saved since the snapshot was written
+        deck._search_index = SearchIndex.load(filename)
+        complete = ReviewJournal(filename).replay(deck)
+
+        deck.filename = filename
+        deck.scheduler_parameters = Scheduler.parameters_for(filename)
+        deck._pending = []
+        # A journal cut off by a crash is replaced by a new snapshot on the next save
+        deck._needs_snapshot = not complete
+        deck._dirty = not complete
+        return deck
+
+    @classmethod
+    def read_header(cls, filename):
+        '''
+        Returns the name, score and card count of a deck file without reading its cards
+        Changes saved to the review journal since the snapshot are included
+        '''
+
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "r", encoding="utf-8") as f:
+            header, cards = cls._read_deck_stream(f)
+            # Older JSON decks have no header, the whole file was read anyway
+            if "card_count" not in header:
+                header["card_count"] = sum(1 for _ in cards)
+
+        journal = ReviewJournal(filename)
+        meta = journal.last_meta()
+        if meta is not None and "card_count" in meta:
+            header.update(name=meta["name"], score=meta["score"], card_count=meta["card_count"])
+        elif journal.size():
+            # Journals from before card counts were saved have to be replayed
+            return cls.load_from_file(filename)._header_to_dict()
+        return header
+
+    @classmethod
+    def iter_cards_from_file(cls, filename):
+        '''
+        Yields the cards in a deck file one at a time as they are parsed
+        '''
+
+        with open(filename, "r", encoding="utf-8") as f:
+            _, cards = cls._read_deck_stream(f)
+            yield from cards
+
+    def _without_duplicates(self, cards):
+        # Cards kept from this batch are not in the deck yet, so they get
+        # their own index until the batch is added
+        kept = {}
+        batch_index = DuplicateIndex()
+        for card in cards:
+            if self.find_duplicates(card) or batch_index.find(card, kept.get):
+                continue
+            kept[card.id] = card
+            batch_index.add(card)
+        return list(kept.values())
+
+    @staticmethod
+    def iter_card_batches_from_text(filename, delimiter=None, batch_size=IMPORT_BATCH_SIZE):
+        '''
+        Yields lists of new cards read from a delimited text file
+
+        Each row is front, back and any further columns (like Anki tags) are
+        ignored. Anki's leading "#key:value" lines are read, and "#separator"
+        sets the delimiter. Otherwise .csv files use commas and anything else
+        uses tabs
+        '''
+
+        if delimiter is None:
+            delimiter = "," if filename.lower().endswith(".csv") else "\t"
+
+        with open(filename, "r", encoding="utf-8-sig", newline="") as f:
+            line_number = 0
+            line = f.readline()
+            while line.startswith("#"):
+                line_number += 1
+                key, _, value = line[1:].strip().partition(":")
+                if key.lower() == "separator":
+                    value = value.strip()
+                    delimiter = TEXT_SEPARATORS.get(value.lower(), value)
+                line = f.readline()
+
+            rows = csv.reader(itertools.chain([line], f), delimiter=delimiter)
+            batch = []
+            for row in rows:
+                line_number += 1
+                if not any(field.strip() for field in row):
+                    continue
+                if len(row) < 2:
+                    raise ValueError(f"Line {line_number} of {filename} has no back side")
+                batch.append(Flashcard(row[0], row[1]))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    @classmethod
+    def _read_deck_stream(cls, f):
+        '''
+        Reads the header of an open deck file
+        Returns the header and a generator over the remaining cards
+        '''
+
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+
+        if isinstance(header, dict) and header.get("format") == DECK_FORMAT:
+            if header.get("version", 1) > DECK_FORMAT_VERSION:
+                raise ValueError(f"Unsupported deck format version {header['version']}")
+            cards = (cls._card_from_dict(json.loads(line)) for line in f if line.strip())
+            return header, cards
+
+        # Older decks are a single JSON document with a list of cards
+        f.seek(0)
+        data = json.load(f)
+        cards = (cls._card_from_dict(card_data) for card_data in data.pop("cards"))
+        return data, cards
+
+    def _header_to_dict(self):
+        return {
+            "format": DECK_FORMAT,
+            "version": DECK_FORMAT_VERSION,
+            "name": self.name,
+            "score": self.score,
+            "card_count": len(self)
+        }
+
+    @staticmethod
+    def _card_from_dict(card_data):
+        card = Flashcard(
+            front=card_data["front"],
+            back=card_data["back"],
+            card_id=card_data["id"],
+        )
+        card.last_score = card_data.get("last_score", 0)
+
+        # Decks saved before scheduling existed are due right away
+        card.due = card_data.get("due", 0)
+        card.interval = card_data.get("interval", 0)
+        if card_data.get("history"):
+            card.history = RatingHistory(card_data["history"])
+        return card
+
+    @staticmethod
+    def _card_to_dict(card: Flashcard):
+        card_data = {
+            "id": card.id,
+            "front": card.front,
+            "back": card.back,
+            "last_score": getattr(card, "last_score", 0),
+            "due": getattr(card, "due", 0),
+            "interval": getattr(card, "interval", 0)
+        }
+        history = getattr(card, "history", None)
+        if history:
+            card_data["history"] = history.to_list()
+        return card_data
+
+class LazyDeck:
+    '''
+    A deck file of which only the header has been read
+
+    The name, score and card count come from the header, so a table of many
+    decks can be shown without reading their cards. Anything else, like
+    the cards or rating one, loads the whole deck first and is passed on
+    to it. Call load() on a worker thread to have the cards ready before
+    they are needed.
+    '''
+
+    def __init__(self, filename, header, deck_class=None):
+        self._filename = filename
+        self._header = header
+        self._deck_class = deck_class or Deck
+        self._deck = None
+        self._load_lock = threading.Lock()
+
+    @classmethod
+    def load_from_file(cls, filename, deck_class=None):
+        header = Deck.read_header(filename)
+        if header is None:
+            return None
+        return cls(filename, header, deck_class)
+
+    @property
+    def loaded(self):
+        return self._deck is not None
+
+    def load(self):
+        '''
+        Reads the cards if they have not been read yet, returns the full deck
+        '''
+
+        with self._load_lock:
+            if self._deck is None:
+                deck = self._deck_class.load_from_file(self._filename)
+                if deck is None:
+                    raise FileNotFoundError(f"Deck file {self._filename} no longer exists")
+                self._deck = deck
+        return self._deck
+
+    def __getattr__(self, name):
+        # Only called for what the header cannot answer
+        if name.startswith("__") or name in ("_deck", "_header"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __len__(self):
+        return len(self._deck) if self._deck is not None else self._header["card_count"]
+
+    @property
+    def name(self):
+        return self._deck.name if self._deck is not None else self._header["name"]
+
+    @name.setter
+    def name(self, name):
+        self.load().name = name
+
+    @property
+    def score(self):
+        return self._deck.score if self._deck is not None else self._header.get("score", 0)
+
+    @score.setter
+    def score(self, score):
+        self.load().score = score
+
+    @property
+    def filename(self):
+        return self._deck.filename if self._deck is not None else self._filename
+
+    @property
+    def dirty(self):
+        return self._deck is not None and self._deck.dirty
+
+    def max_score(self):
+        return self._deck.max_score() if self._deck is not None else len(self) * 2
+
+    def save_changes(self, filename=None):
+        # A deck that was never read has nothing new to save to its own file
+        if self._deck is None and filename in (None, self._filename):
+            return
+        self.load().save_changes(filename)
+
+class BackgroundIO:
+    '''
+    Saves and loads decks on worker threads so the caller never waits on disk
+
+    Saves of the same deck are coalesced: while one is being written, further
+    requests are folded into a single follow-up save of the latest state,
+    and all of them share its Future. Loads of several files run in parallel.
+    SqliteDecks are saved right away on the calling thread, since their
+    store can only be used from the thread that opened it.
+    '''
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memokado-io")
+        self._lock = threading.Lock()
+
+        # deck -> {"filename": ..., "running": Future of the save being written,
+        #          "waiting": Future of the follow-up save or None}
+        self._saves = {}
+
+    def save(self, deck, filename=None):
+        '''
+        Saves {deck} with save_changes on a worker thread
+        Returns a Future that is done once the deck's latest state is on disk
+        '''
+
+        if isinstance(deck, SqliteDeck):
+            return self._save_now(deck, filename)
+
+        with self._lock:
+            entry = self._saves.get(deck)
+            if entry is not None:
+                entry["filename"] = filename
+                if entry["waiting"] is None:
+                    entry["waiting"] = Future()
+                return entry["waiting"]
+
+            self._saves[deck] = {"filename": filename, "waiting": None}
+            future = self._start_save(deck, filename)
+        self._when_saved(deck, future)
+        return future
+
+    @staticmethod
+    def _save_now(deck, filename):
+        return BackgroundIO._run_now(deck.save_changes, filename)
+
+    @staticmethod
+    def _run_now(function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _start_save(self, deck, filename):
+        # Called with self._lock held
+        future = self._executor.submit(deck.save_changes, filename)
+        self._saves[deck]["running"] = future
+        return future
+
+    def _when_saved(self, deck, future):
+        # Registered once self._lock is released: a save that has already
+        # finished runs the callback at once on this thread, which takes the lock
+        future.add_done_callback(lambda _: self._save_done(deck))
+
+    def _save_done(self, deck):
+        with self._lock:
+            entry = self._saves[deck]
+            waiting = entry["waiting"]
+            if waiting is None:
+                del self._saves[deck]
+                return
+            entry["waiting"] = None
+            follow_up = self._start_save(deck, entry["filename"])
+        follow_up.add_done_callback(lambda done: self._copy_result(done, waiting))
+        self._when_saved(deck, follow_up)
+
+    @staticmethod
+    def _copy_result(source, target):
+        if source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    def run(self, function, *args):
+        '''
+        Runs {function} on a worker thread, returns a Future of its result
+        For work on a deck that would keep the caller busy, like ordering it
+        '''
+
+        return self._executor.submit(function, *args)
+
+    def load(self, filename, deck_class=None):
+        return self._executor.submit((deck_class or Deck).load_from_file, filename)
+
+    def load_cards(self, deck):
+        '''
+        Reads the cards of a LazyDeck, returns a Future of the full deck
+        '''
+
+        return self._executor.submit(deck.load)
+
+    def load_duplicate_index(self, deck):
+        '''
+        Reads the cards of {deck} if needed and builds its duplicate index,
+        returns a Future of the deck. SqliteDecks are done on the calling
+        thread, like their saves
+        '''
+
+        def build():
+            (deck.load() if isinstance(deck, LazyDeck) else deck).duplicate_index
+            return deck
+
+        if isinstance(deck, SqliteDeck):
+            return self._run_now(build)
+        return self._executor.submit(build)
+
+    def load_many(self, filenames, deck_class=None):
+        '''
+        Starts loading every file at once, returns a Future for each
+        '''
+
+        return [self.load(filename, deck_class) for filename in filenames]
+
+    def shutdown(self, wait=True):
+        '''
+        Stops the worker threads, with {wait} after every requested save is written
+        '''
+
+        while wait:
+            with self._lock:
+                futures = [future for entry in self._saves.values()
+                           for future in (entry["running"], entry["waiting"]) if future is not None]
+            if not futures:
+                break
+            concurrent.futures.wait(futures)
+        self._executor.shutdown(wait=wait)
+
+class Autosaver:
+    '''
+    Saves decks in the background a short while after their last change
+
+    Every change pushes the deck's save back by {delay} seconds, so a burst
+    of edits is written once. Only decks that have a file and unsaved
+    changes are written. The caller decides when to flush, for example
+    from a Tk after() callback, and flushes everything on exit.
+    '''
+
+    DELAY = 2.0
+
+    def __init__(self, io, delay=DELAY):
+        self.io = io
+        self.delay = delay
+
+        # deck -> time.monotonic() after which it is saved
+        self._deadlines = {}
+
+    def schedule(self, deck, now=None):
+        now = time.monotonic() if now is None else now
+        self._deadlines[deck] = now + self.delay
+
+    def next_deadline(self):
+        return min(self._deadlines.values(), default=None)
+
+    def flush(self, now=None):
+        '''
+        Saves the decks whose delay has passed by {now}, or every scheduled
+        deck without {now}. Returns a Future for each save that was started
+        '''
+
+        decks = [deck for deck, deadline in self._deadlines.items() if now is None or deadline <= now]
+        futures = []
+        for deck in decks:
+            del self._deadlines[deck]
+            if deck.filename and deck.dirty:
+                futures.append(self.io.save(deck))
+        return futures
+
+class CollectionStore:
+    '''
+    Keeps many decks and their cards in a single SQLite database
+
+    Decks opened from the store are SqliteDecks, which read cards from the
+    database when they are needed. Changes are grouped into one transaction
+    until commit() is called, so rating a whole session costs one write.
+    '''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS decks (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            card_count INTEGER NOT NULL DEFAULT 0,
+            head INTEGER NOT NULL DEFAULT 0,
+            tail INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS cards (
+            deck_id INTEGER NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+            id TEXT NOT NULL,
+            front TEXT NOT NULL,
+            back TEXT NOT NULL,
+            last_score INTEGER NOT NULL DEFAULT 0,
+            position INTEGER NOT NULL,
+            due REAL NOT NULL DEFAULT 0,
+            interval REAL NOT NULL DEFAULT 0,
+            history BLOB,
+            priority REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (deck_id, id)
+        );
+        CREATE INDEX IF NOT EXISTS cards_by_due ON cards(deck_id, due, position);
+    '''
+
+    # Brings stores made before rating histories were kept up to date
+    MIGRATIONS = {
+        "history": [
+            "ALTER TABLE cards ADD COLUMN history BLOB",
+            "ALTER TABLE cards ADD COLUMN priority REAL NOT NULL DEFAULT 0",
+            "UPDATE cards SET priority = last_score",
+            "DROP INDEX IF EXISTS cards_by_score",
+        ],
+    }
+
+    # Number of rows sent to SQLite per executemany call when importing
+    BATCH_SIZE = 1000
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+
+        # Intervals fitted for the collection's directory, used by all its decks
+        self.scheduler_parameters = None
+        if filename != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.scheduler_parameters = Scheduler.parameters_for(filename)
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(cards)")}
+        with self.conn:
+            for column, statements in self.MIGRATIONS.items():
+                if column not in columns:
+                    for statement in statements:
+                        self.conn.execute(statement)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS cards_by_priority ON cards(deck_id, priority, position)")
+
+    def list_decks(self):
+        '''
+        Returns every deck in the store without reading any of their cards
+        '''
+
+        rows = self.conn.execute(
+            "SELECT id, name, score, card_count, head, tail FROM decks ORDER BY id")
+        return [SqliteDeck(self, row) for row in rows]
+
+    def create_deck(self, name):
+        cursor = self.conn.execute("INSERT INTO decks (name) VALUES (?)", (name,))
+        return SqliteDeck(self, (cursor.lastrowid, name, 0, 0, 0, 0))
+
+    def import_deck(self, deck):
+        '''
+        Copies an in-memory Deck into the store, keeping its card order
+        '''
+
+        return self._import_cards(deck.name, deck.score, deck.cards)
+
+    def import_file(self, filename):
+        '''
+        Streams a deck file into the store without loading the whole deck
+        '''
+
+        with open(filename, "r", encoding="utf-8") as f:
+            header, cards = Deck._read_deck_stream(f)
+            return self._import_cards(header["name"], header.get("score", 0), cards)
+
+    def _import_cards(self, name, score, cards):
+        sqlite_deck = self.create_deck(name)
+        deck_id = sqlite_deck.deck_id
+        rows = (SqliteDeck._card_row(deck_id, card, position) for position, card in enumerate(cards))
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, self.BATCH_SIZE))
+            if not batch:
+                break
+            self.conn.executemany(f"INSERT OR REPLACE INTO cards VALUES {SqliteDeck.CARD_ROW}", batch)
+            count += len(batch)
 
-        # The list that gets sorted by score every session
-        self.cards = []
+        sqlite_deck._score = score
+        sqlite_deck._count = count
+        sqlite_deck._head = 0
+        sqlite_deck._tail = count
+        sqlite_deck._update_deck_row()
+        self.commit()
+        return sqlite_deck
 
-        # Hash map to store initial sorting order
-        self.card_map = {}
+    def delete_deck(self, deck):
+        self.conn.execute("DELETE FROM cards WHERE deck_id = ?", (deck.deck_id,))
+        self.conn.execute("DELETE FROM decks WHERE id = ?", (deck.deck_id,))
+
+    def transaction(self):
+        '''
+        Use as "with store.transaction():" to commit a batch of changes
+        together, or roll them all back if something fails
+        '''
+
+        return self.conn
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class SqliteDeck:
+    '''
+    A deck whose cards are kept in a CollectionStore instead of in memory
+    It has the same methods as Deck, but every Flashcard it returns is read
+    from the database when asked for, so opening the deck reads nothing
+    '''
+
+    CARD_COLUMNS = "id, front, back, last_score, due, interval, history"
+
+    # Only used from the thread that opened its store, so the methods
+    # borrowed from Deck have nothing to lock
+    _lock = nullcontext()
+
+    # Placeholders for a whole row of the cards table
+    CARD_ROW = "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, store, row):
+        self.store = store
+        self.deck_id, self._name, self._score, self._count, self._head, self._tail = row
+        self.filename = store.filename
+        self.scheduler_parameters = store.scheduler_parameters
+
+        # Full-text index and duplicate finder, built on first use
+        # They are not saved, the database is the only copy of the deck
+        self._search_index = None
+        self._duplicate_index = None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.iter_cards()
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self._update_deck_row()
+
+    @property
+    def dirty(self):
+        # Changes are written straight to the database and only need a commit
+        return self.store.conn.in_transaction
+
+    @property
+    def score(self):
+        return self._score
+
+    @score.setter
+    def score(self, score):
+        self._score = score
+        self._update_deck_row()
+
+    @property
+    def cards(self):
+        '''
+        Returns a lazy view of the cards ordered by card_priority
+        '''
+
+        return SqliteCardView(self)
+
+    def iter_cards(self, offset=0, limit=-1, batch_size=500):
+        '''
+        Yields the cards ordered by card_priority, fetching them in batches
+        '''
+
+        cursor = self.store.conn.execute(
+            f"SELECT {self.CARD_COLUMNS} FROM cards WHERE deck_id = ? "
+            "ORDER BY priority, position LIMIT ? OFFSET ?",
+            (self.deck_id, limit, offset))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield self._card_from_row(row)
+
+    def get_card(self, card_id):
+        row = self.store.conn.execute(
+            f"SELECT {self.CARD_COLUMNS} FROM cards WHERE deck_id = ? AND id = ?",
+            (self.deck_id, card_id)).fetchone()
+        return self._card_from_row(row) if row else None
 
     def add_card(self, card: Flashcard):
-        self.cards.append(card)
-        self.card_map[card.id] = card
+        self._tail += 1
+        self._write_card(card, self._tail)
+
+    def insert_card_sorted(self, card):
+        # New cards go in front of the cards that share their priority
+        self._head -= 1
+        self._write_card(card, self._head)
+
+    def add_cards(self, cards):
+        '''
+        Adds many cards with one executemany call
+        '''
+
+        rows = []
+        for card in cards:
+            self._index_card(card)
+            self._tail += 1
+            rows.append(self._card_row(self.deck_id, card, self._tail))
+        self.store.conn.executemany(f"INSERT OR REPLACE INTO cards VALUES {self.CARD_ROW}", rows)
+        self._count = self.store.conn.execute(
+            "SELECT COUNT(*) FROM cards WHERE deck_id = ?", (self.deck_id,)).fetchone()[0]
+        self._update_deck_row()
+
+    import_text = Deck.import_text
+    search_index = Deck.search_index
+    search = Deck.search
+    duplicate_index = Deck.duplicate_index
+    find_duplicates = Deck.find_duplicates
+    duplicate_report = Deck.duplicate_report
+    _built_indexes = Deck._built_indexes
+    _index_card = Deck._index_card
+    _unindex_card = Deck._unindex_card
 
     def remove_card(self, card_id):
-        card = self.card_map.pop(card_id, None)
-        if card:
-            self.cards.remove(card)
+        if self._built_indexes():
+            card = self.get_card(card_id)
+            if card is not None:
+                self._unindex_card(card)
+
+        cursor = self.store.conn.execute(
+            "DELETE FROM cards WHERE deck_id = ? AND id = ?", (self.deck_id, card_id))
+        if cursor.rowcount:
+            self._count -= 1
+            self._update_deck_row()
             return True
         return False
 
-    def get_card(self, card_id):
-        return self.card_map.get(card_id)
+    def rate_card(self, card: Flashcard, rating, now=None):
+        now = time.time() if now is None else now
+        card.last_score = rating
+        record_rating(card, rating, now)
+        self._score += rating
+        Scheduler.update_interval(card, rating, now, self.scheduler_parameters)
 
-    def sort_by_score(self):
-        def get_last_score(card):
-            return card.last_score
-    
-        self.cards = self.quicksort(self.cards, score=get_last_score)
+        # Moves the card to the end of its new priority group
+        self._tail += 1
+        self.store.conn.execute(
+            "UPDATE cards SET last_score = ?, position = ?, due = ?, interval = ?, history = ?, priority = ? "
+            "WHERE deck_id = ? AND id = ?",
+            (rating, self._tail, card.due, card.interval, card.history.to_bytes(), card_priority(card),
+             self.deck_id, card.id))
+        self._update_deck_row()
 
-    def quicksort(self, cards, score):
-        # Sorts cards by their score
+    def due_cards(self, now=None, limit=None):
+        '''
+        Returns the cards that are due for review, earliest first
+        '''
 
-        if cards is None:
-            cards = self.cards
+        now = time.time() if now is None else now
+        rows = self.store.conn.execute(
+            f"SELECT {self.CARD_COLUMNS} FROM cards WHERE deck_id = ? AND due <= ? "
+            "ORDER BY due, position LIMIT ?",
+            (self.deck_id, now, -1 if limit is None else limit))
+        return [self._card_from_row(row) for row in rows]
 
-        if len(cards) <= 1:
-            return cards
-        
-        pivot = score(cards[len(cards) // 2])
-        left = [c for c in cards if score(c) < pivot]
-        mid = [c for c in cards if score(c) == pivot]
-        right = [c for c in cards if score(c) > pivot]
-        return self.quicksort(left, score) + mid + self.quicksort(right, score)
+    def by_recall(self, now=None, limit=None, due_only=False):
+        '''
+        Returns the cards the RecallModel expects to be forgotten first
+        Recall only falls as (now - due) / interval grows, so SQLite can
+        order by that without computing the curve
+        '''
 
-    def rate_card(self, card: Flashcard, rating):
-        card.last_score = rating
-        self.score += rating
+        now = time.time() if now is None else now
+        rows = self.store.conn.execute(
+            f"SELECT {self.CARD_COLUMNS} FROM cards WHERE deck_id = ? AND (? = 0 OR due <= ?) "
+            "ORDER BY CASE WHEN interval > 0 THEN MAX((? - due) / interval, -1) ELSE 1e308 END DESC, "
+            "priority, position LIMIT ?",
+            (self.deck_id, int(due_only), now, now, -1 if limit is None else limit))
+        return [self._card_from_row(row) for row in rows]
 
-    def insert_card_sorted(self, card):
-        # Uses binary search to find correct index to insert new card
-        low, high = 0, len(self.cards)
-        while low < high:
-            mid = (low + high) // 2
-            if self.cards[mid].last_score < card.last_score:
-                low = mid + 1
-            else:
-                high = mid
-        self.cards.insert(low, card)
+    def sort_by_score(self):
+        # The cards_by_priority index already keeps the cards in order
+        pass
 
     def max_score(self):
+        return self._count * 2
+
+    def save_changes(self, filename=None):
+        self.store.commit()
+
+    def save_to_file(self, filename):
         '''
-        Returns the highest possible score for this deck
-        assuming all cards were rated 'Easy' (2 points each)
+        Exports the deck to a JSON Lines deck file
         '''
 
-        return len(self.cards) * 2
+        header = Deck._header_to_dict(self)
+        with atomic_open(filename) as f:
+            f.write(json.dumps(header) + "\n")
+            for card in self.iter_cards():
+                f.write(json.dumps(Deck._card_to_dict(card)) + "\n")
+
+    def _write_card(self, card, position):
+        self._index_card(card)
+        removed = self.store.conn.execute(
+            "DELETE FROM cards WHERE deck_id = ? AND id = ?", (self.deck_id, card.id)).rowcount
+        self.store.conn.execute(
+            f"INSERT INTO cards VALUES {self.CARD_ROW}", self._card_row(self.deck_id, card, position))
+        self._count += 1 - removed
+        self._update_deck_row()
+
+    def _update_deck_row(self):
+        self.store.conn.execute(
+            "UPDATE decks SET name = ?, score = ?, card_count = ?, head = ?, tail = ? WHERE id = ?",
+            (self._name, self._score, self._count, self._head, self._tail, self.deck_id))
+
+    @staticmethod
+    def _card_row(deck_id, card, position):
+        history = getattr(card, "history", None)
+        return (deck_id, card.id, card.front, card.back, card.last_score, position, card.due,
+                card.interval, history.to_bytes() if history else None, card_priority(card))
+
+    @staticmethod
+    def _card_from_row(row):
+        card_id, front, back, last_score, due, interval, history = row
+        card = Flashcard(front, back, card_id=card_id)
+        card.last_score = last_score
+        card.due = due
+        card.interval = interval
+        if history:
+            card.history = RatingHistory.from_bytes(history)
+        return card
+
+class SqliteCardView:
+    '''
+    Sequence over a SqliteDeck's sorted cards that only reads what is used
+    '''
+
+    def __init__(self, deck):
+        self.deck = deck
+
+    def __len__(self):
+        return len(self.deck)
+
+    def __iter__(self):
+        return self.deck.iter_cards()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return list(self.deck.iter_cards(offset=start, limit=max(0, stop - start)))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("card index out of range")
+        return next(self.deck.iter_cards(offset=index, limit=1))
 
+class CompactDeck:
     '''
-    Code for saving/loading JSON files
+    A deck that keeps its cards column by column instead of as objects
+
+    Scores, due times and intervals live in typed arrays and uuid ids are
+    kept as two 64-bit halves, so a card costs its two strings and a few
+    dozen bytes. Cards handed out are CardViews onto a row of the arrays.
+    It has the same methods as Deck and reads and writes the same files.
     '''
+
+    # Its changes take no lock, so the methods borrowed from Deck take none either
+    _lock = nullcontext()
+
+    def __init__(self, name):
+        self.name = name
+        self.score = 0
+
+        # One entry per card, a card's row can change when another is removed
+        self._id_hi = array("Q")
+        self._id_lo = array("Q")
+        self._fronts = []
+        self._backs = []
+        self._scores = array("b")
+        self._due = array("d")
+        self._intervals = array("d")
+
+        # card_priority of each card and its RatingHistory or None
+        self._priorities = array("d")
+        self._histories = []
+
+        # Order within a priority, like SqliteDeck new cards go to the front
+        # and added or rated cards to the back
+        self._positions = array("q")
+        self._head = 0
+        self._tail = 0
+
+        # id key -> row, ids that are not uuids are kept as strings
+        self._rows = {}
+        self._odd_ids = {}
+
+        # Rows ordered by (priority, position), rebuilt lazily after a change
+        self._sorted_rows = None
+
+        # (sorted rows, row -> index in those rows), built on first use
+        self._position_index = None
+
+        # Full-text index and duplicate finder, built on first use
+        self._search_index = None
+        self._duplicate_index = None
+
+        self.filename = None
+        self.scheduler_parameters = None
+        self._io_lock = threading.RLock()
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._fronts)
+
+    name = Deck.name
+    dirty = Deck.dirty
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    @property
+    def cards(self):
+        '''
+        Returns a lazy view of the cards ordered by card_priority
+        '''
+
+        if self._sorted_rows is None:
+            self._sorted_rows = array("l", sorted(
+                range(len(self)), key=lambda row: (self._priorities[row], self._positions[row])))
+        return CompactCardView(self, self._sorted_rows)
+
+    @staticmethod
+    def _id_key(card_id):
+        # Canonical uuid strings are stored as integers, anything else as is
+        try:
+            key = uuid.UUID(card_id)
+        except (ValueError, TypeError, AttributeError):
+            return card_id
+        return key.int if str(key) == card_id else card_id
+
+    def _key_at(self, row):
+        odd = self._odd_ids.get(row)
+        if odd is not None:
+            return odd
+        return (self._id_hi[row] << 64) | self._id_lo[row]
+
+    def _view(self, row):
+        return CardView(self, self._key_at(row))
+
+    def _store_card(self, card, position):
+        self._index_card(card)
+        key = self._id_key(card.id)
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self)
+            self._rows[key] = row
+            self._fronts.append(card.front)
+            self._backs.append(card.back)
+            self._id_hi.append(0)
+            self._id_lo.append(0)
+            self._scores.append(0)
+            self._due.append(0)
+            self._intervals.append(0)
+            self._positions.append(0)
+            self._priorities.append(0)
+            self._histories.append(None)
+        else:
+            self._fronts[row] = card.front
+            self._backs[row] = card.back
+
+        if isinstance(key, str):
+            self._odd_ids[row] = key
+        else:
+            self._id_hi[row] = key >> 64
+            self._id_lo[row] = key & 0xFFFFFFFFFFFFFFFF
+        self._scores[row] = card.last_score
+        self._due[row] = card.due
+        self._intervals[row] = card.interval
+        self._positions[row] = position
+        self._histories[row] = getattr(card, "history", None)
+        self._priorities[row] = card_priority(card)
+        self._sorted_rows = None
+        self._dirty = True
+
+    def add_card(self, card: Flashcard):
+        self._tail += 1
+        self._store_card(card, self._tail)
+
+    def insert_card_sorted(self, card):
+        # New cards go in front of the cards that share their score
+        self._head -= 1
+        self._store_card(card, self._head)
+
+    def add_cards(self, cards):
+        for card in cards:
+            self.add_card(card)
+
+    import_text = Deck.import_text
+    _built_indexes = Deck._built_indexes
+    _index_card = Deck._index_card
+    _unindex_card = Deck._unindex_card
+
+    def remove_card(self, card_id):
+        if self._built_indexes():
+            card = self.get_card(card_id)
+            if card is not None:
+                self._unindex_card(card)
+
+        row = self._rows.pop(self._id_key(card_id), None)
+        if row is None:
+            return False
+
+        # Moves the last row into the gap so the arrays stay dense
+        last = len(self) - 1
+        self._odd_ids.pop(row, None)
+        if row != last:
+            last_key = self._key_at(last)
+            self._rows[last_key] = row
+            if isinstance(last_key, str):
+                self._odd_ids[row] = self._odd_ids.pop(last)
+            for column in (self._id_hi, self._id_lo, self._fronts, self._backs,
+                           self._scores, self._due, self._intervals, self._positions,
+                           self._priorities, self._histories):
+                column[row] = column[last]
+        for column in (self._id_hi, self._id_lo, self._fronts, self._backs,
+                       self._scores, self._due, self._intervals, self._positions,
+                       self._priorities, self._histories):
+            column.pop()
+        self._sorted_rows = None
+        self._dirty = True
+        return True
+
+    def get_card(self, card_id):
+        key = self._id_key(card_id)
+        return CardView(self, key) if key in self._rows else None
+
+    def index_of(self, card_id):
+        '''
+        Returns the position of a card in the sorted cards, or None
+        '''
+
+        row = self._rows.get(self._id_key(card_id))
+        if row is None:
+            return None
+        rows = self.cards.rows
+        if self._position_index is None or self._position_index[0] is not rows:
+            index = array("l", bytes(len(rows) * array("l").itemsize))
+            for i, sorted_row in enumerate(rows):
+                index[sorted_row] = i
+            self._position_index = (rows, index)
+        return self._position_index[1][row]
+
+    def sort_by_score(self):
+        # The sorted rows are rebuilt whenever a score changes
+        pass
+
+    def rate_card(self, card: Flashcard, rating, now=None):
+        now = time.time() if now is None else now
+
+        # The deck's columns are changed through a view of the card, even
+        # when {card} is the Flashcard it was added with
+        row = self._rows.get(self._id_key(card.id))
+        view = card if row is None or isinstance(card, CardView) else self._view(row)
+        view.last_score = rating
+        record_rating(view, rating, now)
+        self.score += rating
+        Scheduler.update_interval(view, rating, now, self.scheduler_parameters)
+        if view is not card:
+            card.last_score, card.history = view.last_score, view.history
+            card.due, card.interval = view.due, view.interval
+
+        # Moves the card to the end of its new priority group
+        if row is not None:
+            self._tail += 1
+            self._positions[row] = self._tail
+            self._sorted_rows = None
+            self._dirty = True
+
+    def due_cards(self, now=None, limit=None):
+        '''
+        Returns the cards that are due for review, earliest first
+        Scans the due column, so it costs O(n) instead of the heap's O(k log n)
+        '''
+
+        now = time.time() if now is None else now
+        due = ((self._due[row], self._positions[row], row)
+               for row in range(len(self)) if self._due[row] <= now)
+        rows = sorted(due) if limit is None else heapq.nsmallest(limit, due)
+        return [self._view(row) for _, _, row in rows]
+
+    def by_recall(self, now=None, limit=None, due_only=False):
+        '''
+        Returns the cards the RecallModel expects to be forgotten first
+        The due and interval columns are scored in place
+        '''
+
+        now = time.time() if now is None else now
+        order = RecallModel.order(self._due, self._intervals, now, limit, due_only)
+        return [self._view(row) for row in order]
+
+    def max_score(self):
+        return len(self) * 2
+
     def save_to_file(self, filename):
-        data = {
-            "name": self.name,
-            "score": self.score,
-            "cards": [self._card_to_dict(c) for c in self.cards]
-        }
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
+        with self._io_lock:
+            self._dirty = False
+            header = Deck._header_to_dict(self)
+            try:
+                with atomic_open(filename) as f:
+                    f.write(json.dumps(header) + "\n")
+                    for card in self.cards:
+                        f.write(json.dumps(Deck._card_to_dict(card)) + "\n")
+            except BaseException:
+                self._dirty = True
+                raise
+
+            ReviewJournal(filename).clear()
+            self._save_search_index(filename)
+            self.filename = filename
+
+    _save_search_index = Deck._save_search_index
+    search_index = Deck.search_index
+    search = Deck.search
+    duplicate_index = Deck.duplicate_index
+    find_duplicates = Deck.find_duplicates
+    duplicate_report = Deck.duplicate_report
+
+    def save_changes(self, filename=None):
+        # Compact decks are too large to track changes for, so they are
+        # always written as a full snapshot
+        self.save_to_file(filename or self.filename)
+
+    def _apply_record(self, record):
+        '''
+        Applies a single review journal record to the deck
+        '''
+
+        op = record["op"]
+        if op == "add":
+            card = Deck._card_from_dict(record["card"])
+            if record.get("front"):
+                self.insert_card_sorted(card)
+            else:
+                self.add_card(card)
+        elif op == "remove":
+            self.remove_card(record["id"])
+        elif op == "rate":
+            card = self.get_card(record["id"])
+            if card is None:
+                return
+            self.rate_card(card, record["rating"], record.get("at", record["due"] - record["interval"]))
+            card.due = record["due"]
+            card.interval = record["interval"]
+        elif op == "meta":
+            self.name = record["name"]
+            self.score = record["score"]
 
     @classmethod
     def load_from_file(cls, filename):
         if not os.path.exists(filename):
             return None
         with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            deck = cls(data["name"])
-            deck.score = data.get("score", 0)
-            for card_data in data["cards"]:
-                card = Flashcard(
-                    front=card_data["front"],
-                    back=card_data["back"],
-                    card_id=card_data["id"],
-                )
-                card.last_score = card_data.get("last_score", 0)
-                deck.cards.append(card)
-                deck.card_map[card.id] = card
-            return deck
+            header, cards = Deck._read_deck_stream(f)
+            deck = cls(header["name"])
+            deck.score = header.get("score", 0)
+            for card in cards:
+                deck.add_card(card)
+
+        deck._search_index = SearchIndex.load(filename)
+        complete = ReviewJournal(filename).replay(deck)
+        deck.filename = filename
+        deck.scheduler_parameters = Scheduler.parameters_for(filename)
+        deck._dirty = not complete
+        return deck
+
+class MappedDeck:
+    '''
+    A read-only deck backed by a memory-mapped binary deck file
+
+    Opening the file only reads its header. The columns are memoryviews
+    straight into the mapping, so get_card and iteration only touch the
+    pages of the cards they read. The file is laid out as:
+
+    - header: magic, version, byte order, card count, length of the JSON details
+    - JSON details: deck name, score and history size, padded to 8 bytes
+    - string offsets: 3 * count + 1 uint64, card k's id, front and back are
+      heap[offsets[3k]:offsets[3k+1]], [3k+1:3k+2] and [3k+2:3k+3]
+    - due and interval: count float64 each
+    - history times: count * history size float64, oldest first (version 2)
+    - id index: count uint64 id hashes in ascending order, then count uint64
+      rows in the same order
+    - last_score: count int8
+    - flags: count uint8, whether due and interval were ints in the JSON deck
+    - history lengths: count uint8, then history ratings: count * history
+      size int8 (version 2)
+    - string heap: UTF-8 text
+
+    Cards are stored in the deck's sorted order, so save() followed by
+    to_deck() gives back the same JSON deck file.
+    '''
+
+    MAGIC = b"MKDB"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHBxQI")
+
+    DUE_IS_INT = 1
+    INTERVAL_IS_INT = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        self._views = []
+
+        # Lookups jump around the file, reading ahead would map pages nobody asked for
+        if hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_RANDOM)
+
+        magic, version, little_endian, count, meta_length = self.HEADER.unpack_from(self._mmap)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a binary deck file")
+        if version > self.VERSION:
+            self.close()
+            raise ValueError(f"Unsupported binary deck version {version}")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            self.close()
+            raise ValueError(f"{filename} was written on a machine with a different byte order")
+
+        position = self.HEADER.size
+        meta = json.loads(self._mmap[position:position + meta_length])
+        self.name = meta["name"]
+        self.score = meta["score"]
+        self._count = count
+        # Version 1 files have no rating histories
+        self._history_size = meta.get("history_size", 0)
+        history_length = count * self._history_size
+        position = self._align(position + meta_length)
+
+        self._offsets, position = self._column(position, "Q", 3 * count + 1)
+        self._due, position = self._column(position, "d", count)
+        self._intervals, position = self._column(position, "d", count)
+        self._history_times, position = self._column(position, "d", history_length)
+        self._hashes, position = self._column(position, "Q", count)
+        self._rows, position = self._column(position, "Q", count)
+        self._scores, position = self._column(position, "b", count)
+        self._flags, position = self._column(position, "B", count)
+        self._history_lengths, position = self._column(position, "B", count if history_length else 0)
+        self._history_ratings, position = self._column(position, "b", history_length)
+        self._heap = self._slice(position, len(self._mmap))
 
     @staticmethod
-    def _card_to_dict(card: Flashcard):
-        return {
-            "id": card.id,
-            "front": card.front,
-            "back": card.back,
-            "last_score": getattr(card, "last_score", 0)
-        }
\ No newline at end of file
+    def _align(position):
+        return (position + 7) & ~7
+
+    def _slice(self, start, end):
+        view = memoryview(self._mmap)[start:end]
+        self._views.append(view)
+        return view
+
+    def _column(self, position, typecode, length):
+        end = position + length * array(typecode).itemsize
+        column = self._slice(position, end).cast(typecode)
+        self._views.append(column)
+        return column, end
+
+    @staticmethod
+    def _id_hash(card_id):
+        return int.from_bytes(hashlib.blake2b(card_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+    @classmethod
+    def save(cls, deck, filename):
+        '''
+        Writes any deck, in its sorted order, as a binary deck file
+        '''
+
+        offsets = array("Q", [0])
+        due, intervals = array("d"), array("d")
+        scores, flags = array("b"), array("B")
+        history_size = RatingHistory.SIZE
+        history_times, history_ratings, history_lengths = array("d"), array("b"), array("B")
+        hashes = []
+        texts = []
+        size = 0
+        for card in deck.cards:
+            for text in (card.id, card.front, card.back):
+                encoded = text.encode("utf-8")
+                texts.append(encoded)
+                size += len(encoded)
+                offsets.append(size)
+            due.append(card.due)
+            intervals.append(card.interval)
+            scores.append(card.last_score)
+            flags.append((cls.DUE_IS_INT if isinstance(card.due, int) else 0) |
+                         (cls.INTERVAL_IS_INT if isinstance(card.interval, int) else 0))
+            hashes.append(cls._id_hash(card.id))
+
+            history = list(getattr(card, "history", None) or ())
+            unused = history_size - len(history)
+            history_times.extend([at for at, _ in history] + [0.0] * unused)
+            history_ratings.extend([rating for _, rating in history] + [0] * unused)
+            history_lengths.append(len(history))
+
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        meta = json.dumps({"name": deck.name, "score": deck.score, "history_size": history_size}).encode("utf-8")
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, sys.byteorder == "little", len(hashes), len(meta))
+        padding = b"\0" * (cls._align(len(header) + len(meta)) - len(header) - len(meta))
+
+        with atomic_open(filename, binary=True) as f:
+            f.write(header + meta + padding)
+            for column in (offsets, due, intervals, history_times, array("Q", (hashes[row] for row in order)),
+                           array("Q", order), scores, flags, history_lengths, history_ratings):
+                column.tofile(f)
+            f.write(b"".join(texts))
+
+    @classmethod
+    def load_from_file(cls, filename):
+        if not os.path.exists(filename):
+            return None
+        return cls(filename)
+
+    def close(self):
+        '''
+        Unmaps the file, cards read from the deck stay usable
+        '''
+
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def max_score(self):
+        return self._count * 2
+
+    @property
+    def cards(self):
+        return CompactCardView(self, range(self._count))
+
+    def _text(self, index):
+        return str(self._heap[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def _view(self, row):
+        # Called by CompactCardView for each card it hands out
+        text = 3 * row
+        flags = self._flags[row]
+        due = self._due[row]
+        interval = self._intervals[row]
+        card = Flashcard(self._text(text + 1), self._text(text + 2), card_id=self._text(text),
+                         created_at=int(due) if flags & self.DUE_IS_INT else due)
+        card.last_score = self._scores[row]
+        card.interval = int(interval) if flags & self.INTERVAL_IS_INT else interval
+
+        if self._history_size and self._history_lengths[row]:
+            start = row * self._history_size
+            end = start + self._history_lengths[row]
+            card.history = RatingHistory(zip(self._history_times[start:end], self._history_ratings[start:end]))
+        return card
+
+    def get_card(self, card_id):
+        '''
+        Finds a card by binary search on the id index, or returns None
+        '''
+
+        key = self._id_hash(card_id)
+        i = bisect.bisect_left(self._hashes, key)
+        while i < self._count and self._hashes[i] == key:
+            row = self._rows[i]
+            if self._text(3 * row) == card_id:
+                return self._view(row)
+            i += 1
+        return None
+
+    def due_cards(self, now=None, limit=None):
+        '''
+        Returns the cards that are due for review, earliest first
+        '''
+
+        now = time.time() if now is None else now
+        due = self._due
+        rows = (row for row in range(self._count) if due[row] <= now)
+        key = lambda row: (due[row], row)
+        rows = heapq.nsmallest(limit, rows, key=key) if limit is not None else sorted(rows, key=key)
+        return [self._view(row) for row in rows]
+
+    def by_recall(self, now=None, limit=None, due_only=False):
+        '''
+        Returns the cards the RecallModel expects to be forgotten first
+        The due and interval columns are scored straight from the mapping
+        '''
+
+        now = time.time() if now is None else now
+        order = RecallModel.order(self._due, self._intervals, now, limit, due_only)
+        return [self._view(row) for row in order]
+
+    def to_deck(self, deck_class=None):
+        '''
+        Reads every card into a new, editable deck
+        '''
+
+        deck = (deck_class or Deck)(self.name)
+        deck.score = self.score
+        deck.add_cards(self.cards)
+        return deck
+
+class CardView:
+    '''
+    A Flashcard-like handle on one card of a CompactDeck
+    Reading or setting an attribute goes straight to the deck's arrays
+    '''
+
+    __slots__ = ("_deck", "_key")
+
+    def __init__(self, deck, key):
+        self._deck = deck
+        self._key = key
+
+    def __eq__(self, other):
+        return isinstance(other, CardView) and other._deck is self._deck and other._key == self._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    @property
+    def _row(self):
+        return self._deck._rows[self._key]
+
+    @property
+    def id(self):
+        key = self._key
+        return key if isinstance(key, str) else str(uuid.UUID(int=key))
+
+    @property
+    def front(self):
+        return self._deck._fronts[self._row]
+
+    @property
+    def back(self):
+        return self._deck._backs[self._row]
+
+    @property
+    def last_score(self):
+        return self._deck._scores[self._row]
+
+    @last_score.setter
+    def last_score(self, score):
+        self._deck._scores[self._row] = score
+        self._deck._priorities[self._row] = card_priority(self)
+        self._deck._sorted_rows = None
+
+    @property
+    def history(self):
+        return self._deck._histories[self._row]
+
+    @history.setter
+    def history(self, history):
+        self._deck._histories[self._row] = history
+        self._deck._priorities[self._row] = card_priority(self)
+        self._deck._sorted_rows = None
+
+    @property
+    def due(self):
+        return self._deck._due[self._row]
+
+    @due.setter
+    def due(self, due):
+        self._deck._due[self._row] = due
+
+    @property
+    def interval(self):
+        return self._deck._intervals[self._row]
+
+    @interval.setter
+    def interval(self, interval):
+        self._deck._intervals[self._row] = interval
+
+class CompactCardView:
+    '''
+    Sequence over a CompactDeck's sorted cards that makes CardViews on demand
+    '''
+
+    def __init__(self, deck, rows):
+        self.deck = deck
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return (self.deck._view(row) for row in self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.deck._view(row) for row in self.rows[index]]
+        return self.deck._view(self.rows[index])
+
+# Deck methods timed while instrumentation is enabled
+DECK_HOT_PATHS = [
+    "cards", "sort_by_score", "quicksort", "add_card", "add_cards", "insert_card_sorted",
+    "remove_card", "rate_card", "due_cards", "search", "find_duplicates",
+    "save_to_file", "save_changes", "load_from_file",
+]
+for deck_class in (Deck, CompactDeck, SqliteDeck, MappedDeck):
+    instrumentation.register(deck_class, DECK_HOT_PATHS)
+instrumentation.register(StudySession, ["rate"])
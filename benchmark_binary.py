@@ -0,0 +1,86 @@
+'''
+Compares opening a deck and looking up cards in the JSON Lines and binary formats
+
+Each format is measured in a fresh process, so its resident memory is not
+mixed up with the other's. MappedDeck pages that were read count towards
+the RSS too, since they are mapped into the process.
+
+Usage: python benchmark_binary.py [number of cards]
+'''
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from backend import Flashcard, Deck, MappedDeck
+
+LOOKUPS = 100
+
+def rss_kib():
+    '''
+    Returns the resident memory of this process in KiB, or None if unknown
+    '''
+
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def write_decks(tmp, count):
+    deck = Deck("Benchmark")
+    deck.add_cards(Flashcard(f"Front {i}", f"Back {i}", created_at=0) for i in range(count))
+    json_filename = os.path.join(tmp, "deck.jsonl")
+    binary_filename = os.path.join(tmp, "deck.mkdb")
+    deck.save_to_file(json_filename)
+    MappedDeck.save(deck, binary_filename)
+    return json_filename, binary_filename, [card.id for card in deck.cards]
+
+def child(deck_format, filename, ids_filename):
+    '''
+    Opens the deck, looks up random cards and prints the timings and RSS
+    '''
+
+    with open(ids_filename, encoding="utf-8") as f:
+        ids = f.read().split()
+    ids = random.Random(0).sample(ids, min(LOOKUPS, len(ids)))
+    deck_class = MappedDeck if deck_format == "binary" else Deck
+
+    rss = [rss_kib()]
+    start = time.perf_counter()
+    deck = deck_class.load_from_file(filename)
+    opened = time.perf_counter()
+    rss.append(rss_kib())
+    for card_id in ids:
+        deck.get_card(card_id)
+    looked_up = time.perf_counter()
+    rss.append(rss_kib())
+
+    if rss[0] is None:
+        growth = "n/a"
+    else:
+        growth = f"+{(rss[1] - rss[0]) / 1024:.1f} MiB after open, +{(rss[2] - rss[0]) / 1024:.1f} MiB after lookups"
+    print(f"{deck_format:>8}: open {opened - start:8.4f}s  {len(ids)} get_card {looked_up - opened:8.4f}s  "
+          f"RSS {growth}")
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        json_filename, binary_filename, ids = write_decks(tmp, count)
+        ids_filename = os.path.join(tmp, "ids.txt")
+        with open(ids_filename, "w", encoding="utf-8") as f:
+            f.write("\n".join(ids))
+
+        print(f"{count} cards, JSON {os.path.getsize(json_filename) / 2**20:.1f} MiB, "
+              f"binary {os.path.getsize(binary_filename) / 2**20:.1f} MiB")
+        for deck_format, filename in (("json", json_filename), ("binary", binary_filename)):
+            subprocess.run([sys.executable, __file__, "--child", deck_format, filename, ids_filename], check=True)
+
+if __name__ == "__main__":
+    main()
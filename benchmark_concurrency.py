@@ -0,0 +1,194 @@
+'''
+Stress tests a Deck shared by many threads and compares its throughput
+with a Deck behind one global lock
+
+Writer threads rate, add and remove cards while reader threads iterate
+the cards, count them, search them, look for duplicates and save the
+deck. Every reader checks that what it sees is consistent, and the deck's own structures are checked once
+all threads stop. The same work is then run with every call, reads
+included, made under one lock, as the deck would have to be used
+without its snapshots.
+
+Usage: python benchmark_concurrency.py [--cards 10000] [--writers 4] [--readers 4] [--seconds 3]
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from backend import Deck, Flashcard
+
+class GlobalLockDeck:
+    '''
+    A Deck where every call, reads too, holds a single lock
+    '''
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.deck, name)
+        if not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attribute(*args, **kwargs)
+        return locked
+
+    def iterate(self, read):
+        # Without snapshots a reader holds the lock for as long as it reads
+        with self.lock:
+            return read(self.deck.snapshot())
+
+# Searches made by every reader, each finds cards the writers add and remove
+QUERIES = [("added", None), ("back*", 100), ('"added 1"', None)]
+
+def make_deck(count, seed=0):
+    rng = random.Random(seed)
+    deck = Deck("Stress")
+    cards = []
+    for i in range(count):
+        card = Flashcard(f"Front {i}", f"Back {i}", created_at=0)
+        card.last_score = rng.randint(0, 2)
+        cards.append(card)
+    deck.add_cards(cards)
+    return deck
+
+def check_snapshot(snapshot):
+    '''
+    Raises AssertionError unless the snapshot holds each card once
+    '''
+
+    ids = {card.id for card in snapshot.cards}
+    assert len(ids) == len(snapshot.cards), "a card is in the snapshot twice"
+    return len(ids)
+
+def check_deck(deck):
+    '''
+    Raises AssertionError unless the deck's structures agree with each other
+    '''
+
+    ids = [card.id for card in deck.cards]
+    assert len(ids) == len(set(ids)) == len(deck) == len(deck.scheduler), "card counts differ"
+    assert set(ids) == set(deck.card_map) == set(deck._card_bucket), "card ids differ"
+    for key, bucket in deck._buckets.items():
+        assert bucket, "empty priority bucket"
+        assert all(deck._card_bucket[card_id] == key for card_id in bucket), "card in the wrong bucket"
+
+def stress(deck, seconds, writers=4, readers=4, tmp=None, locked=None):
+    '''
+    Runs the writer and reader threads on {deck} for {seconds}, through
+    {locked} (a GlobalLockDeck) if given. Returns {"writes": ..., "reads": ...,
+    "searches": ..., "saves": ..., "errors": [...], "score": ...}
+    where score is what the ratings should have added to the deck's score
+    '''
+
+    target = locked or deck
+    # Writers rate the cards the deck started with, which are never removed
+    ids = [card.id for card in deck.cards]
+    iterate = locked.iterate if locked is not None else (lambda read: read(deck.snapshot()))
+    until = time.monotonic() + seconds
+    counts = {"writes": 0, "reads": 0, "searches": 0, "saves": 0, "score": 0}
+    errors = []
+    count_lock = threading.Lock()
+
+    def count(name, amount=1):
+        with count_lock:
+            counts[name] += amount
+
+    def writer(seed):
+        rng = random.Random(seed)
+        added = []
+        writes = score = 0
+        try:
+            while time.monotonic() < until:
+                choice = rng.random()
+                if choice < 0.1:
+                    card = Flashcard(f"Added {seed} {writes}", "Back")
+                    target.add_card(card)
+                    added.append(card.id)
+                elif choice < 0.2 and added:
+                    target.remove_card(added.pop(rng.randrange(len(added))))
+                else:
+                    card = target.get_card(rng.choice(ids))
+                    rating = rng.randint(0, 2)
+                    target.rate_card(card, rating)
+                    score += rating
+                writes += 1
+        except Exception as e:
+            errors.append(repr(e))
+        count("writes", writes)
+        count("score", score)
+
+    def search(rng):
+        for query, limit in QUERIES:
+            for card in target.search(query, limit=limit):
+                assert "added" in card.front.lower() or query == "back*", f"{card.front} does not match {query}"
+        card = target.get_card(rng.choice(ids))
+        assert card not in target.find_duplicates(card), "a card duplicates itself"
+        return len(QUERIES) + 1
+
+    def reader(seed):
+        rng = random.Random(seed)
+        reads = searches = saves = 0
+        filename = os.path.join(tmp, f"reader{seed}.jsonl") if tmp else None
+        try:
+            while time.monotonic() < until:
+                iterate(lambda snapshot: (check_snapshot(snapshot), sum(card.last_score for card in snapshot.cards)))
+                target.max_score()
+                searches += search(rng)
+                if reads % 20 == 0:
+                    target.duplicate_report()
+                    searches += 1
+                reads += 1
+                if filename and reads % 20 == 0:
+                    target.save_to_file(filename)
+                    saves += 1
+        except Exception as e:
+            errors.append(repr(e))
+        count("reads", reads)
+        count("searches", searches)
+        count("saves", saves)
+
+    threads = ([threading.Thread(target=writer, args=(i,)) for i in range(writers)] +
+               [threading.Thread(target=reader, args=(i,)) for i in range(readers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts["errors"] = errors
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress tests a Deck shared by many threads")
+    parser.add_argument("--cards", type=int, default=10000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("snapshots", "global lock"):
+            deck = make_deck(args.cards)
+            locked = GlobalLockDeck(deck) if label == "global lock" else None
+            result = stress(deck, args.seconds, args.writers, args.readers, tmp, locked)
+            check_deck(deck)
+            if deck.score != result["score"]:
+                result["errors"].append(f"score {deck.score} != {result['score']}")
+            print(f"{label:>12}: {result['writes'] / args.seconds:10.0f} writes/s "
+                  f"{result['reads'] / args.seconds:8.0f} reads/s "
+                  f"{result['searches'] / args.seconds:8.0f} searches/s {result['saves']:5} saves "
+                  f"{len(result['errors'])} errors")
+            for error in result["errors"]:
+                print(f"    {error}")
+            failed = failed or bool(result["errors"])
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
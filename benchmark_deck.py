@@ -0,0 +1,81 @@
+'''
+Times bulk adds, ratings, searches, duplicate checks, deletes and text imports on Deck and CompactDeck
+
+The list-backed layout Deck used to have is timed on a smaller deck for
+comparison, because its deletes shift the whole list and go quadratic
+
+Usage: python benchmark_deck.py [number of cards]
+'''
+
+import os
+import random
+import sys
+import tempfile
+import time
+from backend import Flashcard, Deck, CompactDeck
+
+# Made-up words so card texts overlap about as much as real ones do
+WORDS = ["".join(random.Random(i).choices("abcdefghijklmnopqrstuvwxyz", k=3 + i % 6))
+         for i in range(5000)]
+
+def random_words(count):
+    return " ".join(random.choices(WORDS, k=count))
+
+def timed(label, func):
+    start = time.perf_counter()
+    func()
+    print(f"  {label:<24} {time.perf_counter() - start:8.3f}s")
+
+def run(deck_class, cards):
+    print(f"{deck_class.__name__} with {len(cards)} cards")
+    deck = deck_class("Benchmark")
+    ids = [card.id for card in cards]
+    random.shuffle(ids)
+
+    timed("insert_card_sorted", lambda: [deck.insert_card_sorted(card) for card in cards])
+    timed("rate_card", lambda: [deck.rate_card(deck.get_card(card_id), random.randint(0, 2), now=0)
+                                for card_id in ids])
+    timed("sorted view", lambda: deck.cards)
+    timed("build search index", lambda: deck.search_index)
+    timed("1000 searches", lambda: [deck.search(f'"front {i}" back*', limit=20) for i in range(1000)])
+    timed("build duplicate index", lambda: deck.duplicate_index)
+    timed("1000 duplicate checks", lambda: [deck.find_duplicates(card) for card in cards[:1000]])
+    timed("duplicate report", lambda: deck.duplicate_report())
+    timed("index_of", lambda: [deck.index_of(card_id) for card_id in ids])
+    timed("remove_card", lambda: [deck.remove_card(card_id) for card_id in ids])
+
+def run_import(deck_class, count):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "cards.tsv")
+        with open(filename, "w", encoding="utf-8") as f:
+            for i in range(count):
+                f.write(f"Front {i}\tBack {i}\n")
+
+        deck = deck_class("Import")
+        timed(f"{deck_class.__name__}.import_text", lambda: deck.import_text(filename))
+
+def run_list(cards):
+    print(f"list layout with {len(cards)} cards")
+    card_list = []
+    ids = [card.id for card in cards]
+    random.shuffle(ids)
+    card_map = {card.id: card for card in cards}
+
+    timed("list.insert", lambda: [card_list.insert(0, card) for card in cards])
+    timed("list.remove", lambda: [card_list.remove(card_map[card_id]) for card_id in ids])
+
+def main():
+    random.seed(0)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cards = [Flashcard(f"Front {i} {random_words(6)}", f"Back {i} {random_words(3)}", created_at=0)
+             for i in range(count)]
+    run(Deck, cards)
+    run(CompactDeck, cards)
+    run_list(cards[:count // 10])
+
+    print(f"Importing {count * 5} cards from a text file")
+    run_import(Deck, count * 5)
+    run_import(CompactDeck, count * 5)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+'''
+Compares the memory used by a Deck and a CompactDeck loaded from the same file
+
+Usage: python benchmark_memory.py [number of cards]
+'''
+
+import os
+import sys
+import tempfile
+import tracemalloc
+from backend import Flashcard, Deck, CompactDeck
+
+def write_deck(filename, count):
+    deck = Deck("Benchmark")
+    for i in range(count):
+        card = Flashcard(f"Front {i}", f"Back {i}", created_at=0)
+        card.last_score = i % 3
+        deck.add_card(card)
+    deck.save_to_file(filename)
+
+def measure(deck_class, filename):
+    tracemalloc.start()
+    deck = deck_class.load_from_file(filename)
+    deck.cards
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "benchmark.jsonl")
+        write_deck(filename, count)
+
+        print(f"{count} cards")
+        results = {}
+        for deck_class in (Deck, CompactDeck):
+            size = results[deck_class] = measure(deck_class, filename)
+            print(f"{deck_class.__name__:>12}: {size / 2**20:8.1f} MiB ({size / count:.0f} bytes per card)")
+
+    print(f"CompactDeck uses {results[CompactDeck] / results[Deck]:.0%} of the memory of Deck")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+'''
+Load tests the study server with many simulated learners on this machine
+
+Starts study_server.py in its own process on a temporary directory of
+synthetic decks, then runs {clients} learners as asyncio tasks, each on
+its own keep-alive connection. A learner asks a deck for its next card,
+by due time or a share of the time lowest recall first, and rates it,
+and now and then adds or removes a card. Prints the
+requests per second and the latency percentiles of each request type.
+
+Usage: python benchmark_server.py [--clients 50] [--seconds 10] [--decks 4] [--cards 10000] [--workers 4]
+                                  [--recall 0.2]
+'''
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from backend import Deck, Flashcard
+from study_server import StudyClient
+
+def write_decks(directory, decks, cards):
+    for d in range(decks):
+        deck = Deck(f"Deck {d}")
+        deck.add_cards(Flashcard(f"Front {d} {i}", f"Back {d} {i}", created_at=0) for i in range(cards))
+        deck.save_to_file(os.path.join(directory, f"deck{d}.jsonl"))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+async def learner(port, keys, until, latencies, seed, recall=0.0):
+    rng = random.Random(seed)
+    client = StudyClient("127.0.0.1", port)
+
+    async def timed(kind, method, path, data=None):
+        start = time.perf_counter()
+        status, payload = await client.request(method, path, data)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        if status >= 500:
+            raise RuntimeError(f"{method} {path} failed: {payload}")
+        return status, payload
+
+    try:
+        while time.monotonic() < until:
+            key = rng.choice(keys)
+            if rng.random() < recall:
+                status, card = await timed("recall", "GET", client.path("decks", key, "next") + "?order=recall")
+            else:
+                status, card = await timed("next", "GET", client.path("decks", key, "next"))
+            if status == 200:
+                await timed("rate", "POST", client.path("decks", key, "cards", card["id"], "rate"),
+                            {"rating": rng.randint(0, 2)})
+            if rng.random() < 0.05:
+                status, card = await timed("add", "POST", client.path("decks", key, "cards"),
+                                           {"front": f"Front {rng.random()}", "back": "Back"})
+                await timed("remove", "DELETE", client.path("decks", key, "cards", card["id"]))
+    finally:
+        await client.close()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def load_test(port, clients, seconds, recall=0.0):
+    lister = StudyClient("127.0.0.1", port)
+    _, decks = await lister.request("GET", "/decks")
+    await lister.close()
+    keys = [deck["deck"] for deck in decks]
+
+    latencies = {}
+    start = time.perf_counter()
+    until = time.monotonic() + seconds
+    await asyncio.gather(*(learner(port, keys, until, latencies, seed, recall) for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{clients} clients, {total} requests in {elapsed:.1f}s: {total / elapsed:.0f} requests/s")
+    everything = sorted(value for values in latencies.values() for value in values)
+    for kind, values in [("all", everything)] + sorted(latencies.items()):
+        values = sorted(values)
+        print(f"{kind:>8}: {len(values):8} requests  p50 {percentile(values, 0.5) * 1000:7.2f} ms  "
+              f"p99 {percentile(values, 0.99) * 1000:7.2f} ms  max {values[-1] * 1000:7.2f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load tests the study server")
+    parser.add_argument("--clients", type=int, default=50, help="learners studying at once")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--decks", type=int, default=4)
+    parser.add_argument("--cards", type=int, default=10000, help="cards per deck")
+    parser.add_argument("--workers", type=int, default=4, help="server threads that read, order and save decks")
+    parser.add_argument("--recall", type=float, default=0.2, help="share of next card requests ordered by recall")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_decks(tmp, args.decks, args.cards)
+        port = free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "study_server.py"),
+                                   tmp, "--port", str(port), "--workers", str(args.workers)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_for_server(port))
+            asyncio.run(load_test(port, args.clients, args.seconds, args.recall))
+        finally:
+            server.terminate()
+            server.wait()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
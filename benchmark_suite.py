@@ -0,0 +1,256 @@
+'''
+Benchmarks the backend deck operations across deck sizes
+
+Every operation runs on a synthetic deck built from a fixed seed, once to
+time it and once under tracemalloc for its peak memory. Decks keep the
+cards they are given and operations change them, so each setup gets
+cards of its own and no result depends on what ran before it. Results
+can be saved as a JSON baseline and later runs compared against it.
+Nothing here imports tkinter, so it runs headless.
+
+Usage:
+    python benchmark_suite.py [--sizes 1000,10000,100000] [--decks Deck,CompactDeck]
+                              [--save baseline.json] [--compare baseline.json]
+                              [--tolerance 0.25]
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+import backend
+from backend import Flashcard
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_DECKS = ["Deck", "CompactDeck"]
+SEED = 0
+
+# Timings shorter than this are too noisy to flag as regressions
+MIN_SECONDS = 0.005
+
+def make_cards(count, seed=SEED):
+    '''
+    Returns {count} cards with ids, text and scores that only depend on {seed}
+    '''
+
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        card = Flashcard(f"Front {i} {rng.random():.6f}", f"Back {i}",
+                         card_id=str(uuid.UUID(int=rng.getrandbits(128))), created_at=0)
+        card.last_score = rng.randint(0, 2)
+        cards.append(card)
+    return cards
+
+def make_deck(deck_class, cards):
+    deck = deck_class("Benchmark")
+    deck.add_cards(cards)
+    return deck
+
+'''
+Operations
+
+Each one takes the deck class and the cards, does its setup, and returns
+a function that does the measured work
+'''
+def op_insert_card_sorted(deck_class, cards):
+    deck = deck_class("Benchmark")
+    return lambda: [deck.insert_card_sorted(card) for card in cards]
+
+def op_remove_card(deck_class, cards):
+    deck = make_deck(deck_class, cards)
+    ids = [card.id for card in cards]
+    random.Random(SEED).shuffle(ids)
+    return lambda: [deck.remove_card(card_id) for card_id in ids]
+
+def op_rate_card(deck_class, cards):
+    deck = make_deck(deck_class, cards)
+    rng = random.Random(SEED)
+    ratings = [(card.id, rng.randint(0, 2)) for card in cards]
+    return lambda: [deck.rate_card(deck.get_card(card_id), rating, now=0) for card_id, rating in ratings]
+
+def op_sort_by_score(deck_class, cards):
+    deck = make_deck(deck_class, cards)
+    for card in cards[::2]:
+        deck.get_card(card.id).last_score = 2 - card.last_score
+    return lambda: (deck.sort_by_score(), len(deck.cards))
+
+def op_by_recall(deck_class, cards):
+    deck = make_deck(deck_class, cards)
+    if not hasattr(deck, "by_recall"):
+        return None
+    rng = random.Random(SEED)
+    for card in deck.cards:
+        card.due, card.interval = rng.uniform(0, 100), rng.choice([0, 1, 10, 100])
+    return lambda: deck.by_recall(now=50)
+
+def op_quicksort(deck_class, cards):
+    deck = make_deck(deck_class, cards)
+    if not hasattr(deck, "quicksort"):
+        return None
+    return lambda: deck.quicksort(list(deck.cards), score=lambda card: card.last_score)
+
+def op_save_to_file(deck_class, cards, tmp):
+    deck = make_deck(deck_class, cards)
+    filename = os.path.join(tmp, "save.jsonl")
+    return lambda: deck.save_to_file(filename)
+
+def op_load_from_file(deck_class, cards, tmp):
+    filename = os.path.join(tmp, "load.jsonl")
+    make_deck(backend.Deck, cards).save_to_file(filename)
+    return lambda: deck_class.load_from_file(filename)
+
+def op_read_header(deck_class, cards, tmp):
+    filename = os.path.join(tmp, "header.jsonl")
+    make_deck(backend.Deck, cards).save_to_file(filename)
+    return lambda: backend.LazyDeck.load_from_file(filename, deck_class)
+
+def op_study_session(deck_class, cards, tmp):
+    '''
+    Loads a saved deck, rates up to 200 due cards and saves the changes
+    '''
+
+    filename = os.path.join(tmp, "study.jsonl")
+    make_deck(backend.Deck, cards).save_to_file(filename)
+    rng = random.Random(SEED)
+
+    def study():
+        deck = deck_class.load_from_file(filename)
+        session = backend.StudySession(deck, now=1, limit=200)
+        for card in session:
+            session.rate(rng.randint(0, 2))
+        deck.save_changes()
+    return study
+
+OPERATIONS = {
+    "insert_card_sorted": op_insert_card_sorted,
+    "remove_card": op_remove_card,
+    "rate_card": op_rate_card,
+    "sort_by_score": op_sort_by_score,
+    "by_recall": op_by_recall,
+    "quicksort": op_quicksort,
+    "save_to_file": op_save_to_file,
+    "load_from_file": op_load_from_file,
+    "read_header": op_read_header,
+    "study_session": op_study_session,
+}
+
+# Operations that read or write files get a temporary directory
+FILE_OPERATIONS = {"save_to_file", "load_from_file", "read_header", "study_session"}
+
+def measure(operation, deck_class, size):
+    '''
+    Returns {"seconds": ..., "peak_bytes": ...} for one operation on {size}
+    cards, or None if the deck class does not have it
+    '''
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def setup():
+            cards = make_cards(size)
+            args = (deck_class, cards, tmp) if operation in FILE_OPERATIONS else (deck_class, cards)
+            return OPERATIONS[operation](*args)
+
+        work = setup()
+        if work is None:
+            return None
+        start = time.perf_counter()
+        work()
+        seconds = time.perf_counter() - start
+
+        # Runs again from fresh setup so the peak only covers the work
+        work = setup()
+        tracemalloc.start()
+        work()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+def run(sizes, deck_names, operations=OPERATIONS):
+    results = {}
+    for deck_name in deck_names:
+        deck_class = getattr(backend, deck_name)
+        for size in sizes:
+            for operation in operations:
+                result = measure(operation, deck_class, size)
+                if result is None:
+                    continue
+                results.setdefault(deck_name, {}).setdefault(str(size), {})[operation] = result
+                print(f"{deck_name:>12} {size:>8} {operation:<20} "
+                      f"{result['seconds']:10.4f}s {result['peak_bytes'] / 2**20:10.2f} MiB")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+def compare(report, baseline, tolerance):
+    '''
+    Returns a line for every result that is slower or larger than the
+    baseline by more than {tolerance}
+    '''
+
+    regressions = []
+    for deck_name, sizes in report["results"].items():
+        for size, operations in sizes.items():
+            for operation, result in operations.items():
+                old = baseline["results"].get(deck_name, {}).get(size, {}).get(operation)
+                if old is None:
+                    continue
+                for metric in ("seconds", "peak_bytes"):
+                    if not old[metric] or (metric == "seconds" and result[metric] < MIN_SECONDS):
+                        continue
+                    if result[metric] > old[metric] * (1 + tolerance):
+                        regressions.append(
+                            f"{deck_name} {size} {operation} {metric}: "
+                            f"{old[metric]} -> {result[metric]} ({result[metric] / old[metric] - 1:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the backend deck operations")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated deck sizes, up to 1000000")
+    parser.add_argument("--decks", default=",".join(DEFAULT_DECKS),
+                        help="comma separated deck classes from backend")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help="comma separated operations to run")
+    parser.add_argument("--save", help="writes the results to this JSON file")
+    parser.add_argument("--compare", help="flags results worse than this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a result is flagged (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    operations = args.operations.split(",")
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+
+    report = run(sizes, args.decks.split(","), operations)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
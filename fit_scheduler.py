@@ -0,0 +1,363 @@
+'''
+Fits the scheduler's intervals to how each user actually forgets
+
+Every rating after a card's first one tests the interval before it: the
+RecallModel expects the card to be remembered with probability
+TARGET ** (time since the last review / interval), and a rating of
+Again means it was not. The intervals the Scheduler would have given
+are replayed for every card with candidate INITIAL_INTERVALS and
+INTERVAL_GROWTH, and the ones with the lowest log loss over all the
+reviews are kept.
+
+A user is a directory of deck files and SQLite collections. Reviews are
+read from each card's rating history and the review journals, one deck
+file at a time, in a process pool over the deck files. Each user is then
+fitted in the same pool. The fitted parameters are written to the
+user's directory as SCHEDULER_FILE, which the app loads together with
+the decks.
+
+The loss is computed for all the cards at once with NumPy when it is
+installed, one review at a time otherwise.
+
+Usage: python fit_scheduler.py DIRECTORY [DIRECTORY ...] [--workers N] [--dry-run]
+'''
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import backend
+from backend import Deck, RatingHistory, RecallModel, ReviewJournal, Scheduler, SCHEDULER_FILE, atomic_open
+
+DECK_EXTENSIONS = (".jsonl", ".json")
+COLLECTION_EXTENSIONS = (".db", ".sqlite")
+
+# Users with fewer reviews than this keep the default parameters
+MIN_REVIEWS = 100
+
+# Bounds of the fitted parameters
+MIN_INTERVAL = 60
+MAX_INTERVAL = 365 * 24 * 60 * 60
+MIN_GROWTH = 1.0
+MAX_GROWTH = 10.0
+
+# The search stops once its steps change the parameters by less than 1%
+TOLERANCE = 0.01
+
+# Keeps the log loss finite for reviews the parameters call certain
+EPSILON = 1e-6
+
+class ReviewLog:
+    '''
+    The ratings of many cards, each card's ratings one after the other
+    Times and ratings are typed arrays, so millions of reviews stay small
+    and are cheap to send between processes
+    '''
+
+    def __init__(self):
+        # Number of ratings of each card, only cards rated at least twice
+        self.lengths = array("q")
+        self.times = array("d")
+        self.ratings = array("b")
+
+        # Per step arrays for the NumPy loss, built on first use
+        self._steps = None
+
+    def __len__(self):
+        '''
+        Returns the number of reviews that test an interval
+        '''
+
+        return len(self.times) - len(self.lengths)
+
+    def __getstate__(self):
+        return self.lengths, self.times, self.ratings
+
+    def __setstate__(self, state):
+        self.lengths, self.times, self.ratings = state
+        self._steps = None
+
+    def add(self, entries):
+        '''
+        Adds the (time, rating) pairs of one card
+        '''
+
+        if len(entries) < 2:
+            return
+        entries = sorted(entries)
+        self.lengths.append(len(entries))
+        self.times.extend(at for at, _ in entries)
+        self.ratings.extend(rating for _, rating in entries)
+        self._steps = None
+
+    def extend(self, other):
+        self.lengths.extend(other.lengths)
+        self.times.extend(other.times)
+        self.ratings.extend(other.ratings)
+        self._steps = None
+
+    def loss(self, parameters):
+        '''
+        Returns the mean log loss of the RecallModel over every review when
+        intervals come from {parameters}, a tuple of the initial intervals
+        for each rating followed by the growth of Okay and Good
+        '''
+
+        if not len(self):
+            return 0.0
+        if backend.np is None:
+            return self._python_loss(parameters)
+        return self._numpy_loss(parameters)
+
+    def _python_loss(self, parameters):
+        initial, growth = split_parameters(parameters)
+        log_target = math.log(RecallModel.TARGET)
+        times, ratings = self.times, self.ratings
+        total = 0.0
+        start = 0
+        for length in self.lengths:
+            interval = 0.0
+            for i in range(start, start + length - 1):
+                rating = ratings[i]
+                interval = max(initial[rating], interval * growth[rating])
+                recall = math.exp(log_target * max(times[i + 1] - times[i], 0.0) / interval)
+                recall = min(max(recall, EPSILON), 1 - EPSILON)
+                total -= math.log(recall if ratings[i + 1] > 0 else 1 - recall)
+            start += length
+        return total / len(self)
+
+    def _numpy_loss(self, parameters):
+        np = backend.np
+        initial, growth = split_parameters(parameters)
+        initial, growth = np.array(initial), np.array(growth)
+        log_target = math.log(RecallModel.TARGET)
+
+        # Every card's k-th rating is handled at once, longest cards first
+        # so the cards still going at each step are a prefix of the arrays
+        total = 0.0
+        interval = None
+        for ratings, elapsed, recalled in self._numpy_steps():
+            if interval is None:
+                interval = np.zeros(len(ratings))
+            interval = np.maximum(initial[ratings], interval[:len(ratings)] * growth[ratings])
+            tested = interval[:len(elapsed)]
+            recall = np.clip(np.exp(log_target * elapsed / tested), EPSILON, 1 - EPSILON)
+            total -= np.log(np.where(recalled, recall, 1 - recall)).sum()
+        return float(total) / len(self)
+
+    def _numpy_steps(self):
+        '''
+        Returns (ratings, time to the next rating, whether it was recalled)
+        for each step, the last two only for cards rated again after it
+        '''
+
+        if self._steps is not None:
+            return self._steps
+        np = backend.np
+        lengths = np.frombuffer(self.lengths, dtype=np.int64)
+        times = np.frombuffer(self.times, dtype=np.float64)
+        ratings = np.frombuffer(self.ratings, dtype=np.int8).astype(np.intp)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+        order = np.argsort(-lengths, kind="stable")
+        starts, lengths = starts[order], lengths[order]
+        steps = []
+        for step in range(int(lengths[0]) if len(lengths) else 0):
+            rows = starts[:np.searchsorted(-lengths, -step, side="left")] + step
+            tested = rows[:np.searchsorted(-lengths, -(step + 1), side="left")]
+            steps.append((ratings[rows],
+                          np.maximum(times[tested + 1] - times[tested], 0.0),
+                          ratings[tested + 1] > 0))
+        self._steps = steps
+        return steps
+
+def split_parameters(parameters):
+    '''
+    Returns the initial intervals and growth factors indexed by rating
+    Again always starts over, so its growth is 0
+    '''
+
+    return parameters[:3], (0.0,) + tuple(parameters[3:])
+
+def default_parameters():
+    return (tuple(Scheduler.INITIAL_INTERVALS[rating] for rating in range(3)) +
+            tuple(Scheduler.INTERVAL_GROWTH[rating] for rating in range(1, 3)))
+
+def to_scheduler_parameters(parameters):
+    initial, growth = split_parameters(parameters)
+    return {
+        "initial_intervals": {str(rating): round(interval, 1) for rating, interval in enumerate(initial)},
+        "interval_growth": {str(rating): round(factor, 3) for rating, factor in enumerate(growth)},
+    }
+
+def read_deck_reviews(filename):
+    '''
+    Returns a ReviewLog of the ratings in a JSON deck file and its journal
+    The cards are read one at a time, only their ratings are kept
+    '''
+
+    histories = {}
+    with open(filename, "r", encoding="utf-8") as f:
+        _, cards = Deck._read_deck_stream(f)
+        for card in cards:
+            if card.history is not None:
+                histories[card.id] = card.history.to_list()
+
+    # Ratings since the snapshot, a removed card's ratings still count
+    for record in ReviewJournal(filename).records():
+        if record["op"] == "add":
+            card = Deck._card_from_dict(record["card"])
+            if card.history is not None:
+                histories[card.id] = card.history.to_list()
+        elif record["op"] == "rate":
+            at = record.get("at", record["due"] - record["interval"])
+            histories.setdefault(record["id"], []).append([at, record["rating"]])
+
+    log = ReviewLog()
+    for entries in histories.values():
+        log.add(entries)
+    return log
+
+def read_collection_reviews(filename):
+    '''
+    Returns a ReviewLog of the rating histories in a SQLite collection
+    '''
+
+    log = ReviewLog()
+    conn = sqlite3.connect(filename)
+    try:
+        for (history,) in conn.execute("SELECT history FROM cards WHERE history IS NOT NULL"):
+            log.add(list(RatingHistory.from_bytes(history)))
+    except sqlite3.DatabaseError:
+        # Collections from before histories were kept have none to read
+        pass
+    finally:
+        conn.close()
+    return log
+
+def read_reviews(filename):
+    '''
+    Returns the ReviewLog of a deck file or collection, or None if it is neither
+    '''
+
+    try:
+        if filename.endswith(COLLECTION_EXTENSIONS):
+            return read_collection_reviews(filename)
+        return read_deck_reviews(filename)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def deck_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(DECK_EXTENSIONS + COLLECTION_EXTENSIONS) and name != SCHEDULER_FILE)
+
+def fit(log, start=None):
+    '''
+    Returns the parameters with the lowest loss over {log} and that loss
+
+    A pattern search over the logarithms of the parameters: each one is
+    moved up and down by a step, moves that lower the loss are kept, and
+    the step is halved once none does. It needs no gradient and a few
+    dozen loss evaluations.
+    '''
+
+    bounds = [(MIN_INTERVAL, MAX_INTERVAL)] * 3 + [(MIN_GROWTH, MAX_GROWTH)] * 2
+    bounds = [(math.log(low), math.log(high)) for low, high in bounds]
+    point = [min(max(math.log(value), low), high)
+             for value, (low, high) in zip(start or default_parameters(), bounds)]
+    loss = lambda point: log.loss(tuple(math.exp(value) for value in point))
+    best = loss(point)
+
+    step = 1.0
+    while step > TOLERANCE:
+        improved = False
+        for i, (low, high) in enumerate(bounds):
+            for move in (step, -step):
+                candidate = point[:]
+                candidate[i] = min(max(point[i] + move, low), high)
+                if candidate[i] == point[i]:
+                    continue
+                value = loss(candidate)
+                if value < best:
+                    point, best, improved = candidate, value, True
+                    break
+        if not improved:
+            step /= 2
+    return tuple(math.exp(value) for value in point), best
+
+def fit_user(log):
+    '''
+    Returns the fitted scheduler parameters for one user's ReviewLog with
+    how well they and the defaults predict the reviews, or None with too
+    few reviews to fit
+    '''
+
+    if len(log) < MIN_REVIEWS:
+        return None
+    parameters, loss = fit(log)
+    result = to_scheduler_parameters(parameters)
+    result.update(reviews=len(log), log_loss=round(loss, 6),
+                  default_log_loss=round(log.loss(default_parameters()), 6), fitted_at=time.time())
+    return result
+
+def fit_users(directories, workers=None):
+    '''
+    Returns {directory: fitted parameters or None} for every user directory
+    Deck files and then users are spread over {workers} processes
+    '''
+
+    files = {directory: deck_files(directory) for directory in directories}
+    all_files = [filename for filenames in files.values() for filename in filenames]
+
+    executor = ProcessPoolExecutor(workers) if workers != 1 else None
+    try:
+        map_ = executor.map if executor is not None else map
+        logs = dict(zip(all_files, map_(read_reviews, all_files)))
+
+        user_logs = []
+        for directory in directories:
+            log = ReviewLog()
+            for filename in files[directory]:
+                if logs[filename] is not None:
+                    log.extend(logs[filename])
+            user_logs.append(log)
+        del logs
+
+        return dict(zip(directories, map_(fit_user, user_logs)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fits the scheduler's intervals to each user's reviews")
+    parser.add_argument("directories", nargs="+", help="one directory of deck files per user")
+    parser.add_argument("--workers", type=int, help="number of processes, all cores by default")
+    parser.add_argument("--dry-run", action="store_true", help=f"prints the fits without writing {SCHEDULER_FILE}")
+    args = parser.parse_args(argv)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"not a directory: {directory}")
+
+    start = time.perf_counter()
+    results = fit_users(args.directories, args.workers)
+    for directory, result in results.items():
+        if result is None:
+            print(f"{directory}: fewer than {MIN_REVIEWS} reviews, keeping the defaults")
+            continue
+        print(f"{directory}: {result['reviews']} reviews, log loss {result['default_log_loss']} -> "
+              f"{result['log_loss']}, initial intervals {result['initial_intervals']}, "
+              f"growth {result['interval_growth']}")
+        if not args.dry_run:
+            with atomic_open(os.path.join(directory, SCHEDULER_FILE)) as f:
+                json.dump(result, f, indent=4)
+    print(f"Fitted {len(results)} users in {time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
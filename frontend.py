@@ -1,17 +1,159 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from functools import partial
+import os
+import time
+import weakref
 import backend
+import instrumentation
+
+class CardTable(ttk.Frame):
+    '''
+    Scrollable table of a deck's cards that only has widgets for the visible rows
+    Scrolling fills the same rows in with other cards, so opening a large
+    deck costs the same as opening a small one
+    '''
+
+    VISIBLE_ROWS = 12
+
+    def __init__(self, parent, deck, on_delete):
+        super().__init__(parent, padding=10)
+        self.deck = deck
+        self.on_delete = on_delete
+        self.offset = 0
+
+        # Cards matching the search box, or None to show the whole deck
+        self.results = None
+
+        self.grid_columnconfigure(0, weight=3)
+        self.grid_columnconfigure(1, weight=3)
+        self.grid_columnconfigure(2, weight=1)
+
+        ttk.Label(self, text="Card Front", font=("Arial", 13, "bold")).grid(
+            row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Label(self, text="Card Back", font=("Arial", 13, "bold")).grid(
+            row=0, column=1, padx=5, pady=5, sticky="w")
+
+        # Each row is (front label, back label, delete button)
+        self.rows = []
+        for i in range(self.VISIBLE_ROWS):
+            front = ttk.Label(self, anchor="w", wraplength=250, justify="left")
+            front.grid(row=i+1, column=0, padx=5, pady=1, sticky="w")
+            back = ttk.Label(self, anchor="w", wraplength=250, justify="left")
+            back.grid(row=i+1, column=1, padx=5, pady=1, sticky="w")
+            delete = ttk.Button(self, text="Delete")
+            delete.grid(row=i+1, column=2, padx=5, pady=1, sticky="w")
+            self.rows.append((front, back, delete))
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.scrollbar.grid(row=1, column=3, rowspan=self.VISIBLE_ROWS, sticky="ns")
+
+        for widget in [self] + [w for row in self.rows for w in row]:
+            widget.bind("<MouseWheel>", self.on_mouse_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll("scroll", -1, "units"))
+            widget.bind("<Button-5>", lambda e: self.scroll("scroll", 1, "units"))
+
+        self.refresh()
+
+    @property
+    def cards(self):
+        return self.deck.cards if self.results is None else self.results
+
+    def search(self, query):
+        '''
+        Shows only the cards matching {query}, or every card if it is empty
+        '''
+
+        self.results = self.deck.search(query) if query.strip() else None
+        self.offset = 0
+        self.refresh()
+
+    def remove_card(self, card):
+        if self.results is not None:
+            self.results = [c for c in self.results if c.id != card.id]
+        self.refresh()
+
+    def scroll(self, action, amount, unit=None):
+        '''
+        Handles the scrollbar's "moveto" and "scroll" commands
+        '''
+
+        if action == "moveto":
+            offset = int(float(amount) * len(self.cards))
+        elif unit == "pages":
+            offset = self.offset + int(amount) * self.VISIBLE_ROWS
+        else:
+            offset = self.offset + int(amount)
+        self.scroll_to(offset)
+
+    def on_mouse_wheel(self, event):
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.cards) - self.VISIBLE_ROWS))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def refresh(self):
+        '''
+        Fills the visible rows in with the cards at the current offset
+        '''
+
+        total = len(self.cards)
+        self.offset = max(0, min(self.offset, total - self.VISIBLE_ROWS))
+        cards = self.cards[self.offset:self.offset + self.VISIBLE_ROWS]
+
+        for i, (front, back, delete) in enumerate(self.rows):
+            if i < len(cards):
+                card = cards[i]
+                front.config(text=card.front)
+                back.config(text=card.back)
+                delete.config(command=partial(self.on_delete, self.deck, card))
+                delete.grid()
+            else:
+                front.config(text="")
+                back.config(text="")
+                delete.grid_remove()
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.VISIBLE_ROWS) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
 class FlashcardApp:
     def __init__(self):
         self.decks = []
+        self.collection = None
         self.current_deck = None
         self.deck_rows_frame = None
         self.no_decks_label = None
 
+        # deck -> widgets of its row in the main menu table
+        self.deck_rows = {}
+        self.deck_headings = []
+        self.next_deck_row = 1
+
+        # Rows waiting to be redrawn in the next idle callback
+        self.dirty_decks = set()
+        self.redraw_pending = False
+
+        # Saves and loads run on worker threads. Their futures are kept here
+        # with a callback to run on the Tk thread once they are done
+        self.io = backend.BackgroundIO()
+        self.io_tasks = []
+        self.io_poll_pending = False
+
+        # Decks whose duplicate index has been built in the background
+        self.duplicates_ready = weakref.WeakSet()
+
+        # Decks with a file are saved a couple of seconds after their last change
+        self.autosaver = backend.Autosaver(self.io)
+        self.autosave_pending = False
+
         self.main_window = tk.Tk()
         self.main_window.title("Flashcards")
+        self.main_window.protocol("WM_DELETE_WINDOW", self.close)
 
         self.main_window.withdraw()
         self.center_window(self.main_window, 700, 500)
@@ -30,14 +172,27 @@ class FlashcardApp:
         self.decks_container = ttk.Frame(self.main_frame)
         self.decks_container.pack(fill="both", expand=True)
 
+        # Shows what is being saved or loaded in the background
+        self.io_status_label = ttk.Label(self.main_frame, text="")
+        self.io_status_label.pack()
+
         self.show_decks(self.decks_container)
 
         ttk.Button(self.main_frame, text="Create New Deck", 
                    command=self.create_deck_menu).pack(pady=2)
         ttk.Button(self.main_frame, text="Add New Card", 
                    command=self.create_card_menu).pack(pady=2)
+        ttk.Button(self.main_frame, text="Study All Decks", 
+                   command=self.study_all).pack(pady=2)
         ttk.Button(self.main_frame, text="Load Deck from File", 
                    command=self.load_deck).pack(pady=2)
+        ttk.Button(self.main_frame, text="Open Collection", 
+                   command=self.open_collection).pack(pady=2)
+
+        # Only shown when the app was started with MEMOKADO_INSTRUMENT=1
+        if instrumentation.is_enabled():
+            ttk.Button(self.main_frame, text="Performance Stats", 
+                       command=self.show_stats).pack(pady=2)
 
     def create_deck_menu(self):
         '''
@@ -86,15 +241,7 @@ class FlashcardApp:
         try:
             new_deck = backend.Deck(deck_name)
             self.decks.append(new_deck)
-
-            self.show_decks(self.decks_container)
-
-            if self.no_decks_label:
-                self.no_decks_label.destroy()
-                self.no_decks_label = None
-            
-            row_index = len(self.decks)
-            self._add_deck_to_table(new_deck, row_index)
+            self._add_deck_to_table(new_deck)
 
             self.create_deck_window.destroy()
 
@@ -104,7 +251,8 @@ class FlashcardApp:
     def show_decks(self, parent_frame):
         '''
         Shows a table with all of the decks in the main menu
-        Initializes the headings only when self.decks is not empty
+        The table is built once, after that rows are added, updated and
+        removed one at a time
         '''
 
         for widget in parent_frame.winfo_children():
@@ -112,30 +260,45 @@ class FlashcardApp:
 
         self.deck_rows_frame = ttk.Frame(parent_frame)
         self.deck_rows_frame.pack(anchor="center")
+        self.deck_rows = {}
+        self.next_deck_row = 1
 
-        if not self.decks:
-            self.no_decks_label = ttk.Label(
-                self.deck_rows_frame, 
-                text="No decks yet. Create a new one to get started!", 
-                foreground="gray", anchor="center"
-            )
-            self.no_decks_label.grid(row=0, column=0, columnspan=4, pady=10)
-            return
-        
-        self.no_decks_label = None
+        self.no_decks_label = ttk.Label(
+            self.deck_rows_frame, 
+            text="No decks yet. Create a new one to get started!", 
+            foreground="gray", anchor="center"
+        )
+        self.no_decks_label.grid(row=0, column=0, columnspan=4, pady=10)
 
-        # Deck table headings
+        # Deck table headings, hidden while there are no decks
         headings = ["Deck Name", "Cards", "Last Score", "Actions"]
+        self.deck_headings = []
         for col, text in enumerate(headings):
-            ttk.Label(self.deck_rows_frame, text=text, font=("Arial", 13, "bold")).grid(
-                row=0, column=col, padx=5, pady=3
-            )
+            heading = ttk.Label(self.deck_rows_frame, text=text, font=("Arial", 13, "bold"))
+            heading.grid(row=0, column=col, padx=5, pady=3)
+            self.deck_headings.append(heading)
 
         # Adds a deck as a row
-        for i, deck in enumerate(self.decks):
-            self._add_deck_to_table(deck, i + 1)
+        for deck in self.decks:
+            self._add_deck_to_table(deck)
 
-    def _add_deck_to_table(self, deck, row_index):
+        self._update_empty_table()
+
+    def _update_empty_table(self):
+        '''
+        Shows the headings when there are decks, and the hint when there are none
+        '''
+
+        if self.deck_rows:
+            self.no_decks_label.grid_remove()
+            for heading in self.deck_headings:
+                heading.grid()
+        else:
+            for heading in self.deck_headings:
+                heading.grid_remove()
+            self.no_decks_label.grid()
+
+    def _add_deck_to_table(self, deck):
         '''
         Represents a deck in the decks table
         Each row has the following attributes:
@@ -147,21 +310,24 @@ class FlashcardApp:
         - Study a deck
         - Edit a deck
         - Save a deck locally
+        - Import cards into a deck from a text file
         '''
 
+        # Grid rows are never reused, removed rows just collapse
+        row_index = self.next_deck_row
+        self.next_deck_row += 1
+
         # Loads the deck into the main menu table
-        ttk.Label(self.deck_rows_frame, text=deck.name).grid(
-                row=row_index, column=0, padx=5, pady=2, sticky="w")
+        name_label = ttk.Label(self.deck_rows_frame, text=deck.name)
+        name_label.grid(row=row_index, column=0, padx=5, pady=2, sticky="w")
         
         # Shows number of cards in the deck
-        cards_label = ttk.Label(self.deck_rows_frame, text=len(deck.cards))
+        cards_label = ttk.Label(self.deck_rows_frame, text=len(deck))
         cards_label.grid(row=row_index, column=1, padx=5, pady=2)
-        deck._card_count = cards_label
 
         # Shows the deck's score from the previous study session
         score_label = ttk.Label(self.deck_rows_frame, text=f"{deck.score} / {deck.max_score()}")
         score_label.grid(row=row_index, column=2, padx=5, pady=2)
-        deck._score_label = score_label
     
         # Shows action buttons
         button_frame = ttk.Frame(self.deck_rows_frame)
@@ -173,6 +339,79 @@ class FlashcardApp:
             side="left", padx=2)
         ttk.Button(button_frame, text="Save", command=lambda d=deck: self.save_deck(d)).pack(
             side="left", padx=2)
+        ttk.Button(button_frame, text="Import", command=lambda d=deck: self.import_cards(d)).pack(
+            side="left", padx=2)
+
+        self.deck_rows[deck] = {
+            "name": name_label,
+            "cards": cards_label,
+            "score": score_label,
+            "buttons": button_frame,
+        }
+        self._update_empty_table()
+
+    def _remove_deck_from_table(self, deck):
+        row = self.deck_rows.pop(deck, None)
+        if row:
+            for widget in row.values():
+                widget.destroy()
+        self.dirty_decks.discard(deck)
+        self._update_empty_table()
+
+    def refresh_deck_row(self, deck):
+        '''
+        Marks a deck's row as changed
+        Rows are redrawn together once Tk is idle, so many changes cost one redraw
+        '''
+
+        self.dirty_decks.add(deck)
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.main_window.after_idle(self._redraw_deck_rows)
+
+    def deck_changed(self, deck):
+        '''
+        Redraws a changed deck's row and schedules it to be autosaved
+        '''
+
+        self.refresh_deck_row(deck)
+        self.autosaver.schedule(deck)
+        if not self.autosave_pending:
+            self.autosave_pending = True
+            self.main_window.after(int(self.autosaver.delay * 1000), self._autosave)
+
+    def _autosave(self):
+        self.autosave_pending = False
+        self._track_autosaves(self.autosaver.flush(time.monotonic()))
+
+        # Decks changed since this callback was scheduled wait for their own delay
+        deadline = self.autosaver.next_deadline()
+        if deadline is not None:
+            self.autosave_pending = True
+            delay = max(0, deadline - time.monotonic())
+            self.main_window.after(int(delay * 1000) + 1, self._autosave)
+
+    def flush_autosave(self):
+        self._track_autosaves(self.autosaver.flush())
+
+    def _track_autosaves(self, futures):
+        def saved(future):
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Failed to autosave deck: {str(future.exception())}")
+
+        for future in futures:
+            self.run_in_background(future, "Autosaving", saved)
+
+    def _redraw_deck_rows(self):
+        for deck in self.dirty_decks:
+            row = self.deck_rows.get(deck)
+            if row is None:
+                continue
+            row["name"].config(text=deck.name)
+            row["cards"].config(text=len(deck))
+            row["score"].config(text=f"{deck.score} / {deck.max_score()}")
+        self.dirty_decks = set()
+        self.redraw_pending = False
 
     def create_card_menu(self):
         '''
@@ -245,17 +484,31 @@ class FlashcardApp:
             messagebox.showerror("Error", "Both front and back parts must be filled!")
             return
         
+        selected_deck = next((d for d in self.decks if d.name == deck), None)
+        self._add_card(selected_deck, front, back)
+
+    def _add_card(self, deck, front, back):
+        # The cards are read and the duplicate index is built in the background first
+        if not self.duplicates_loaded(deck, lambda deck: self._add_card(deck, front, back)):
+            return
+
         try:
-            selected_deck = next((d for d in self.decks if d.name == deck), None)
             new_card = backend.Flashcard(front, back)
-            selected_deck.insert_card_sorted(new_card)
 
-            if hasattr(selected_deck, "_card_count"):
-                selected_deck._card_count.config(text=str(len(selected_deck.cards)))
+            # Warns before adding a card the deck already has
+            duplicates = deck.find_duplicates(new_card)
+            if duplicates and not messagebox.askyesno(
+                    "Possible Duplicate",
+                    f"This deck already has a similar card:\n\n{duplicates[0].front}\n\nAdd it anyway?"):
+                return
+
+            deck.insert_card_sorted(new_card)
+            self.deck_changed(deck)
 
             messagebox.showinfo("Success", "Card added successfully!")
 
-            self.create_card_window.destroy()
+            if self.create_card_window.winfo_exists():
+                self.create_card_window.destroy()
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to create card: {str(e)}")
@@ -263,27 +516,79 @@ class FlashcardApp:
     def study_deck(self, deck):
         '''
         Allows the user to study the cards in a deck
+        The window only shows cards, the backend's StudySession picks them
+        and keeps the score
         '''
         
-        if not deck.cards:
+        if not len(deck):
             messagebox.showerror("Error", "This deck has no cards to study!")
             return
 
-        self.study_cards = list(deck.cards)
-        self.study_cards_index = 0
+        if not self.cards_loaded(deck, self.study_deck):
+            return
+
+        # Ratings are autosaved together shortly after the user stops rating
+        self.study_session = backend.StudySession(deck)
+
+        if self.study_session.finished:
+            messagebox.showinfo("Nothing Due", "No cards are due in this deck right now!")
+            return
 
         self.current_deck = deck
-        self.current_deck.sort_by_score()
+        self.open_study_window(deck.name)
 
-        # Initializes the current deck's score
-        self.current_deck.score = 0
+    def study_all(self):
+        '''
+        Allows the user to study the due cards of every deck in one session
+        Cards come earliest due first whichever deck they are in
+        The session starts with the decks whose cards have been read, the
+        others are read in the background and join it as they arrive
+        '''
+
+        loaded, unread = [], []
+        for deck in self.decks:
+            if len(deck):
+                (loaded if getattr(deck, "loaded", True) else unread).append(deck)
+
+        session = self.study_session = backend.GlobalStudySession(loaded)
+        self.current_deck = None
+        waiting = [len(unread)]
+        opened = [False]
+
+        def start():
+            if opened[0] or self.study_session is not session:
+                return
+            if not session.finished:
+                opened[0] = True
+                self.open_study_window("All Decks")
+            elif not waiting[0]:
+                messagebox.showinfo("Nothing Due", "No cards are due in any deck right now!")
+
+        def read(deck, future):
+            waiting[0] -= 1
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Failed to load deck: {str(future.exception())}")
+            # A learner who already finished keeps their results, the deck is studied next time
+            elif self.study_session is session and not (opened[0] and session.finished):
+                session.add_deck(deck)
+            start()
+
+        for deck in unread:
+            self.run_in_background(self.io.load_cards(deck), f"Reading cards of '{deck.name}'",
+                                   lambda future, deck=deck: read(deck, future))
+        start()
+
+    def open_study_window(self, title):
+        '''
+        Shows the cards of the current study session one at a time
+        '''
 
         # Hides back of card
         self.showing_front = True
         
         # General window setup
         self.study_deck_window = tk.Toplevel(self.main_window)
-        self.study_deck_window.title(f"{deck.name}")
+        self.study_deck_window.title(title)
         self.study_deck_window.withdraw()
         self.center_window(self.study_deck_window, 500, 400)
         self.study_deck_window.deiconify()
@@ -320,10 +625,10 @@ class FlashcardApp:
         Shows the front of the card
         Hides the back of the card until "Show Answer" is clicked
         '''
-        if self.study_cards_index >= len(self.study_cards):
+        card = self.study_session.current_card
+        if card is None:
             return
 
-        card = self.study_cards[self.study_cards_index]
         self.card_text.config(text=card.front)
 
         self.card_answer.pack_forget()
@@ -339,10 +644,10 @@ class FlashcardApp:
         When "Show Answer" is clicked, this reveals the back of the card
         Also reveals the rating buttons
         '''
-        if self.study_cards_index >= len(self.study_cards):
+        card = self.study_session.current_card
+        if card is None:
             return
 
-        card = self.study_cards[self.study_cards_index]
         self.card_answer.config(text=card.back)
 
         self.card_answer.pack(pady=30)
@@ -363,16 +668,13 @@ class FlashcardApp:
         When the user rates the card, the window shows the next card
         '''
 
-        if self.study_cards_index >= len(self.study_cards):
+        if self.study_session.finished:
             return
 
-        card = self.study_cards[self.study_cards_index]
-        
-        self.current_deck.rate_card(card, rating)
-
-        self.study_cards_index += 1
-
-        if self.study_cards_index < len(self.study_cards):
+        deck = self.study_session.current_deck
+        next_card = self.study_session.rate(rating)
+        self.deck_changed(deck)
+        if next_card is not None:
             self.show_card_front()
         else:
             self.finish_study()
@@ -386,15 +688,13 @@ class FlashcardApp:
         self.rating_frame.pack_forget()
 
         self.card_text.config(text="Congratulations!", font=("Arial", 16, "bold"))
-        self.card_answer.config(text=f"Your score for this deck is {self.current_deck.score} out of {self.current_deck.max_score()}!")
+        which = "this deck" if self.current_deck is not None else "these decks"
+        self.card_answer.config(text=f"Your score for {which} is {self.study_session.score} out of {self.study_session.max_score()}!")
         self.card_answer.pack(pady=10)
 
-        self.current_deck.sort_by_score()
-
-        if hasattr(self.current_deck, "_score_label"):
-            self.current_deck._score_label.config(
-                text=f"{self.current_deck.score} / {self.current_deck.max_score()}"
-            )
+        for deck in self.study_session.studied_decks:
+            self.refresh_deck_row(deck)
+        self.flush_autosave()
 
         ttk.Button(self.card_answer.master, text="Go Back", command=self.study_deck_window.destroy).pack(
             pady=10
@@ -407,6 +707,9 @@ class FlashcardApp:
         Allows the user to edit the deck name and view all cards in a deck
         '''
 
+        if not self.cards_loaded(deck, self.edit_deck):
+            return
+
         # General window setup
         self.edit_deck_window = tk.Toplevel(self.main_window)
         self.edit_deck_window.title(f"Editing {deck.name}")
@@ -444,11 +747,7 @@ class FlashcardApp:
             deck.name = new_name
             messagebox.showinfo("Success", f"Deck renamed to '{deck.name}'")
             self.edit_deck_window.destroy()
-
-            for widget in self.deck_rows_frame.winfo_children():
-                widget.destroy()
-
-            self.show_decks(self.decks_container)
+            self.deck_changed(deck)
 
         # Deck edit options
         btn_frame = ttk.Frame(deck_frame, padding=15)
@@ -458,36 +757,41 @@ class FlashcardApp:
             row=0, column=0, padx=10, pady=3, sticky="w")
         ttk.Button(btn_frame, text="Delete Deck", command=lambda d=deck: self.delete_deck(d)).grid(
             row=0, column=1, pady=3, sticky="w")
+        ttk.Button(btn_frame, text="Find Duplicates", command=lambda d=deck: self.show_duplicates(d)).grid(
+            row=0, column=2, padx=10, pady=3, sticky="w")
 
-        # Table with all cards
-        cards_frame = ttk.Frame(main_frame, padding=10)
-        cards_frame.grid(row=1, column=0, sticky="nsew")
-        cards_frame.grid_columnconfigure(0, weight=3)
-        cards_frame.grid_columnconfigure(1, weight=3)
-        cards_frame.grid_columnconfigure(2, weight=1)
-
-        ttk.Label(cards_frame, text="Card Front", font=("Arial", 13, "bold")).grid(
-            row=0, column=0, padx=5, pady=5, sticky="w")
-        ttk.Label(cards_frame, text="Card Back", font=("Arial", 13, "bold")).grid(
-            row=0, column=1, padx=5, pady=5, sticky="w")
+        # Search box, the table shows the matching cards as the user types
+        search_frame = ttk.Frame(main_frame)
+        search_frame.grid(row=1, column=0, sticky="we")
+        ttk.Label(search_frame, text="Search", font=("Arial", 13, "bold")).pack(side="left", padx=5)
+        search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=search_var, width=40).pack(side="left", padx=5)
 
-        for i, card in enumerate(deck.cards):
-            ttk.Label(cards_frame, text=f"{card.front}", anchor="w", 
-                      wraplength=250, justify="left").grid(
-                row=i+1, column=0, padx=5, pady=1, sticky="w")
-            
-            ttk.Label(cards_frame, text=f"{card.back}", anchor="w", 
-                      wraplength=250, justify="left").grid(
-                row=i+1, column=1, padx=5, pady=1, sticky="w")
-            
-            btn_frame = ttk.Frame(cards_frame)
-            btn_frame.grid(row=i+1, column=2, padx=5, pady=5, sticky="w")
-            ttk.Button(btn_frame, text="Delete", command=partial(self.delete_card, deck, card)).pack(side="left", padx=2)
+        # Table with all cards, only the visible rows have widgets
+        self.card_table = CardTable(main_frame, deck, on_delete=self.delete_card)
+        self.card_table.grid(row=2, column=0, sticky="nsew")
+        search_var.trace_add("write", lambda *args: self.card_table.search(search_var.get()))
 
         # Go back to the main menu
         ttk.Button(main_frame, text="Go Back", command=self.edit_deck_window.destroy).grid(
             row=3, column=0, padx=5, pady=5, sticky="we")
 
+    def show_duplicates(self, deck):
+        '''
+        Lists the groups of duplicate cards in a deck
+        Only the first few groups are shown, the search box finds the rest
+        '''
+
+        groups = deck.duplicate_report()
+        if not groups:
+            messagebox.showinfo("Duplicates", "No duplicate cards found!")
+            return
+
+        lines = [" / ".join(card.front for card in group) for group in groups[:10]]
+        if len(groups) > 10:
+            lines.append(f"...and {len(groups) - 10} more")
+        messagebox.showinfo("Duplicates", f"Found {len(groups)} groups of duplicate cards:\n\n" + "\n".join(lines))
+
     def delete_deck(self, deck):
         '''
         Allows the user to delete the deck
@@ -503,9 +807,11 @@ class FlashcardApp:
         if deck in self.decks:
             self.decks.remove(deck)
 
-        for widget in self.deck_rows_frame.winfo_children():
-            widget.destroy()
-        self.show_decks(self.decks_container)
+        if isinstance(deck, backend.SqliteDeck):
+            deck.store.delete_deck(deck)
+            deck.store.commit()
+
+        self._remove_deck_from_table(deck)
 
     def delete_card(self, deck, card):
         '''
@@ -518,59 +824,256 @@ class FlashcardApp:
 
         deck.remove_card(card.id)
 
-        deck.sort_by_score()
+        self.deck_changed(deck)
 
-        self.edit_deck_window.destroy()
-
-        deck._card_count.config(text=str(len(deck.cards)))
-
-        self.edit_deck(deck)
+        # Only the visible rows need to be filled in again
+        self.card_table.remove_card(card)
         
     def save_deck(self, deck):
         '''
-        Allows the user to save the deck as a JSON file
+        Allows the user to save the deck as a JSON Lines file
+        Decks that already have a file only append their changes to its journal
         '''
 
-        filename = filedialog.asksaveasfilename(
-            title=f"Save deck '{deck.name}'",
-            defaultextension=".json",
-            filetypes=[("JSON Files", "*.json")]
-        )
+        filename = deck.filename
+        if not filename:
+            filename = filedialog.asksaveasfilename(
+                title=f"Save deck '{deck.name}'",
+                defaultextension=".jsonl",
+                filetypes=[("Deck Files", "*.jsonl"), ("JSON Files", "*.json")]
+            )
         if not filename:
             return 
 
+        def saved(future):
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Failed to save deck: {str(future.exception())}")
+
+        self.run_in_background(self.io.save(deck, filename), f"Saving '{deck.name}'", saved)
+
+    def import_cards(self, deck):
+        '''
+        Allows the user to import cards into a deck from a CSV, TSV or Anki text file
+        Shows how many cards have been imported while the file is read
+        '''
+
+        filename = filedialog.askopenfilename(
+            title=f"Import cards into '{deck.name}'",
+            filetypes=[("Text Files", "*.csv *.tsv *.txt"), ("All Files", "*")]
+        )
+
+        if not filename:
+            return
+
+        skip_duplicates = messagebox.askyesno(
+            "Import Cards", "Skip cards that duplicate cards already in the deck?")
+        self._import_file(deck, filename, skip_duplicates)
+
+    def _import_file(self, deck, filename, skip_duplicates):
+        # Skipping duplicates needs the duplicate index, importing only needs the cards
+        then = lambda deck: self._import_file(deck, filename, skip_duplicates)
+        if not (self.duplicates_loaded(deck, then) if skip_duplicates else self.cards_loaded(deck, then)):
+            return
+
+        progress_window = tk.Toplevel(self.main_window)
+        progress_window.title("Importing Cards")
+        progress_window.withdraw()
+        self.center_window(progress_window, 300, 100)
+        progress_window.deiconify()
+
+        progress_label = ttk.Label(progress_window, text="Importing cards...")
+        progress_label.pack(expand=True)
+
+        def show_progress(count):
+            progress_label.config(text=f"Imported {count} cards...")
+            progress_window.update()
+
         try:
-            deck.save_to_file(filename)
-            messagebox.showinfo("Success", f"Deck '{deck.name}' saved successfully!")
+            count = deck.import_text(filename, progress=show_progress, skip_duplicates=skip_duplicates)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save deck: {str(e)}")
+            messagebox.showerror("Error", f"Failed to import cards: {str(e)}")
+            return
+        finally:
+            progress_window.destroy()
+            self.deck_changed(deck)
+
+        messagebox.showinfo("Success", f"Imported {count} cards into '{deck.name}'!")
 
     def load_deck(self):
         '''
-        Allows the user to load a JSON file as a deck
+        Allows the user to load a deck file (JSON Lines or older JSON) as a deck
         '''
 
-        filename = filedialog.askopenfilename(
-            title="Select deck file",
-            filetypes=[("JSON Files", "*.json")]
+        filenames = filedialog.askopenfilenames(
+            title="Select deck files",
+            filetypes=[("Deck Files", "*.jsonl *.json"), ("All Files", "*")]
         )
 
-        if not filename:
+        if not filenames:
             return
-        
-        deck = backend.Deck.load_from_file(filename)
-        if not deck:
-            messagebox.showerror("Error", "Failed to load deck from file!")
+
+        # Only the headers are read, so each deck shows up as soon as its
+        # first line is read. Cards are read when the deck is studied or edited
+        for filename, future in zip(filenames, self.io.load_many(filenames, backend.LazyDeck)):
+            self.run_in_background(future, f"Loading {os.path.basename(filename)}",
+                                   lambda future, filename=filename: self._deck_loaded(future, filename))
+
+    def _deck_loaded(self, future, filename):
+        deck = None if future.exception() is not None else future.result()
+        if deck is None:
+            messagebox.showerror("Error", f"Failed to load deck from {filename}!")
             return
-        
+
         self.decks.append(deck)
+        self._add_deck_to_table(deck)
 
-        for widget in self.deck_rows_frame.winfo_children():
-            widget.destroy()
-        self.show_decks(self.decks_container)
+    def cards_loaded(self, deck, then):
+        '''
+        Returns whether the cards of {deck} have been read
+        If not, they are read in the background and {then} is called with
+        the deck once they are there
+        '''
+
+        if getattr(deck, "loaded", True):
+            return True
 
-        messagebox.showinfo("Success", f"Loaded deck '{deck.name}' successfully!")
+        def loaded(future):
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Failed to load deck: {str(future.exception())}")
+                return
+            then(deck)
+
+        self.run_in_background(self.io.load_cards(deck), f"Reading cards of '{deck.name}'", loaded)
+        return False
+
+    def duplicates_loaded(self, deck, then):
+        '''
+        Returns whether the cards of {deck} have been read and its duplicate
+        index built. If not, both are done in the background and {then} is
+        called with the deck once they are
+        '''
+
+        if deck in self.duplicates_ready:
+            return True
+
+        def built(future):
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Failed to load deck: {str(future.exception())}")
+                return
+            self.duplicates_ready.add(deck)
+            then(deck)
+
+        self.run_in_background(self.io.load_duplicate_index(deck),
+                               f"Indexing cards of '{deck.name}'", built)
+        return False
+
+    def run_in_background(self, future, description, on_done):
+        '''
+        Calls {on_done} with {future} on the Tk thread once it is done
+        The futures are polled with after() since Tk is not thread safe
+        '''
+
+        self.io_tasks.append((future, description, on_done))
+        self._show_io_status()
+        if not self.io_poll_pending:
+            self.io_poll_pending = True
+            self.main_window.after(100, self._poll_io)
+
+    def _poll_io(self):
+        done = [task for task in self.io_tasks if task[0].done()]
+        self.io_tasks = [task for task in self.io_tasks if not task[0].done()]
+        self._show_io_status()
+
+        for future, description, on_done in done:
+            on_done(future)
+
+        if self.io_tasks:
+            self.main_window.after(100, self._poll_io)
+        else:
+            self.io_poll_pending = False
+
+    def _show_io_status(self):
+        if not self.io_status_label.winfo_exists():
+            return
+        descriptions = [description for _, description, _ in self.io_tasks]
+        if len(descriptions) > 3:
+            descriptions = descriptions[:3] + [f"{len(descriptions) - 3} more"]
+        self.io_status_label.config(text=", ".join(descriptions) + "..." if descriptions else "")
+
+    def close(self):
+        '''
+        Saves the decks with unsaved changes and waits for the background
+        saves to finish so no deck file is left half written
+        '''
+
+        self.autosaver.flush()
+        self.io.shutdown(wait=True)
+        self.main_window.destroy()
     
+    def open_collection(self):
+        '''
+        Opens a SQLite collection of decks
+        Only the deck details are read, cards are fetched when a deck is used
+        '''
+
+        filename = filedialog.askopenfilename(
+            title="Select collection",
+            filetypes=[("Collections", "*.db *.sqlite"), ("All Files", "*")]
+        )
+
+        if not filename:
+            return
+
+        try:
+            collection = backend.CollectionStore(filename)
+            decks = collection.list_decks()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open collection: {str(e)}")
+            return
+
+        if self.collection:
+            for deck in [d for d in self.decks if getattr(d, "store", None) is self.collection]:
+                self.decks.remove(deck)
+                self._remove_deck_from_table(deck)
+            self.collection.close()
+        self.collection = collection
+        self.decks.extend(decks)
+        for deck in decks:
+            self._add_deck_to_table(deck)
+
+        messagebox.showinfo("Success", f"Opened {len(decks)} decks from the collection!")
+
+    def show_stats(self):
+        '''
+        Shows the timers and widget counters collected by instrumentation
+        '''
+
+        stats_window = tk.Toplevel(self.main_window)
+        stats_window.title("Performance Stats")
+        stats_window.withdraw()
+        self.center_window(stats_window, 700, 400)
+        stats_window.deiconify()
+
+        text = tk.Text(stats_window, font=("Courier", 11), wrap="none")
+        text.insert("1.0", instrumentation.report())
+        text.config(state="disabled")
+        text.pack(fill="both", expand=True)
+
+        button_frame = ttk.Frame(stats_window)
+        button_frame.pack(pady=5)
+        ttk.Button(button_frame, text="Reset", command=lambda: (
+            instrumentation.reset(), stats_window.destroy())).pack(side="left", padx=2)
+        ttk.Button(button_frame, text="Save...", command=self.save_stats).pack(side="left", padx=2)
+
+    def save_stats(self):
+        filename = filedialog.asksaveasfilename(
+            title="Save performance stats",
+            defaultextension=".json",
+            filetypes=[("JSON Files", "*.json")]
+        )
+        if filename:
+            instrumentation.dump(filename)
+
     def center_window(self, window, width=None, height=None):
         '''
         Centers the windows because tkinter does not do that for some reason...
@@ -586,4 +1089,22 @@ class FlashcardApp:
         y = (hs // 2) - (h // 2)
         window.geometry(f'{w}x{h}+{x}+{y}')
 
-FlashcardApp()
\ No newline at end of file
+instrumentation.register(FlashcardApp, [
+    "show_decks", "_add_deck_to_table", "_redraw_deck_rows", "study_deck", "study_all", "rate_card",
+    "finish_study", "edit_deck", "delete_card", "save_deck", "load_deck", "import_cards",
+    "open_collection",
+])
+instrumentation.register(CardTable, ["refresh"])
+
+if __name__ == "__main__":
+    # MEMOKADO_INSTRUMENT=1 turns on the timers and widget counters
+    # MEMOKADO_PROFILE=file.prof also profiles the whole session to that file
+    profile_filename = os.environ.get("MEMOKADO_PROFILE")
+    if os.environ.get("MEMOKADO_INSTRUMENT") or profile_filename:
+        instrumentation.enable()
+
+    if profile_filename:
+        with instrumentation.profile_session(profile_filename, memory=True):
+            FlashcardApp()
+    else:
+        FlashcardApp()
\ No newline at end of file
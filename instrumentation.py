@@ -0,0 +1,210 @@
+'''
+Opt-in timers and counters for the hot paths of the app
+
+Modules register the methods worth timing with register(). Nothing is
+wrapped until enable() is called, and disable() puts the original methods
+back, so the instrumentation costs nothing while it is off.
+
+    import instrumentation
+    instrumentation.enable()
+    ...
+    print(instrumentation.report())
+    instrumentation.dump("stats.json")
+
+With Tk loaded, enable() also counts the widgets created and destroyed
+in each window. profile_session() wraps a block in cProfile and
+optionally tracemalloc and writes both to disk.
+'''
+
+import cProfile
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# (class, method names, label prefix) for everything register() was given
+_targets = []
+
+# (class, name, original attribute) for every method wrapped by enable()
+_wrapped = []
+
+# label -> [calls, total seconds, slowest call in seconds]
+_timers = {}
+
+# label -> count
+_counters = {}
+
+def is_enabled():
+    return bool(_wrapped)
+
+def register(cls, method_names, prefix=None):
+    '''
+    Marks methods of {cls} to be timed while instrumentation is enabled
+    They show up in the report as "{prefix}.{method}"
+    '''
+
+    _targets.append((cls, method_names, prefix or cls.__name__))
+    if is_enabled():
+        _wrap_target(cls, method_names, prefix or cls.__name__)
+
+def record_time(label, seconds):
+    timer = _timers.get(label)
+    if timer is None:
+        timer = _timers[label] = [0, 0.0, 0.0]
+    timer[0] += 1
+    timer[1] += seconds
+    if seconds > timer[2]:
+        timer[2] = seconds
+
+def count(label, amount=1):
+    _counters[label] = _counters.get(label, 0) + amount
+
+def _timed(func, label):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_time(label, time.perf_counter() - start)
+    return wrapper
+
+def _wrap_attribute(cls, name, label):
+    original = cls.__dict__.get(name)
+    if original is None:
+        return
+    if isinstance(original, classmethod):
+        wrapped = classmethod(_timed(original.__func__, label))
+    elif isinstance(original, staticmethod):
+        wrapped = staticmethod(_timed(original.__func__, label))
+    elif isinstance(original, property):
+        wrapped = property(_timed(original.fget, label), original.fset, original.fdel, original.__doc__)
+    elif callable(original):
+        wrapped = _timed(original, label)
+    else:
+        return
+    setattr(cls, name, wrapped)
+    _wrapped.append((cls, name, original))
+
+def _wrap_target(cls, method_names, prefix):
+    for name in method_names:
+        _wrap_attribute(cls, name, f"{prefix}.{name}")
+
+'''
+Widget counting
+
+Every tkinter widget goes through BaseWidget._setup when it is created and
+BaseWidget.destroy when it is destroyed, so wrapping those two counts
+all of them. Counts are kept per window, named by the window's title
+'''
+def _window_title(widget):
+    try:
+        return widget.winfo_toplevel().title() or str(widget.winfo_toplevel())
+    except Exception:
+        return "unknown window"
+
+def _wrap_tk():
+    tkinter = sys.modules.get("tkinter")
+    if tkinter is None:
+        return
+    base = tkinter.BaseWidget
+    setup, destroy = base.__dict__["_setup"], base.__dict__["destroy"]
+
+    def counting_setup(self, master, cnf):
+        setup(self, master, cnf)
+        count(f"widgets created: {_window_title(master)}")
+
+    def counting_destroy(self):
+        count(f"widgets destroyed: {_window_title(self)}")
+        destroy(self)
+
+    base._setup = counting_setup
+    base.destroy = counting_destroy
+    _wrapped.append((base, "_setup", setup))
+    _wrapped.append((base, "destroy", destroy))
+
+def enable():
+    '''
+    Starts timing the registered methods and counting Tk widgets
+    '''
+
+    if is_enabled():
+        return
+    for cls, method_names, prefix in _targets:
+        _wrap_target(cls, method_names, prefix)
+    _wrap_tk()
+
+def disable():
+    '''
+    Puts back the original methods, the collected stats are kept
+    '''
+
+    while _wrapped:
+        cls, name, original = _wrapped.pop()
+        setattr(cls, name, original)
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+def stats():
+    '''
+    Returns the collected stats as plain dicts
+    '''
+
+    return {
+        "timers": {
+            label: {"calls": calls, "total_seconds": total, "max_seconds": slowest,
+                    "mean_seconds": total / calls}
+            for label, (calls, total, slowest) in _timers.items()
+        },
+        "counters": dict(_counters),
+    }
+
+def report():
+    '''
+    Returns the stats as a text table, slowest total time first
+    '''
+
+    lines = [f"{'timer':<36} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+    for label, (calls, total, slowest) in sorted(_timers.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{label:<36} {calls:>8} {total * 1000:>10.2f} "
+                     f"{total / calls * 1000:>9.3f} {slowest * 1000:>9.3f}")
+    if _counters:
+        lines.append("")
+        lines.append(f"{'counter':<56} {'count':>8}")
+        for label, value in sorted(_counters.items()):
+            lines.append(f"{label:<56} {value:>8}")
+    return "\n".join(lines)
+
+def dump(filename):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(stats(), f, indent=4)
+
+@contextmanager
+def profile_session(filename, memory=False):
+    '''
+    Profiles the block with cProfile and writes the stats to {filename}
+    They can be read with pstats or snakeviz. With {memory}, the biggest
+    allocation sites are also written to {filename}.memory.txt
+    '''
+
+    profiler = cProfile.Profile()
+    if memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            with open(filename + ".memory.txt", "w", encoding="utf-8") as f:
+                f.write(f"Peak traced memory: {peak / 2**20:.2f} MiB\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
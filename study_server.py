@@ -0,0 +1,387 @@
+'''
+Serves the decks in a directory to many learners at once over HTTP
+
+A single asyncio process keeps the decks and answers JSON requests:
+
+    GET    /decks                           the decks with their name, score and card count
+    GET    /decks/{deck}/next               the next due card, ?order=recall for lowest recall first
+    POST   /decks/{deck}/cards              adds {"front": ..., "back": ...}
+    DELETE /decks/{deck}/cards/{card}       removes a card
+    POST   /decks/{deck}/cards/{card}/rate  rates a card with {"rating": 0, 1 or 2}
+
+{deck} is the deck's file name without its extension. Only the headers
+are read at start, a deck's cards are read when it is first used.
+Reading, saving and the work on a deck's cards, such as ordering them
+by recall, go through a BackgroundIO with a bounded number of worker
+threads, so the event loop never waits on the disk or a large deck. Each deck
+has its own lock, so requests to one deck run one at a time and never
+overlap with its save, while other decks carry on. Changes are saved to
+the review journal a couple of seconds after a deck's first unsaved one.
+
+Usage: python study_server.py DIRECTORY [--host 127.0.0.1] [--port 8080] [--workers 4]
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from backend import Autosaver, BackgroundIO, Deck, Flashcard, LazyDeck, SCHEDULER_FILE
+
+DECK_EXTENSIONS = (".jsonl", ".json")
+
+# Requests with a larger body are refused
+MAX_BODY = 1024 * 1024
+
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class DeckService:
+    '''
+    The decks of a directory and the operations learners can do on them
+    Every method is a coroutine for the event loop, disk work and the work
+    on a deck's cards are done by {workers} threads
+    '''
+
+    def __init__(self, directory, workers=4, save_delay=Autosaver.DELAY):
+        self.directory = directory
+        self.io = BackgroundIO(max_workers=workers)
+        self.save_delay = save_delay
+        self.decks = {}
+        self._locks = {}
+
+        # deck key -> task that saves the deck once save_delay has passed
+        self._saves = {}
+
+    async def open(self):
+        '''
+        Reads the header of every deck file in the directory
+        '''
+
+        filenames = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                           if name.endswith(DECK_EXTENSIONS) and name != SCHEDULER_FILE)
+        futures = [asyncio.wrap_future(future) for future in self.io.load_many(filenames, LazyDeck)]
+        for filename, result in zip(filenames, await asyncio.gather(*futures, return_exceptions=True)):
+            if isinstance(result, Exception) or result is None:
+                print(f"Skipping {filename}: {result}", file=sys.stderr)
+                continue
+            key = os.path.splitext(os.path.basename(filename))[0]
+            self.decks[key] = result
+            self._locks[key] = asyncio.Lock()
+
+    async def close(self):
+        '''
+        Saves every changed deck and stops the worker threads
+        '''
+
+        for task in self._saves.values():
+            task.cancel()
+        self._saves = {}
+        for key, deck in self.decks.items():
+            if deck.dirty:
+                async with self._locks[key]:
+                    await asyncio.wrap_future(self.io.save(deck))
+        self.io.shutdown()
+
+    def list_decks(self):
+        return [{"deck": key, "name": deck.name, "score": deck.score, "card_count": len(deck)}
+                for key, deck in self.decks.items()]
+
+    async def next_card(self, key, now=None, by_recall=False):
+        async with self._locks[self._key(key)]:
+            deck = await self._loaded(key)
+            now = time.time() if now is None else now
+            if by_recall:
+                cards = await self._run(deck.by_recall, now, 1, True)
+            else:
+                cards = await self._run(deck.due_cards, now, 1)
+            return Deck._card_to_dict(cards[0]) if cards else None
+
+    async def add_card(self, key, front, back):
+        if not isinstance(front, str) or not isinstance(back, str) or not front.strip() or not back.strip():
+            raise HTTPError(400, "A card needs a front and a back")
+        async with self._locks[self._key(key)]:
+            deck = await self._loaded(key)
+            card = Flashcard(front.strip(), back.strip())
+            await self._run(deck.insert_card_sorted, card)
+            self._changed(key)
+            return Deck._card_to_dict(card)
+
+    async def remove_card(self, key, card_id):
+        async with self._locks[self._key(key)]:
+            deck = await self._loaded(key)
+            if not await self._run(deck.remove_card, card_id):
+                raise HTTPError(404, f"No card {card_id}")
+            self._changed(key)
+
+    async def rate_card(self, key, card_id, rating, now=None):
+        if not isinstance(rating, int) or isinstance(rating, bool) or rating not in (0, 1, 2):
+            raise HTTPError(400, "The rating must be 0, 1 or 2")
+        async with self._locks[self._key(key)]:
+            deck = await self._loaded(key)
+            card = deck.get_card(card_id)
+            if card is None:
+                raise HTTPError(404, f"No card {card_id}")
+            await self._run(deck.rate_card, card, rating, now)
+            self._changed(key)
+            return Deck._card_to_dict(card)
+
+    def _key(self, key):
+        if key not in self.decks:
+            raise HTTPError(404, f"No deck {key}")
+        return key
+
+    async def _loaded(self, key):
+        # Called with the deck's lock held, so its cards are read once
+        deck = self.decks[key]
+        if not deck.loaded:
+            await asyncio.wrap_future(self.io.load_cards(deck))
+        return deck
+
+    async def _run(self, function, *args):
+        # Called with the deck's lock held, so only one thread uses the deck at a time
+        return await asyncio.wrap_future(self.io.run(function, *args))
+
+    def _changed(self, key):
+        if key not in self._saves:
+            self._saves[key] = asyncio.create_task(self._save_later(key))
+
+    async def _save_later(self, key):
+        await asyncio.sleep(self.save_delay)
+        async with self._locks[key]:
+            # Changes made from now on schedule the next save
+            del self._saves[key]
+            await asyncio.wrap_future(self.io.save(self.decks[key]))
+
+class StudyServer:
+    '''
+    A small HTTP/1.1 server for a DeckService, with keep-alive connections
+    '''
+
+    def __init__(self, service):
+        self.service = service
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._respond(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            # The request could not be read, so the connection cannot be reused
+            self._write_response(writer, e.status, {"error": str(e)}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        '''
+        Returns (method, target, headers, body) or None once the client is gone
+        '''
+
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    async def _respond(self, method, target, body):
+        '''
+        Routes one request, returns (status, JSON payload or None)
+        '''
+
+        try:
+            url = urlsplit(target)
+            parts = [unquote(part) for part in url.path.strip("/").split("/")]
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "The body is not valid JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "The body must be a JSON object")
+            now = query.get("now", data.get("now"))
+            if now is not None:
+                try:
+                    now = float(now)
+                except (TypeError, ValueError):
+                    raise HTTPError(400, "now must be a number")
+            return await self._route(method, parts, query, data, now)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def _route(self, method, parts, query, data, now):
+        service = self.service
+        if parts[0] != "decks" or len(parts) > 5:
+            raise HTTPError(404, "Unknown path")
+
+        if len(parts) == 1:
+            self._allow(method, "GET")
+            return 200, service.list_decks()
+
+        key = parts[1]
+        if len(parts) == 3 and parts[2] == "next":
+            self._allow(method, "GET")
+            card = await service.next_card(key, now, query.get("order") == "recall")
+            return (200, card) if card is not None else (204, None)
+
+        if len(parts) == 3 and parts[2] == "cards":
+            self._allow(method, "POST")
+            return 201, await service.add_card(key, data.get("front"), data.get("back"))
+
+        if len(parts) == 4 and parts[2] == "cards":
+            self._allow(method, "DELETE")
+            await service.remove_card(key, parts[3])
+            return 204, None
+
+        if len(parts) == 5 and parts[2] == "cards" and parts[4] == "rate":
+            self._allow(method, "POST")
+            return 200, await service.rate_card(key, parts[3], data.get("rating"), now)
+
+        raise HTTPError(404, "Unknown path")
+
+    @staticmethod
+    def _allow(method, allowed):
+        if method != allowed:
+            raise HTTPError(405, f"Use {allowed}")
+
+class StudyClient:
+    '''
+    A client for the study server that keeps its connection open
+    Used by the tests and benchmark_server.py
+    '''
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, data=None):
+        '''
+        Returns (status, decoded JSON body or None)
+        '''
+
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        self._writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        payload = await self._reader.readexactly(length) if length else b""
+        return status, json.loads(payload) if payload else None
+
+    @staticmethod
+    def path(*parts):
+        return "/" + "/".join(quote(part, safe="") for part in parts)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+async def serve(directory, host, port, workers):
+    service = DeckService(directory, workers)
+    await service.open()
+    server = StudyServer(service)
+    host, port = await server.start(host, port)
+    print(f"Serving {len(service.decks)} decks from {directory} on http://{host}:{port}", flush=True)
+
+    # Stopping the server saves the changed decks first
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves the decks in a directory over HTTP")
+    parser.add_argument("directory", help="directory of deck files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=4, help="threads that read and save decks")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    try:
+        asyncio.run(serve(args.directory, args.host, args.port, args.workers))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
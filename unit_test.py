@@ -1,6 +1,21 @@
 # test_flashcards.py
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
-from backend import Flashcard, Deck
+from concurrent.futures import Future
+from unittest import mock
+import instrumentation
+from backend import (Flashcard, RatingHistory, Deck, Scheduler, StudySession, GlobalStudySession, ReviewJournal,
+                     CollectionStore, CompactDeck, SearchIndex, DuplicateIndex, BackgroundIO, Autosaver, LazyDeck,
+                     MappedDeck, RecallModel, search_decks, atomic_open, DECK_FORMAT)
+import backend
 
 class TestFlashcardDeck(unittest.TestCase):
 
@@ -65,5 +80,1642 @@ class TestFlashcardDeck(unittest.TestCase):
         self.assertEqual(self.deck.score, sum(ratings), "Deck score should reflect new study session ratings")
         self.assertEqual([c.last_score for c in self.deck.cards], [1, 2], "Cards should be sorted by updated score")
 
+    def test_rate_card_keeps_deck_sorted(self):
+        for card in (self.card1, self.card2, self.card3):
+            self.deck.add_card(card)
+
+        # Ratings move cards between buckets without calling sort_by_score
+        self.deck.rate_card(self.card1, 2)
+        self.deck.rate_card(self.card2, 1)
+
+        self.assertEqual(self.deck.cards, (self.card3, self.card2, self.card1))
+
+    def test_buckets_are_stable(self):
+        for card in (self.card1, self.card2, self.card3):
+            self.deck.add_card(card)
+
+        for card in (self.card3, self.card1, self.card2):
+            self.deck.rate_card(card, 1)
+
+        self.assertEqual(self.deck.cards, (self.card3, self.card1, self.card2),
+                         "Cards with the same score should stay in the order they were rated")
+
+    def test_remove_card_updates_sorted_view(self):
+        self.card1.last_score = 1
+        for card in (self.card1, self.card2, self.card3):
+            self.deck.insert_card_sorted(card)
+
+        self.assertTrue(self.deck.remove_card(self.card3.id))
+        self.assertFalse(self.deck.remove_card(self.card3.id))
+        self.assertEqual(self.deck.cards, (self.card2, self.card1))
+        self.assertEqual(len(self.deck), 2)
+        self.assertEqual(self.deck.max_score(), 4)
+
+    def test_index_of_follows_sorted_order(self):
+        for card, score in zip([self.card1, self.card2, self.card3], [2, 0, 1]):
+            card.last_score = score
+            self.deck.add_card(card)
+
+        self.assertEqual(self.deck.index_of(self.card2.id), 0)
+        self.assertEqual(self.deck.index_of(self.card1.id), 2)
+
+        self.deck.remove_card(self.card2.id)
+        self.assertIsNone(self.deck.index_of(self.card2.id))
+        self.assertEqual(self.deck.index_of(self.card3.id), 0)
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.deck = Deck("Scheduled Deck")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}", created_at=100 + i) for i in range(5)]
+        for card in self.cards:
+            self.deck.add_card(card)
+
+    def test_due_cards_ordered_by_due_time(self):
+        self.assertEqual(self.deck.due_cards(now=102), self.cards[:3])
+        self.assertEqual(self.deck.due_cards(now=99), [])
+        self.assertEqual(self.deck.due_cards(now=200, limit=2), self.cards[:2])
+
+    def test_rating_reschedules_card(self):
+        self.deck.rate_card(self.cards[0], 2, now=1000)
+        self.deck.rate_card(self.cards[1], 0, now=1000)
+
+        self.assertEqual(self.cards[0].due, 1000 + Scheduler.INITIAL_INTERVALS[2])
+        self.assertEqual(self.deck.due_cards(now=1000), self.cards[2:])
+        self.assertEqual(self.deck.scheduler.next_due(now=2000), self.cards[2])
+
+        # A second good rating grows the interval
+        interval = self.cards[0].interval
+        self.deck.rate_card(self.cards[0], 2, now=5000)
+        self.assertEqual(self.cards[0].interval, interval * Scheduler.INTERVAL_GROWTH[2])
+
+    def test_removed_cards_are_not_due(self):
+        self.deck.remove_card(self.cards[0].id)
+        self.assertEqual(self.deck.due_cards(now=1000), self.cards[1:])
+        self.assertEqual(len(self.deck.scheduler), 4)
+
+    def test_schedule_persists(self):
+        self.deck.rate_card(self.cards[3], 1, now=1000)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.json")
+            self.deck.save_to_file(path)
+            loaded = Deck.load_from_file(path)
+
+        card = loaded.get_card(self.cards[3].id)
+        self.assertEqual(card.due, self.cards[3].due)
+        self.assertEqual(card.interval, self.cards[3].interval)
+        self.assertNotIn(card, loaded.due_cards(now=1000))
+
+class TestRatingHistory(unittest.TestCase):
+
+    DAY = 24 * 60 * 60
+
+    def test_ring_keeps_latest_ratings_in_constant_memory(self):
+        history = RatingHistory()
+        history.add(0, 0)
+        size = sys.getsizeof(history._ratings) + sys.getsizeof(history._times)
+        for i in range(1, 100):
+            history.add(i % 3, i)
+
+        self.assertEqual(len(history), RatingHistory.SIZE)
+        self.assertEqual(history.to_list(), [[float(i), i % 3] for i in range(92, 100)])
+        self.assertEqual(sys.getsizeof(history._ratings) + sys.getsizeof(history._times), size)
+        self.assertEqual(RatingHistory.from_bytes(history.to_bytes()).to_list(), history.to_list())
+
+    def test_one_good_rating_does_not_hide_weeks_of_fails(self):
+        history = RatingHistory([(day * self.DAY, 0) for day in range(14)] + [(14 * self.DAY, 2)])
+        self.assertLess(history.priority(), 0.5)
+
+        # Old ratings fade, so a card that has been good for weeks recovers
+        history = RatingHistory([(0, 0)] + [(day * self.DAY, 2) for day in range(30, 60, 7)])
+        self.assertGreater(history.priority(), 1.9)
+
+    def test_decks_sort_by_priority(self):
+        for deck_class in (Deck, CompactDeck):
+            deck = deck_class("History")
+            struggling, steady = Flashcard("Struggling", "Card"), Flashcard("Steady", "Card")
+            deck.add_card(struggling)
+            deck.add_card(steady)
+            for day in range(5):
+                deck.rate_card(deck.get_card(struggling.id), 0, now=day * self.DAY)
+                deck.rate_card(deck.get_card(steady.id), 2, now=day * self.DAY)
+            deck.rate_card(deck.get_card(struggling.id), 2, now=5 * self.DAY)
+
+            self.assertEqual([card.id for card in deck.cards], [struggling.id, steady.id])
+            self.assertEqual(len(deck.get_card(struggling.id).history), 6)
+
+    def test_history_is_saved_and_journaled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.jsonl")
+            deck = Deck("History")
+            card = Flashcard("Front", "Back")
+            deck.add_card(card)
+            deck.rate_card(card, 0, now=1000)
+            deck.save_to_file(path)
+            deck.rate_card(card, 2, now=2000)
+            deck.save_changes()
+
+            for deck_class in (Deck, CompactDeck):
+                loaded = deck_class.load_from_file(path)
+                self.assertEqual(loaded.get_card(card.id).history.to_list(), [[1000.0, 0], [2000.0, 2]])
+
+    def test_sqlite_decks_keep_history(self):
+        store = CollectionStore(":memory:")
+        deck = store.create_deck("History")
+        first, second = Flashcard("First", "Card"), Flashcard("Second", "Card")
+        deck.add_cards([first, second])
+        deck.rate_card(deck.get_card(first.id), 2, now=0)
+        deck.rate_card(deck.get_card(second.id), 1, now=0)
+
+        self.assertEqual([card.id for card in deck.cards], [second.id, first.id])
+        self.assertEqual(deck.get_card(first.id).history.to_list(), [[0.0, 2]])
+        store.close()
+
+    def test_old_sqlite_stores_are_migrated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "old.db")
+            conn = sqlite3.connect(path)
+            conn.executescript('''
+                CREATE TABLE decks (id INTEGER PRIMARY KEY, name TEXT NOT NULL, score INTEGER NOT NULL DEFAULT 0,
+                    card_count INTEGER NOT NULL DEFAULT 0, head INTEGER NOT NULL DEFAULT 0,
+                    tail INTEGER NOT NULL DEFAULT 0);
+                CREATE TABLE cards (deck_id INTEGER NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+                    id TEXT NOT NULL, front TEXT NOT NULL, back TEXT NOT NULL,
+                    last_score INTEGER NOT NULL DEFAULT 0, position INTEGER NOT NULL,
+                    due REAL NOT NULL DEFAULT 0, interval REAL NOT NULL DEFAULT 0, PRIMARY KEY (deck_id, id));
+                INSERT INTO decks VALUES (1, 'Old', 0, 2, 0, 2);
+                INSERT INTO cards VALUES (1, 'a', 'A', 'A', 2, 1, 0, 0);
+                INSERT INTO cards VALUES (1, 'b', 'B', 'B', 0, 2, 0, 0);
+            ''')
+            conn.commit()
+            conn.close()
+
+            store = CollectionStore(path)
+            deck = store.list_decks()[0]
+            self.assertEqual([card.id for card in deck.cards], ["b", "a"])
+            deck.rate_card(deck.get_card("b"), 2, now=0)
+            self.assertEqual(deck.get_card("b").history.to_list(), [[0.0, 2]])
+            store.close()
+
+class TestStudySession(unittest.TestCase):
+
+    def setUp(self):
+        self.deck = Deck("Study Deck")
+        self.deck.score = 5
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}", created_at=i) for i in range(5)]
+        for card in self.cards:
+            self.deck.add_card(card)
+
+    def test_cards_come_in_due_order_and_are_rated(self):
+        session = StudySession(self.deck, now=3)
+        seen = []
+        for card, rating in zip(session, [2, 1, 0, 2]):
+            seen.append(card)
+            session.rate(rating)
+
+        self.assertEqual(seen, self.cards[:4])
+        self.assertTrue(session.finished)
+        self.assertEqual((session.reviewed, session.score, session.max_score()), (4, 5, 8))
+        self.assertEqual(self.deck.score, 5)
+        self.assertEqual(self.deck.due_cards(now=3), [])
+
+    def test_limit_and_nothing_due(self):
+        session = StudySession(self.deck, now=10, limit=2)
+        for card in session:
+            session.rate(1)
+        self.assertEqual(session.reviewed, 2)
+
+        self.assertTrue(StudySession(self.deck, now=-1).finished)
+        self.assertEqual(self.deck.score, 2)
+
+    def test_card_must_be_rated_before_the_next(self):
+        session = StudySession(self.deck, now=10)
+        with self.assertRaises(RuntimeError):
+            for card in session:
+                pass
+
+    def test_autosave_journals_each_rating(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.jsonl")
+            self.deck.save_to_file(path)
+            session = StudySession(self.deck, now=10, autosave=True)
+            session.rate(2)
+
+            self.assertGreater(ReviewJournal(path).size(), 0)
+            self.assertEqual(Deck.load_from_file(path).score, 2)
+
+    def test_works_with_compact_decks(self):
+        compact = CompactDeck("Compact")
+        compact.add_cards(self.cards)
+        session = StudySession(compact, now=10)
+        for card in session:
+            session.rate(2)
+        self.assertEqual(session.reviewed, 5)
+        self.assertEqual(compact.score, 10)
+
+class TestGlobalStudySession(unittest.TestCase):
+
+    def setUp(self):
+        # Due times interleave across the decks: deck 0 has 0, 3, 6..., deck 1 has 1, 4, 7...
+        self.decks = []
+        for d in range(3):
+            deck = Deck(f"Deck {d}")
+            deck.score = 5
+            for i in range(40):
+                deck.add_card(Flashcard(f"Front {d} {i}", f"Back {d} {i}", created_at=3 * i + d))
+            self.decks.append(deck)
+        empty = Deck("Empty")
+        empty.score = 5
+        self.decks.append(empty)
+
+    def test_cards_from_all_decks_come_in_due_order(self):
+        session = GlobalStudySession(self.decks, now=100)
+        seen = []
+        for card in session:
+            seen.append((card.due, session.current_deck.name))
+            session.rate(2)
+
+        self.assertEqual([due for due, _ in seen], list(range(101)))
+        self.assertEqual(seen[:3], [(0, "Deck 0"), (1, "Deck 1"), (2, "Deck 2")])
+        self.assertTrue(all(deck.due_cards(now=100) == [] for deck in self.decks))
+
+    def test_decks_join_after_the_start(self):
+        session = GlobalStudySession([self.decks[0]], now=100)
+        seen = [session.current_card.due]
+        session.rate(2)
+        session.add_deck(self.decks[1])
+        session.add_deck(self.decks[1])
+        for card in session:
+            seen.append(card.due)
+            session.rate(2)
+
+        # The card after the first was handed out before the deck joined
+        self.assertEqual(seen[:4], [0, 3, 1, 4])
+        self.assertEqual(len(seen), 34 + 34)
+
+        # A session that ran out of cards goes on with a deck added later
+        session.add_deck(self.decks[2])
+        self.assertFalse(session.finished)
+        self.assertEqual(session.current_deck, self.decks[2])
+
+    def test_ratings_go_to_the_owning_deck(self):
+        session = GlobalStudySession(self.decks, now=100, limit=4)
+        for card, rating in zip(session, [2, 1, 0, 2]):
+            session.rate(rating)
+
+        self.assertEqual([deck.score for deck in self.decks], [4, 1, 0, 5])
+        self.assertEqual([deck.name for deck in session.studied_decks], ["Deck 0", "Deck 1", "Deck 2"])
+        self.assertEqual((session.reviewed, session.score), (4, 5))
+
+    def test_start_only_reads_a_batch_per_deck(self):
+        with mock.patch.object(Deck, "due_cards", autospec=True, side_effect=Deck.due_cards) as due_cards:
+            session = GlobalStudySession(self.decks, now=1000)
+        self.assertEqual(due_cards.call_count, 3)
+        self.assertTrue(all(call.args[2] == StudySession.BATCH_SIZE for call in due_cards.call_args_list))
+        self.assertEqual(session.current_card.due, 0)
+
+class TestRecallModel(unittest.TestCase):
+
+    def setUp(self):
+        # (due, interval): recall at now=100 is 0.9 ** (1 + (100 - due) / interval)
+        self.schedule = [(90, 10), (50, 100), (100, 0), (200, 50), (0, 10), (98, 10)]
+        self.cards = []
+        for i, (due, interval) in enumerate(self.schedule):
+            card = Flashcard(f"Front {i}", f"Back {i}", created_at=i)
+            card.due, card.interval = due, interval
+            self.cards.append(card)
+        self.expected = [2, 4, 0, 1, 5, 3]
+
+    def test_recall_decays_from_target(self):
+        recall = RecallModel.recall([100, 100, 0, 200], [10, 0, 50, 50], 100)
+        self.assertAlmostEqual(recall[0], 0.9)
+        self.assertEqual(recall[1], 0)
+        self.assertAlmostEqual(recall[2], 0.9 ** 3)
+        self.assertAlmostEqual(recall[3], 1.0)
+        self.assertAlmostEqual(RecallModel.card_recall(self.cards[0], 100), 0.81)
+
+    def test_order(self):
+        due = [due for due, _ in self.schedule]
+        interval = [interval for _, interval in self.schedule]
+        self.assertEqual(RecallModel.order(due, interval, 100), self.expected)
+        self.assertEqual(RecallModel.order(due, interval, 100, limit=3), self.expected[:3])
+        self.assertEqual(RecallModel.order(due, interval, 100, due_only=True), [2, 4, 0, 1, 5])
+        self.assertEqual(RecallModel.order([], [], 100), [])
+
+    def test_ties_keep_column_order(self):
+        self.assertEqual(RecallModel.order([0] * 40, [0] * 40, 100, limit=16), list(range(16)))
+        self.assertEqual(RecallModel.order([0] * 40, [10] * 20 + [0] * 20, 100, limit=5), list(range(20, 25)))
+        self.assertEqual(RecallModel.order([0] * 4, [0] * 4, 100, limit=0), [])
+
+    def test_session_scores_the_deck_once(self):
+        deck = Deck("Recall")
+        deck.add_cards(Flashcard(f"Front {i}", f"Back {i}", created_at=i) for i in range(100))
+        with mock.patch.object(Deck, "by_recall", autospec=True, side_effect=Deck.by_recall) as by_recall:
+            session = StudySession(deck, now=1000, by_recall=True)
+            for card in session:
+                session.rate(1)
+        self.assertEqual(by_recall.call_count, 1)
+        self.assertEqual(session.reviewed, 100)
+
+    def test_same_order_for_every_deck_class(self):
+        store = CollectionStore(":memory:")
+        decks = [Deck("Recall"), CompactDeck("Recall"), store.create_deck("Recall")]
+        ids = [self.cards[i].id for i in self.expected]
+        for deck in decks:
+            deck.add_cards(self.cards)
+            self.assertEqual([card.id for card in deck.by_recall(now=100)], ids, type(deck).__name__)
+            self.assertEqual([card.id for card in deck.by_recall(now=100, limit=2, due_only=True)], ids[:2])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.mkdb")
+            MappedDeck.save(decks[0], path)
+            mapped = MappedDeck.load_from_file(path)
+            self.assertEqual([card.id for card in mapped.by_recall(now=100)], ids)
+            mapped.close()
+        store.close()
+
+    def test_study_session_by_recall(self):
+        deck = Deck("Recall")
+        deck.add_cards(self.cards)
+        session = StudySession(deck, now=100, by_recall=True)
+        seen = []
+        for card in session:
+            seen.append(card.id)
+            session.rate(2)
+        self.assertEqual(seen, [self.cards[i].id for i in [2, 4, 0, 1, 5]])
+
+    def test_global_session_by_recall(self):
+        decks = [Deck("First"), Deck("Second")]
+        for i, card in enumerate(self.cards):
+            decks[i % 2].add_card(card)
+        session = GlobalStudySession(decks, now=100, by_recall=True)
+        seen = [card.id for card in session if session.rate(2) or True]
+        self.assertEqual(seen, [self.cards[i].id for i in [2, 4, 0, 1, 5]])
+
+    def test_python_fallback_matches_numpy(self):
+        due = [due for due, _ in self.schedule]
+        interval = [interval for _, interval in self.schedule]
+        with mock.patch.object(backend, "np", None):
+            recall = list(RecallModel.recall(due, interval, 100))
+            self.assertEqual(RecallModel.order(due, interval, 100), self.expected)
+        if backend.np is not None:
+            self.assertEqual(RecallModel.recall(due, interval, 100).tolist(), recall)
+
+class TestDeckFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck = Deck("File Deck")
+        self.deck.score = 3
+        for i, score in enumerate([2, 0, 1]):
+            card = Flashcard(f"Front {i}", f"Back {i}")
+            card.last_score = score
+            self.deck.add_card(card)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_writes_header_and_one_card_per_line(self):
+        self.deck.save_to_file(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+        header = json.loads(lines[0])
+        self.assertEqual(header["format"], DECK_FORMAT)
+        self.assertEqual(header["card_count"], 3)
+        self.assertEqual([json.loads(line)["last_score"] for line in lines[1:]], [0, 1, 2])
+
+    def test_round_trip(self):
+        self.deck.save_to_file(self.path)
+        loaded = Deck.load_from_file(self.path)
+
+        self.assertEqual(loaded.name, "File Deck")
+        self.assertEqual(loaded.score, 3)
+        self.assertEqual([c.id for c in loaded.cards], [c.id for c in self.deck.cards])
+
+    def test_iter_cards_is_lazy(self):
+        self.deck.save_to_file(self.path)
+        cards = Deck.iter_cards_from_file(self.path)
+
+        self.assertIsInstance(cards, types.GeneratorType)
+        self.assertEqual(next(cards).id, self.deck.cards[0].id)
+        self.assertEqual(len(list(cards)), 2)
+
+    def test_loads_and_converts_old_json(self):
+        old_path = os.path.join(self.tmp.name, "old.json")
+        with open(old_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "name": "Old Deck",
+                "score": 1,
+                "cards": [{"id": "a", "front": "F", "back": "B", "last_score": 1}]
+            }, f, indent=4)
+
+        loaded = Deck.load_from_file(old_path)
+        self.assertEqual(loaded.name, "Old Deck")
+        self.assertEqual(loaded.get_card("a").last_score, 1)
+        self.assertEqual([c.id for c in Deck.iter_cards_from_file(old_path)], ["a"])
+
+        loaded.save_to_file(old_path)
+        with open(old_path, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readline())["format"], DECK_FORMAT)
+
+class TestReviewJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck = Deck("Journal Deck")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}") for i in range(4)]
+        for card in self.cards:
+            self.deck.add_card(card)
+        self.deck.save_to_file(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def snapshot_mtime(self):
+        return os.stat(self.path).st_mtime_ns
+
+    def test_changes_are_appended_not_rewritten(self):
+        before = self.snapshot_mtime()
+        self.deck.rate_card(self.cards[0], 2, now=1000)
+        self.deck.save_changes()
+
+        self.assertEqual(self.snapshot_mtime(), before)
+        self.assertGreater(ReviewJournal(self.path).size(), 0)
+
+    def test_replay_rebuilds_deck(self):
+        self.deck.score = 0
+        self.deck.rate_card(self.cards[0], 2, now=1000)
+        self.deck.rate_card(self.cards[2], 1, now=1000)
+        self.deck.remove_card(self.cards[1].id)
+        new_card = Flashcard("New", "Card")
+        self.deck.insert_card_sorted(new_card)
+        self.deck.name = "Renamed"
+        self.deck.save_changes()
+
+        loaded = Deck.load_from_file(self.path)
+        self.assertEqual(loaded.name, "Renamed")
+        self.assertEqual(loaded.score, 3)
+        self.assertEqual([c.id for c in loaded.cards], [c.id for c in self.deck.cards])
+        self.assertEqual(loaded.get_card(self.cards[0].id).due, self.cards[0].due)
+        self.assertEqual([c.id for c in loaded.due_cards(now=1000)],
+                         [c.id for c in self.deck.due_cards(now=1000)])
+
+    def test_truncated_record_is_ignored(self):
+        self.deck.rate_card(self.cards[0], 2, now=1000)
+        self.deck.save_changes()
+        with open(ReviewJournal(self.path).filename, "a", encoding="utf-8") as f:
+            f.write('{"op": "rate", "id": ')
+
+        loaded = Deck.load_from_file(self.path)
+        self.assertEqual(loaded.get_card(self.cards[0].id).last_score, 2)
+
+    def test_save_after_truncated_record_is_kept(self):
+        with open(ReviewJournal(self.path).filename, "a", encoding="utf-8") as f:
+            f.write('{"op": "rate", "id": ')
+
+        loaded = Deck.load_from_file(self.path)
+        self.assertTrue(loaded.dirty)
+        loaded.rate_card(loaded.get_card(self.cards[0].id), 2, now=1000)
+        loaded.remove_card(self.cards[1].id)
+        loaded.save_changes()
+
+        header = Deck.read_header(self.path)
+        reloaded = Deck.load_from_file(self.path)
+        self.assertEqual((header["score"], header["card_count"]), (2, 3))
+        self.assertEqual((reloaded.score, len(reloaded)), (2, 3))
+        self.assertFalse(reloaded.dirty)
+
+        compact = CompactDeck.load_from_file(self.path)
+        self.assertEqual((compact.score, len(compact)), (2, 3))
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        journal = ReviewJournal(self.path)
+        with mock.patch.object(ReviewJournal, "COMPACT_THRESHOLD", 1):
+            self.deck.rate_card(self.cards[3], 2, now=1000)
+            self.deck.save_changes()
+
+        self.assertEqual(journal.size(), 0)
+        loaded = Deck.load_from_file(self.path)
+        self.assertEqual(loaded.get_card(self.cards[3].id).last_score, 2)
+
+class TestBackgroundIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck = Deck("Background Deck")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}") for i in range(4)]
+        for card in self.cards:
+            self.deck.add_card(card)
+        self.io = BackgroundIO()
+
+    def tearDown(self):
+        self.io.shutdown()
+        self.tmp.cleanup()
+
+    def test_failed_write_keeps_old_file(self):
+        self.deck.save_to_file(self.path)
+        with self.assertRaises(RuntimeError):
+            with atomic_open(self.path) as f:
+                f.write("partial")
+                raise RuntimeError("disk full")
+
+        self.assertEqual(len(Deck.load_from_file(self.path).cards), 4)
+        self.assertEqual(os.listdir(self.tmp.name), ["deck.jsonl"])
+
+    def test_save_that_finishes_at_once(self):
+        # A deck with nothing to write can finish before its callback is added
+        def finished(function, *args):
+            future = Future()
+            future.set_result(function(*args))
+            return future
+
+        self.deck.save_to_file(self.path)
+        with mock.patch.object(self.io._executor, "submit", side_effect=finished):
+            futures = [self.io.save(self.deck) for _ in range(3)]
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(self.io._saves, {})
+
+    def test_repeated_saves_are_coalesced(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        original = Deck.save_changes
+
+        def slow_save(deck, filename=None):
+            calls.append(filename)
+            started.set()
+            release.wait(5)
+            original(deck, filename)
+
+        with mock.patch.object(Deck, "save_changes", slow_save):
+            first = self.io.save(self.deck, self.path)
+            started.wait(5)
+            later = [self.io.save(self.deck, self.path) for _ in range(5)]
+            release.set()
+            for future in [first] + later:
+                future.result(5)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(set(map(id, later))), 1)
+
+    def test_rating_during_save_is_not_lost(self):
+        self.deck.save_to_file(self.path)
+        original = Deck._card_to_dict
+
+        def rate_while_writing(card):
+            if card is self.cards[0]:
+                self.deck.rate_card(self.cards[1], 2, now=1000)
+            return original(card)
+
+        with mock.patch.object(Deck, "_card_to_dict", staticmethod(rate_while_writing)):
+            self.deck.score += 1
+            self.deck.remove_card(self.cards[3].id)
+            self.deck.save_to_file(self.path)
+        self.deck.save_changes()
+
+        loaded = Deck.load_from_file(self.path)
+        self.assertEqual(loaded.get_card(self.cards[1].id).last_score, 2)
+
+    def test_load_many(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp.name, f"deck{i}.jsonl")
+            Deck(f"Deck {i}").save_to_file(path)
+            paths.append(path)
+
+        decks = [future.result(5) for future in self.io.load_many(paths)]
+        self.assertEqual([deck.name for deck in decks], ["Deck 0", "Deck 1", "Deck 2"])
+
+    def test_shutdown_waits_for_saves(self):
+        self.io.save(self.deck, self.path)
+        self.io.save(self.deck, self.path)
+        self.io.shutdown()
+
+        self.assertEqual(len(Deck.load_from_file(self.path).cards), 4)
+
+class TestAutosave(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.io = BackgroundIO()
+
+    def tearDown(self):
+        self.io.shutdown()
+        self.tmp.cleanup()
+
+    def saved_deck(self, deck_class=Deck, name="Deck"):
+        deck = deck_class(name)
+        for i in range(3):
+            deck.add_card(Flashcard(f"Front {i}", f"Back {i}"))
+        deck.save_to_file(os.path.join(self.tmp.name, f"{name}.jsonl"))
+        return deck_class.load_from_file(deck.filename)
+
+    def test_mutations_mark_deck_dirty(self):
+        for deck_class in (Deck, CompactDeck):
+            deck = self.saved_deck(deck_class)
+            self.assertFalse(deck.dirty)
+
+            changes = [
+                lambda: deck.add_card(Flashcard("New", "Card")),
+                lambda: deck.remove_card(deck.cards[0].id),
+                lambda: deck.rate_card(deck.cards[0], 2, now=1000),
+                lambda: setattr(deck, "name", "Renamed"),
+            ]
+            for change in changes:
+                change()
+                self.assertTrue(deck.dirty)
+                deck.save_changes()
+                self.assertFalse(deck.dirty)
+
+    def test_sqlite_deck_is_dirty_until_committed(self):
+        store = CollectionStore(":memory:")
+        deck = store.create_deck("Sqlite")
+        store.commit()
+        self.assertFalse(deck.dirty)
+
+        deck.add_card(Flashcard("Front", "Back"))
+        self.assertTrue(deck.dirty)
+        self.io.save(deck).result(5)
+        self.assertFalse(deck.dirty)
+        store.close()
+
+    def test_saves_are_debounced(self):
+        deck = self.saved_deck()
+        autosaver = Autosaver(self.io, delay=2)
+
+        deck.rate_card(deck.cards[0], 2, now=1000)
+        autosaver.schedule(deck, now=0)
+        deck.rate_card(deck.cards[1], 2, now=1000)
+        autosaver.schedule(deck, now=1.5)
+
+        self.assertEqual(autosaver.flush(now=2), [])
+        self.assertEqual(autosaver.next_deadline(), 3.5)
+        for future in autosaver.flush(now=3.5):
+            future.result(5)
+
+        self.assertFalse(deck.dirty)
+        self.assertIsNone(autosaver.next_deadline())
+        loaded = Deck.load_from_file(deck.filename)
+        self.assertEqual(loaded.get_card(deck.cards[-1].id).last_score, 2)
+
+    def test_imported_cards_are_autosaved(self):
+        deck = self.saved_deck()
+        text = os.path.join(os.path.dirname(deck.filename), "import.csv")
+        with open(text, "w", encoding="utf-8") as f:
+            f.write("Imported 1,Back\nImported 2,Back\n")
+        autosaver = Autosaver(self.io)
+
+        self.assertEqual(deck.import_text(text), 2)
+        self.assertTrue(deck.dirty)
+        autosaver.schedule(deck)
+        futures = autosaver.flush()
+        self.assertEqual(len(futures), 1)
+        futures[0].result(5)
+
+        self.assertEqual(len(Deck.load_from_file(deck.filename)), len(deck))
+
+    def test_flush_skips_clean_and_unsaved_decks(self):
+        clean = self.saved_deck(name="Clean")
+        new = Deck("New")
+        new.add_card(Flashcard("Front", "Back"))
+        autosaver = Autosaver(self.io)
+        autosaver.schedule(clean)
+        autosaver.schedule(new)
+
+        with mock.patch.object(self.io, "save") as save:
+            self.assertEqual(autosaver.flush(), [])
+        save.assert_not_called()
+        self.assertIsNone(autosaver.next_deadline())
+
+class TestLazyDeck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck = Deck("Lazy Deck")
+        self.deck.score = 3
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}") for i in range(5)]
+        for card in self.cards:
+            self.deck.add_card(card)
+        self.deck.save_to_file(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_header_is_read_without_cards(self):
+        with mock.patch.object(Deck, "_card_from_dict", side_effect=AssertionError("card was read")):
+            deck = LazyDeck.load_from_file(self.path)
+            self.assertEqual((deck.name, deck.score, len(deck), deck.max_score()), ("Lazy Deck", 3, 5, 10))
+            self.assertFalse(deck.loaded)
+            self.assertFalse(deck.dirty)
+
+    def test_duplicate_index_is_built_on_a_worker(self):
+        deck = LazyDeck.load_from_file(self.path)
+        io = BackgroundIO()
+        threads = []
+        add_cards = DuplicateIndex.add_cards
+
+        def add_cards_on_thread(index, cards):
+            threads.append(threading.get_ident())
+            return add_cards(index, cards)
+        try:
+            with mock.patch.object(DuplicateIndex, "add_cards", add_cards_on_thread):
+                self.assertIs(io.load_duplicate_index(deck).result(), deck)
+        finally:
+            io.shutdown()
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+        self.assertTrue(deck.loaded)
+        self.assertIsNotNone(deck._duplicate_index)
+        self.assertEqual(deck.find_duplicates(Flashcard("Front 1", "Back 1"))[0].id, self.cards[1].id)
+
+    def test_header_includes_journal(self):
+        self.deck.remove_card(self.cards[0].id)
+        self.deck.rate_card(self.cards[1], 2, now=1000)
+        self.deck.name = "Renamed"
+        self.deck.save_changes()
+
+        header = Deck.read_header(self.path)
+        self.assertEqual((header["name"], header["score"], header["card_count"]), ("Renamed", 5, 4))
+
+    def test_old_journal_is_replayed(self):
+        ReviewJournal(self.path).append([{"op": "remove", "id": self.cards[0].id},
+                                         {"op": "meta", "name": "Old", "score": 1}])
+        self.assertEqual(Deck.read_header(self.path)["card_count"], 4)
+
+    def test_cards_are_read_on_first_use(self):
+        deck = LazyDeck.load_from_file(self.path)
+        self.assertEqual([card.id for card in deck.cards], [card.id for card in self.deck.cards])
+        self.assertTrue(deck.loaded)
+
+        deck.rate_card(deck.cards[0], 2, now=1000)
+        deck.name = "Studied"
+        self.assertTrue(deck.dirty)
+        deck.save_changes()
+
+        loaded = Deck.load_from_file(self.path)
+        self.assertEqual(loaded.name, "Studied")
+        self.assertEqual(loaded.get_card(self.cards[0].id).last_score, 2)
+
+    def test_unread_deck_is_not_saved(self):
+        deck = LazyDeck.load_from_file(self.path)
+        before = os.stat(self.path).st_mtime_ns
+        deck.save_changes()
+
+        self.assertFalse(deck.loaded)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, before)
+
+    def test_background_load(self):
+        io = BackgroundIO()
+        try:
+            deck = io.load_many([self.path], LazyDeck)[0].result(5)
+            self.assertIsInstance(io.load_cards(deck).result(5), Deck)
+            self.assertTrue(deck.loaded)
+        finally:
+            io.shutdown()
+
+class TestMappedDeck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.path = os.path.join(self.tmp.name, "deck.mkdb")
+        self.deck = Deck("Mapped Deck")
+        self.deck.score = 7
+        for i in range(20):
+            self.deck.add_card(Flashcard(f"Front {i} é漢", f"Back {i}", created_at=i))
+        self.deck.add_card(Flashcard("Odd", "Id", card_id="a", created_at=0))
+        self.deck.rate_card(self.deck.cards[4], 2, now=1000.5)
+        self.deck.save_to_file(self.json_path)
+        MappedDeck.save(self.deck, self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trips_json_deck(self):
+        with MappedDeck.load_from_file(self.path) as deck:
+            self.assertEqual((deck.name, deck.score, len(deck)), ("Mapped Deck", 9, 21))
+            copy_path = os.path.join(self.tmp.name, "copy.jsonl")
+            deck.to_deck().save_to_file(copy_path)
+
+        with open(self.json_path, encoding="utf-8") as original, open(copy_path, encoding="utf-8") as copy:
+            self.assertEqual(copy.read(), original.read())
+
+    def test_get_card(self):
+        with MappedDeck(self.path) as deck:
+            for card in self.deck.cards:
+                found = deck.get_card(card.id)
+                self.assertEqual((found.id, found.front, found.back, found.last_score, found.due, found.interval),
+                                 (card.id, card.front, card.back, card.last_score, card.due, card.interval))
+            self.assertIsNone(deck.get_card("missing"))
+
+    def test_iteration_and_due_cards(self):
+        with MappedDeck(self.path) as deck:
+            self.assertEqual([card.id for card in deck], [card.id for card in self.deck.cards])
+            self.assertEqual([card.id for card in deck.cards[2:5]], [card.id for card in self.deck.cards[2:5]])
+            self.assertEqual([card.id for card in deck.due_cards(now=10, limit=3)],
+                             [card.id for card in self.deck.due_cards(now=10, limit=3)])
+
+    def test_empty_deck(self):
+        MappedDeck.save(Deck("Empty"), self.path)
+        with MappedDeck(self.path) as deck:
+            self.assertEqual(len(deck), 0)
+            self.assertEqual(list(deck), [])
+            self.assertIsNone(deck.get_card("a"))
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            MappedDeck(self.json_path)
+
+class TestTextImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.deck = Deck("Import Deck")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+    def test_csv_with_quoted_fields(self):
+        path = self.write("cards.csv", 'hola,hello\n"adi\u00f3s, amigo","bye, friend"\n\n')
+        self.assertEqual(self.deck.import_text(path), 2)
+        self.assertEqual([(c.front, c.back) for c in self.deck.cards],
+                         [("hola", "hello"), ("adi\u00f3s, amigo", "bye, friend")])
+
+    def test_anki_export_header(self):
+        path = self.write("anki.txt", "#separator:Semicolon\n#html:false\nfront;back;tag1 tag2\n")
+        self.deck.import_text(path)
+        card = self.deck.cards[0]
+        self.assertEqual((card.front, card.back), ("front", "back"))
+
+    def test_batches_and_progress(self):
+        path = self.write("cards.tsv", "".join(f"f{i}\tb{i}\n" for i in range(25)))
+        progress = []
+        self.deck.import_text(path, progress=progress.append, batch_size=10)
+
+        self.assertEqual(progress, [10, 20, 25])
+        self.assertEqual(len(self.deck), 25)
+        self.assertEqual(self.deck.cards[-1].front, "f24")
+
+    def test_bulk_import_is_saved_as_snapshot(self):
+        snapshot = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck.save_to_file(snapshot)
+        self.deck.import_text(self.write("cards.tsv", "a\tb\n"))
+        self.deck.save_changes()
+
+        self.assertEqual(ReviewJournal(snapshot).size(), 0)
+        self.assertEqual(len(Deck.load_from_file(snapshot)), 1)
+
+    def test_row_without_back_is_an_error(self):
+        path = self.write("cards.tsv", "a\tb\nlonely\n")
+        with self.assertRaises(ValueError):
+            self.deck.import_text(path)
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.deck = Deck("Search Deck")
+        self.cards = [
+            Flashcard("The capital of France", "Paris"),
+            Flashcard("The capital of Spain", "Madrid"),
+            Flashcard("France borders Spain", "Yes, in the Pyrenees"),
+        ]
+        for card in self.cards:
+            self.deck.add_card(card)
+
+    def fronts(self, cards):
+        return [card.front for card in cards]
+
+    def test_token_prefix_and_phrase_queries(self):
+        self.assertEqual(self.fronts(self.deck.search("france")),
+                         ["The capital of France", "France borders Spain"])
+        self.assertEqual(self.fronts(self.deck.search("CAPITAL spain")), ["The capital of Spain"])
+        self.assertEqual(self.fronts(self.deck.search("pyr*")), ["France borders Spain"])
+        self.assertEqual(self.fronts(self.deck.search('"of france"')), ["The capital of France"])
+        self.assertEqual(self.deck.search('"spain capital"'), [])
+        self.assertEqual(self.deck.search("london"), [])
+        self.assertEqual(len(self.deck.search("the", limit=1)), 1)
+
+    def test_index_follows_add_and_remove(self):
+        self.deck.search("paris")
+        self.deck.remove_card(self.cards[0].id)
+        self.deck.insert_card_sorted(Flashcard("Paris is in", "France"))
+        self.deck.add_card(Flashcard("Madrid?", "Spain", card_id=self.cards[1].id))
+
+        self.assertEqual(self.fronts(self.deck.search("paris")), ["Paris is in"])
+        self.assertEqual(self.fronts(self.deck.search("capital")), [])
+
+    def test_index_is_saved_with_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.jsonl")
+            self.deck.search("paris")
+            self.deck.save_to_file(path)
+            self.deck.add_card(Flashcard("Rome", "Italy"))
+            self.deck.save_changes()
+
+            with mock.patch.object(SearchIndex, "add_cards") as rebuild:
+                loaded = Deck.load_from_file(path)
+                self.assertEqual(self.fronts(loaded.search("italy")), ["Rome"])
+                rebuild.assert_not_called()
+
+            # A snapshot changed behind the index's back makes it stale
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            self.assertIsNone(SearchIndex.load(path))
+
+    def test_search_across_decks(self):
+        compact = CompactDeck("Compact")
+        compact.add_card(Flashcard("Capital of Italy", "Rome"))
+        store = CollectionStore(":memory:")
+        stored = store.import_deck(self.deck)
+
+        results = search_decks([self.deck, compact, stored], "capital")
+        self.assertEqual([deck.name for deck, _ in results],
+                         ["Search Deck", "Search Deck", "Compact", "Search Deck", "Search Deck"])
+        self.assertEqual(len(search_decks([self.deck, compact], "capital", limit=2)), 2)
+
+        compact.remove_card(compact.cards[0].id)
+        stored.remove_card(self.cards[0].id)
+        self.assertEqual(compact.search("capital"), [])
+        self.assertEqual(self.fronts(stored.search("capital")), ["The capital of Spain"])
+        store.close()
+
+class TestDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.deck = Deck("Duplicate Deck")
+        self.original = Flashcard("What is the capital city of France?", "Paris is the capital")
+        self.other = Flashcard("How many legs does a spider have?", "Eight")
+        self.deck.add_card(self.original)
+        self.deck.add_card(self.other)
+
+    def test_exact_duplicate_ignores_case_and_punctuation(self):
+        copy = Flashcard("what is the CAPITAL city of france", "Paris is the capital!")
+        self.assertEqual(self.deck.find_duplicates(copy), [self.original])
+
+    def test_near_duplicate(self):
+        near = Flashcard("What is the capital city of France?", "Paris is the capital city")
+        self.assertIn(self.original, self.deck.find_duplicates(near))
+        self.assertEqual(self.deck.find_duplicates(Flashcard("Capital of Peru?", "Lima")), [])
+
+    def test_card_is_not_its_own_duplicate(self):
+        self.assertEqual(self.deck.find_duplicates(self.original), [])
+
+    def test_index_follows_add_and_remove(self):
+        copy = Flashcard(self.other.front, self.other.back)
+        self.deck.find_duplicates(copy)
+        self.deck.remove_card(self.other.id)
+        self.assertEqual(self.deck.find_duplicates(copy), [])
+        self.deck.insert_card_sorted(copy)
+        self.assertEqual(self.deck.find_duplicates(self.other), [copy])
+
+    def test_report_groups_duplicates(self):
+        copies = [Flashcard(self.original.front, self.original.back) for _ in range(2)]
+        for card in copies:
+            self.deck.add_card(card)
+        self.deck.add_card(Flashcard("Unrelated", "Card"))
+
+        report = self.deck.duplicate_report()
+        self.assertEqual([[c.id for c in group] for group in report],
+                         [[self.original.id] + [c.id for c in copies]])
+
+    def test_replacing_the_cards_rebuilds_the_indexes(self):
+        copy = Flashcard(self.original.front, self.original.back)
+        self.deck.add_card(copy)
+        self.assertEqual(len(self.deck.duplicate_report()), 1)
+        self.assertEqual(len(self.deck.search("capital")), 2)
+
+        self.deck.cards = [self.other, Flashcard(self.other.front, self.other.back)]
+        self.assertEqual([[c.id for c in group] for group in self.deck.duplicate_report()],
+                         [[c.id for c in self.deck.cards]])
+        self.assertEqual(self.deck.search("capital"), [])
+
+    def test_report_leaves_out_unknown_cards(self):
+        copies = [Flashcard(self.original.front, self.original.back) for _ in range(2)]
+        index = DuplicateIndex()
+        index.add_cards([self.original] + copies)
+        cards = {card.id: card for card in copies}
+
+        self.assertEqual(index.report(cards.get), [copies])
+        self.assertEqual(index.report({self.original.id: self.original}.get), [])
+
+    def test_import_can_skip_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cards.tsv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{self.other.front}\t{self.other.back}\nNew\tCard\nnew\tcard\n")
+            self.assertEqual(self.deck.import_text(path, skip_duplicates=True), 1)
+
+        self.assertEqual(len(self.deck), 3)
+
+    def test_signatures_are_stable(self):
+        index = DuplicateIndex()
+        self.assertEqual(index.signature(self.original), index.signature(
+            Flashcard(self.original.front, self.original.back)))
+        self.assertEqual(len(index.signature(self.original)), DuplicateIndex.NUM_HASHES)
+
+class TestCollectionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CollectionStore(":memory:")
+        self.deck = Deck("Store Deck")
+        self.deck.score = 2
+        for i, score in enumerate([2, 0, 1, 0]):
+            card = Flashcard(f"Front {i}", f"Back {i}", created_at=i)
+            card.last_score = score
+            self.deck.add_card(card)
+        self.stored = self.store.import_deck(self.deck)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_import_keeps_sorted_order(self):
+        self.assertEqual(len(self.stored), 4)
+        self.assertEqual(self.stored.score, 2)
+        self.assertEqual([c.id for c in self.stored.cards], [c.id for c in self.deck.cards])
+        self.assertEqual(self.stored.cards[-1].id, self.deck.cards[-1].id)
+
+    def test_decks_are_listed_without_cards(self):
+        decks = self.store.list_decks()
+        self.assertEqual([(d.name, len(d)) for d in decks], [("Store Deck", 4)])
+
+    def test_get_rate_and_remove(self):
+        card = self.stored.get_card(self.deck.cards[0].id)
+        self.stored.rate_card(card, 2, now=1000)
+        self.assertEqual(self.stored.cards[-1].id, card.id)
+        self.assertEqual(self.stored.get_card(card.id).due, card.due)
+        self.assertNotIn(card.id, [c.id for c in self.stored.due_cards(now=1000)])
+
+        self.assertTrue(self.stored.remove_card(card.id))
+        self.assertFalse(self.stored.remove_card(card.id))
+        self.assertIsNone(self.stored.get_card(card.id))
+        self.assertEqual(len(self.stored), 3)
+
+    def test_insert_card_sorted_goes_first_in_its_score(self):
+        card = Flashcard("New", "Card")
+        self.stored.insert_card_sorted(card)
+        self.assertEqual(self.stored.cards[0].id, card.id)
+
+    def test_import_text(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cards.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("a,b\nc,d\n")
+            self.assertEqual(self.stored.import_text(path), 2)
+
+        self.assertEqual(len(self.stored), 6)
+        self.assertEqual([c.front for c in self.stored.cards[2:4]], ["a", "c"])
+
+    def test_changes_persist_after_commit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "collection.db")
+            store = CollectionStore(path)
+            stored = store.import_deck(self.deck)
+            stored.rate_card(stored.cards[0], 1, now=1000)
+            stored.save_changes()
+            order = [c.id for c in stored.cards]
+            store.close()
+
+            store = CollectionStore(path)
+            reopened = store.list_decks()[0]
+            self.assertEqual(reopened.score, 3)
+            self.assertEqual([c.id for c in reopened.cards], order)
+            store.close()
+
+class TestCompactDeck(unittest.TestCase):
+
+    def setUp(self):
+        self.deck = Deck("Deck")
+        self.compact = CompactDeck("Deck")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}", created_at=i) for i in range(5)]
+        self.cards.append(Flashcard("Odd", "Id", card_id="odd-id", created_at=5))
+        for card, score in zip(self.cards, [2, 0, 1, 0, 2, 1]):
+            card.last_score = score
+            self.deck.add_card(card)
+            self.compact.add_card(card)
+
+    def ids(self, cards):
+        return [card.id for card in cards]
+
+    def test_rating_the_added_flashcard(self):
+        card = Flashcard("Added", "Card", created_at=0)
+        self.compact.add_card(card)
+        self.compact.rate_card(card, 2, now=1000)
+
+        view = self.compact.get_card(card.id)
+        self.assertEqual((view.last_score, view.history.to_list()), (2, [[1000.0, 2]]))
+        self.assertEqual((view.due, view.interval), (card.due, card.interval))
+        self.assertGreater(view.due, 1000)
+        self.assertNotIn(card.id, self.ids(self.compact.due_cards(now=1000)))
+        self.assertEqual(self.compact.cards[-1].id, card.id)
+
+    def test_same_order_as_deck(self):
+        new_card = Flashcard("New", "Card")
+        self.deck.insert_card_sorted(new_card)
+        self.compact.insert_card_sorted(new_card)
+        self.deck.rate_card(self.cards[1], 2, now=1000)
+        self.compact.rate_card(self.compact.get_card(self.cards[1].id), 2, now=1000)
+
+        self.assertEqual(self.ids(self.compact.cards), self.ids(self.deck.cards))
+        self.assertEqual(self.ids(self.compact.due_cards(now=1000)),
+                         self.ids(self.deck.due_cards(now=1000)))
+        self.assertEqual(self.compact.score, self.deck.score)
+
+    def test_views_read_and_write_columns(self):
+        card = self.compact.get_card(self.cards[2].id)
+        self.assertEqual((card.id, card.front, card.back), (self.cards[2].id, "Front 2", "Back 2"))
+        self.assertEqual(self.compact.get_card("odd-id").front, "Odd")
+
+        card.last_score = 0
+        self.assertEqual(self.compact.cards[1], card)
+        self.assertEqual(self.ids(self.compact.cards[:3]), self.ids(self.cards[1:4]))
+
+    def test_remove_keeps_other_cards(self):
+        self.assertTrue(self.compact.remove_card(self.cards[0].id))
+        self.assertFalse(self.compact.remove_card(self.cards[0].id))
+        self.assertTrue(self.compact.remove_card("odd-id"))
+        self.deck.remove_card(self.cards[0].id)
+        self.deck.remove_card("odd-id")
+
+        self.assertEqual(len(self.compact), 4)
+        self.assertIsNone(self.compact.get_card(self.cards[0].id))
+        self.assertEqual(self.ids(self.compact.cards), self.ids(self.deck.cards))
+        self.assertEqual([c.front for c in self.compact.cards], [c.front for c in self.deck.cards])
+
+    def test_index_of_matches_deck(self):
+        self.compact.remove_card(self.cards[1].id)
+        self.deck.remove_card(self.cards[1].id)
+        for card in self.deck.cards:
+            self.assertEqual(self.compact.index_of(card.id), self.deck.index_of(card.id))
+        self.assertIsNone(self.compact.index_of(self.cards[1].id))
+
+    def test_files_are_shared_with_deck(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.jsonl")
+            self.deck.save_to_file(path)
+            self.deck.rate_card(self.cards[3], 1, now=1000)
+            self.deck.save_changes()
+
+            loaded = CompactDeck.load_from_file(path)
+            self.assertEqual(self.ids(loaded.cards), self.ids(self.deck.cards))
+            self.assertEqual(loaded.get_card(self.cards[3].id).due, self.cards[3].due)
+
+            loaded.save_to_file(path)
+            self.assertEqual(self.ids(Deck.load_from_file(path).cards), self.ids(self.deck.cards))
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+        self.add_card = Deck.__dict__["add_card"]
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled_by_default(self):
+        self.assertFalse(instrumentation.is_enabled())
+        Deck("Quiet").add_card(Flashcard("F", "B"))
+        self.assertEqual(instrumentation.stats(), {"timers": {}, "counters": {}})
+
+    def test_times_hot_paths(self):
+        instrumentation.enable()
+        deck = Deck("Timed")
+        card = Flashcard("F", "B")
+        deck.add_card(card)
+        deck.rate_card(card, 2)
+        deck.cards
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.jsonl")
+            deck.save_to_file(path)
+            Deck.load_from_file(path)
+
+        timers = instrumentation.stats()["timers"]
+        self.assertEqual(timers["Deck.add_card"]["calls"], 2)
+        for label in ("Deck.rate_card", "Deck.cards", "Deck.save_to_file", "Deck.load_from_file"):
+            self.assertIn(label, timers)
+        self.assertIn("Deck.rate_card", instrumentation.report())
+
+    def test_disable_restores_methods(self):
+        instrumentation.enable()
+        self.assertIsNot(Deck.__dict__["add_card"], self.add_card)
+        instrumentation.disable()
+        self.assertIs(Deck.__dict__["add_card"], self.add_card)
+        self.assertIsInstance(Deck.__dict__["load_from_file"], classmethod)
+
+    def test_profile_session_writes_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.prof")
+            with instrumentation.profile_session(path, memory=True):
+                Deck("Profiled").add_cards(Flashcard("F", "B") for _ in range(10))
+            self.assertGreater(os.path.getsize(path), 0)
+            self.assertTrue(os.path.exists(path + ".memory.txt"))
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        import benchmark_suite
+        with mock.patch("builtins.print"):
+            report = benchmark_suite.run([20], ["Deck", "CompactDeck"])
+
+        self.assertEqual(set(report["results"]["Deck"]["20"]), set(benchmark_suite.OPERATIONS))
+        self.assertNotIn("quicksort", report["results"]["CompactDeck"]["20"])
+        self.assertEqual(benchmark_suite.make_cards(5)[3].id, benchmark_suite.make_cards(5)[3].id)
+
+        baseline = json.loads(json.dumps(report))
+        self.assertEqual(benchmark_suite.compare(report, baseline, 0.25), [])
+        result = report["results"]["Deck"]["20"]["load_from_file"]
+        result["seconds"] = baseline["results"]["Deck"]["20"]["load_from_file"]["seconds"] * 2 + 1
+        self.assertEqual(len(benchmark_suite.compare(report, baseline, 0.25)), 1)
+
+    def test_operations_get_fresh_cards(self):
+        import benchmark_suite
+        save_to_file = benchmark_suite.op_save_to_file
+
+        def unrated_save(deck_class, cards, tmp):
+            self.assertTrue(all(card.history is None and card.due == 0 for card in cards))
+            return save_to_file(deck_class, cards, tmp)
+        with mock.patch("builtins.print"), \
+                mock.patch.dict(benchmark_suite.OPERATIONS, save_to_file=unrated_save):
+            benchmark_suite.run([20], ["Deck"], ["rate_card", "by_recall", "save_to_file"])
+
+class TestFitScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_user(self, name, cards, reviews, initial=(60, 3600, 8 * 3600), growth=(0.0, 1.1, 1.5)):
+        '''
+        Writes decks for a user who forgets faster than the default intervals
+        expect, reviewing each card {reviews} times
+        '''
+
+        import random
+        rng = random.Random(0)
+        directory = os.path.join(self.tmp.name, name)
+        os.mkdir(directory)
+        deck = Deck(name)
+        for i in range(cards):
+            card = Flashcard(f"Front {i}", f"Back {i}", created_at=0)
+            deck.add_card(card)
+            at, interval, rating = 0.0, 0.0, 2
+            for _ in range(reviews):
+                deck.rate_card(card, rating, now=at)
+                interval = max(initial[rating], interval * growth[rating])
+                elapsed = interval * rng.uniform(0.2, 4)
+                at += elapsed
+                rating = 2 if rng.random() < 0.9 ** (elapsed / interval) else 0
+        deck.save_to_file(os.path.join(directory, "deck.jsonl"))
+        return directory, deck
+
+    def test_reads_histories_and_journal(self):
+        import fit_scheduler
+        directory, deck = self.write_user("user", 5, 3)
+        filename = os.path.join(directory, "deck.jsonl")
+        for card in deck.cards:
+            deck.rate_card(card, 1, now=10 ** 9)
+        deck.save_changes()
+
+        log = fit_scheduler.read_reviews(filename)
+        self.assertEqual(list(log.lengths), [4] * 5)
+        self.assertEqual(len(log), 15)
+        self.assertEqual(log.ratings[3], 1)
+        self.assertIsNone(fit_scheduler.read_reviews(os.path.join(directory, "missing.jsonl")))
+
+        store = CollectionStore(os.path.join(directory, "collection.db"))
+        store.create_deck("Collection").add_cards(deck.cards)
+        store.close()
+        self.assertEqual(len(fit_scheduler.read_reviews(os.path.join(directory, "collection.db"))), 15)
+
+    def test_fit_lowers_loss_and_is_used_by_scheduler(self):
+        import fit_scheduler
+        directory, _ = self.write_user("fast", 150, 6)
+        sparse, _ = self.write_user("sparse", 3, 2)
+        with mock.patch("builtins.print"):
+            fit_scheduler.main([directory, sparse, "--workers", "1"])
+
+        self.assertFalse(os.path.exists(os.path.join(sparse, backend.SCHEDULER_FILE)))
+        with open(os.path.join(directory, backend.SCHEDULER_FILE), encoding="utf-8") as f:
+            result = json.load(f)
+        self.assertEqual(result["reviews"], 750)
+        self.assertLess(result["log_loss"], result["default_log_loss"])
+        self.assertLess(result["initial_intervals"]["2"], 3 * 24 * 60 * 60)
+
+        # Each deck is scheduled with the parameters of its own directory
+        fitted = result["initial_intervals"]["2"]
+        store = CollectionStore(os.path.join(directory, "collection.db"))
+        store.create_deck("Collection").add_card(Flashcard("Front", "Back", created_at=0))
+        for deck in (Deck.load_from_file(os.path.join(directory, "deck.jsonl")),
+                     CompactDeck.load_from_file(os.path.join(directory, "deck.jsonl")),
+                     LazyDeck.load_from_file(os.path.join(directory, "deck.jsonl")),
+                     store.list_decks()[0]):
+            card = deck.cards[0]
+            deck.rate_card(card, 0, now=0)
+            deck.rate_card(card, 2, now=0)
+            self.assertEqual(card.interval, fitted, type(deck).__name__)
+        store.close()
+
+        deck = Deck.load_from_file(os.path.join(sparse, "deck.jsonl"))
+        card = deck.cards[0]
+        deck.rate_card(card, 0, now=0)
+        deck.rate_card(card, 2, now=0)
+        self.assertEqual(card.interval, Scheduler.INITIAL_INTERVALS[2])
+        self.assertIsNone(Scheduler.load_parameters(os.path.join(sparse, backend.SCHEDULER_FILE)))
+
+    def test_python_loss_matches_numpy(self):
+        import fit_scheduler
+        directory, _ = self.write_user("user", 20, 5)
+        log = fit_scheduler.read_reviews(os.path.join(directory, "deck.jsonl"))
+        parameters = fit_scheduler.default_parameters()
+        with mock.patch.object(backend, "np", None):
+            python_loss = log.loss(parameters)
+        self.assertGreater(python_loss, 0)
+        if backend.np is not None:
+            self.assertAlmostEqual(log.loss(parameters), python_loss)
+
+class TestStudyServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.deck = Deck("Server Deck")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}", created_at=i) for i in range(5)]
+        self.deck.add_cards(self.cards)
+        self.deck.save_to_file(os.path.join(self.tmp.name, "server deck.jsonl"))
+        with open(os.path.join(self.tmp.name, "notes.json"), "w", encoding="utf-8") as f:
+            f.write("not a deck")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_server(self, test):
+        import study_server
+
+        async def run():
+            service = study_server.DeckService(self.tmp.name, workers=2, save_delay=0.01)
+            with mock.patch("sys.stderr"):
+                await service.open()
+            server = study_server.StudyServer(service)
+            host, port = await server.start("127.0.0.1", 0)
+            client = study_server.StudyClient(host, port)
+            try:
+                await test(service, client)
+            finally:
+                await client.close()
+                await server.stop()
+                await service.close()
+        asyncio.run(run())
+
+    def test_study_over_http(self):
+        async def test(service, client):
+            status, decks = await client.request("GET", "/decks")
+            self.assertEqual(decks, [{"deck": "server deck", "name": "Server Deck", "score": 0, "card_count": 5}])
+            self.assertFalse(service.decks["server deck"].loaded)
+
+            path = client.path("decks", "server deck")
+            status, card = await client.request("GET", path + "/next?now=100")
+            self.assertEqual((status, card["id"]), (200, self.cards[0].id))
+            status, rated = await client.request("POST", f"{path}/cards/{card['id']}/rate", {"rating": 2, "now": 100})
+            self.assertEqual((status, rated["history"]), (200, [[100.0, 2]]))
+            status, card = await client.request("GET", path + "/next?now=100")
+            self.assertEqual(card["id"], self.cards[1].id)
+
+            status, added = await client.request("POST", path + "/cards", {"front": "New", "back": "Card"})
+            self.assertEqual((status, added["front"]), (201, "New"))
+            status, _ = await client.request("DELETE", f"{path}/cards/{self.cards[4].id}")
+            self.assertEqual(status, 204)
+            await asyncio.sleep(0.2)
+
+            saved = Deck.load_from_file(os.path.join(self.tmp.name, "server deck.jsonl"))
+            self.assertEqual(saved.score, 2)
+            self.assertIsNotNone(saved.get_card(added["id"]))
+            self.assertIsNone(saved.get_card(self.cards[4].id))
+
+        self.run_server(test)
+
+    def test_errors(self):
+        async def test(service, client):
+            path = client.path("decks", "server deck")
+            card_id = self.cards[0].id
+            self.assertEqual((await client.request("GET", "/decks/missing/next"))[0], 404)
+            self.assertEqual((await client.request("POST", f"{path}/cards/{card_id}/rate", {"rating": 3}))[0], 400)
+            self.assertEqual((await client.request("POST", f"{path}/cards/{card_id}/rate", {"rating": True}))[0], 400)
+            self.assertEqual((await client.request("POST", f"{path}/cards/missing/rate", {"rating": 1}))[0], 404)
+            self.assertEqual((await client.request("POST", path + "/cards", {"front": " "}))[0], 400)
+            self.assertEqual((await client.request("GET", path + "/cards"))[0], 405)
+            self.assertEqual((await client.request("GET", path + "/next?now=never"))[0], 400)
+            self.assertEqual((await client.request("GET", path + "/next?now=-1"))[0], 204)
+            self.assertFalse(service.decks["server deck"].dirty)
+
+        self.run_server(test)
+
+    def test_concurrent_ratings_of_one_deck(self):
+        import study_server
+
+        async def test(service, client):
+            path = client.path("decks", "server deck")
+            clients = [study_server.StudyClient(client.host, client.port) for _ in range(10)]
+            results = await asyncio.gather(*(c.request("POST", f"{path}/cards/{self.cards[i % 5].id}/rate",
+                                                       {"rating": 1, "now": i})
+                                             for i, c in enumerate(clients)))
+            for c in clients:
+                await c.close()
+            self.assertTrue(all(status == 200 for status, _ in results))
+            self.assertEqual(service.decks["server deck"].score, 10)
+
+        self.run_server(test)
+
+    def test_deck_work_runs_off_the_event_loop(self):
+        threads = []
+        by_recall, rate_card = Deck.by_recall, Deck.rate_card
+
+        def record(method):
+            def recorded(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return method(*args, **kwargs)
+            return recorded
+
+        async def test(service, client):
+            path = client.path("decks", "server deck")
+            status, card = await client.request("GET", path + "/next?order=recall&now=100")
+            self.assertEqual(status, 200)
+            status, _ = await client.request("POST", f"{path}/cards/{card['id']}/rate", {"rating": 2, "now": 100})
+            self.assertEqual(status, 200)
+
+        with mock.patch.object(Deck, "by_recall", record(by_recall)), \
+                mock.patch.object(Deck, "rate_card", record(rate_card)):
+            self.run_server(test)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+class TestConcurrentDeck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.deck = Deck("Concurrent")
+        self.cards = [Flashcard(f"Front {i}", f"Back {i}", created_at=i) for i in range(5)]
+        self.deck.add_cards(self.cards)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_snapshot_does_not_change(self):
+        snapshot = self.deck.snapshot()
+        self.deck.remove_card(self.cards[0].id)
+        self.deck.add_card(Flashcard("New", "Card"))
+        self.deck.rate_card(self.cards[1], 2, now=0)
+
+        self.assertEqual(snapshot.score, 0)
+        self.assertEqual([card.id for card in snapshot.cards], [card.id for card in self.cards])
+        self.assertEqual(self.deck.snapshot().score, 2)
+        self.assertEqual(len(self.deck.snapshot().cards), 5)
+
+    def test_rating_during_save_is_not_counted_twice(self):
+        path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck.save_to_file(path)
+        card_to_dict = Deck._card_to_dict
+
+        # Another thread rates a card after the snapshot was taken but before it is written
+        def rate_then_write(card):
+            if card is self.cards[0] and card.history is None:
+                self.deck.rate_card(card, 2, now=50)
+            return card_to_dict(card)
+        with mock.patch.object(Deck, "_card_to_dict", side_effect=rate_then_write):
+            self.deck.save_to_file(path)
+        self.deck.save_changes()
+
+        loaded = Deck.load_from_file(path)
+        self.assertEqual(loaded.score, 2)
+        self.assertEqual(loaded.get_card(self.cards[0].id).history.to_list(), [[50.0, 2]])
+        self.assertEqual(loaded.get_card(self.cards[0].id).due, self.cards[0].due)
+
+    def test_rating_replaces_the_history(self):
+        self.deck.rate_card(self.cards[0], 1, now=10)
+        saved = self.cards[0].history
+        self.deck.rate_card(self.cards[0], 2, now=20)
+
+        # A save still writing the old history is not changed under it
+        self.assertEqual(saved.to_list(), [[10.0, 1]])
+        self.assertEqual(self.cards[0].history.to_list(), [[10.0, 1], [20.0, 2]])
+
+    def test_many_threads(self):
+        import benchmark_concurrency
+        deck = benchmark_concurrency.make_deck(500)
+        result = benchmark_concurrency.stress(deck, 0.3, writers=4, readers=2, tmp=self.tmp.name)
+
+        self.assertEqual(result["errors"], [])
+        self.assertGreater(result["writes"], 0)
+        self.assertGreater(result["reads"], 0)
+        self.assertGreater(result["searches"], 0)
+        benchmark_concurrency.check_deck(deck)
+        self.assertEqual(deck.score, result["score"])
+
+    def test_search_holds_off_writers(self):
+        get_card = self.deck.get_card
+        writers = []
+
+        # A writer adds a matching card while the search walks the postings
+        def add_while_searching(card_id):
+            if not writers:
+                writer = threading.Thread(target=self.deck.add_card, args=(Flashcard("Front new", "Back"),))
+                writer.start()
+                writer.join(0.1)
+                writers.append(writer)
+            return get_card(card_id)
+        with mock.patch.object(self.deck, "get_card", side_effect=add_while_searching):
+            results = self.deck.search("front")
+        writers[0].join()
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.deck.search("front")), 6)
+
+    def test_search_index_is_written_without_the_lock(self):
+        path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.deck.search("front")
+        save_postings = SearchIndex.save_postings
+        blocked = []
+
+        def add_while_saving(*args):
+            writer = threading.Thread(target=self.deck.add_card, args=(Flashcard("New", "Card"),))
+            writer.start()
+            writer.join(5)
+            blocked.append(writer.is_alive())
+            save_postings(*args)
+        with mock.patch.object(SearchIndex, "save_postings", side_effect=add_while_saving):
+            self.deck.save_to_file(path)
+
+        self.assertEqual(blocked, [False])
+        self.assertEqual(len(SearchIndex.load(path)._postings["front"]), 5)
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+class TestDeckTable(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import tkinter
+            import frontend
+            with mock.patch.object(tkinter.Tk, "mainloop"):
+                self.app = frontend.FlashcardApp()
+        except Exception as e:
+            self.skipTest(f"Tk is not available: {e}")
+
+    def tearDown(self):
+        self.app.main_window.destroy()
+
+    def add_decks(self, count):
+        for i in range(count):
+            deck = Deck(f"Deck {i}")
+            self.app.decks.append(deck)
+            self.app._add_deck_to_table(deck)
+
+    def cost_of_one_more_deck(self):
+        before = count_widgets(self.app.main_window)
+        start = time.perf_counter()
+        self.add_decks(1)
+        self.app.refresh_deck_row(self.app.decks[0])
+        self.app.main_window.update_idletasks()
+        return count_widgets(self.app.main_window) - before, time.perf_counter() - start
+
+    def test_cost_does_not_grow_with_decks(self):
+        self.add_decks(5)
+        small_widgets, small_time = self.cost_of_one_more_deck()
+        self.add_decks(500)
+        large_widgets, large_time = self.cost_of_one_more_deck()
+
+        self.assertEqual(small_widgets, large_widgets)
+        self.assertLess(large_time, max(0.05, small_time * 20))
+
+    def test_rows_are_updated_in_place(self):
+        self.add_decks(3)
+        deck = self.app.decks[1]
+        row = self.app.deck_rows[deck]
+        deck.name = "Renamed"
+        deck.add_card(Flashcard("Front", "Back"))
+        self.app.refresh_deck_row(deck)
+        self.app.refresh_deck_row(deck)
+        self.app.main_window.update_idletasks()
+
+        self.assertIs(self.app.deck_rows[deck], row)
+        self.assertEqual(row["name"].cget("text"), "Renamed")
+        self.assertEqual(str(row["cards"].cget("text")), "1")
+
+        self.app.decks.remove(deck)
+        self.app._remove_deck_from_table(deck)
+        self.assertNotIn(deck, self.app.deck_rows)
+        self.assertFalse(row["name"].winfo_exists())
+
 if __name__ == "__main__":
     unittest.main()